@@ -0,0 +1,198 @@
+import random
+import time
+from typing import Callable, Dict, List, Tuple, Type
+
+import pyautogui
+import pyperclip
+from pydantic import BaseModel
+
+from .xtest import char_keysym, get_input
+
+from .models import (
+    ActionResultModel,
+    BatchActionModel,
+    ClickModel,
+    DragMouseModel,
+    MoveMouseModel,
+    PressKeyModel,
+    PressKeysModel,
+    ScrollModel,
+    TypeTextModel,
+)
+
+
+def move_mouse(request: MoveMouseModel) -> None:
+    # pyautogui is only used for its tweening functions
+    tween_func = getattr(pyautogui, request.tween, pyautogui.linear)
+    get_input().move_to(request.x, request.y, duration=request.duration, tween=tween_func)
+
+
+def click(request: ClickModel) -> None:
+    if request.location:
+        move_mouse(request.location)
+    get_input().click(button=request.button)
+
+
+def double_click(request: ClickModel) -> None:
+    if request.location:
+        move_mouse(request.location)
+    get_input().click(button=request.button, clicks=2)
+
+
+# how text can be entered:
+#   human: one key at a time with random pauses, like a person typing
+#   fast: key events injected through XTest with no pauses
+#   paste: put on the clipboard and pasted with ctrl+v, for any text
+TYPE_MODES = ("human", "fast", "paste")
+# time the focused application gets to read the clipboard before it is restored
+PASTE_SETTLE_SECONDS = 0.2
+
+
+def check_text(text: str, mode: str) -> None:
+    """Raises ValueError if the mode is unknown or the text cannot be typed in that mode."""
+    if mode not in TYPE_MODES:
+        raise ValueError(f"Unknown mode '{mode}', must be one of: {', '.join(TYPE_MODES)}")
+
+    if mode != "paste":
+        try:
+            for char in text:
+                char_keysym(char)
+        except ValueError:
+            # the characters are not named in the error, the text may be a secret
+            raise ValueError(
+                "Text contains characters that cannot be typed, use paste mode"
+            )
+
+
+def write_text(
+    text: str,
+    mode: str = "human",
+    min_interval: float = 0.05,
+    max_interval: float = 0.25,
+) -> None:
+    """
+    Enters text into the focused window using one of TYPE_MODES. Raises ValueError,
+    before anything is typed, if the mode is unknown or the text cannot be typed in
+    that mode.
+    """
+    check_text(text, mode)
+
+    if mode == "human":
+        for char in text:
+            get_input().write(char, interval=random.uniform(min_interval, max_interval))
+            time.sleep(random.uniform(min_interval, max_interval))
+
+    elif mode == "fast":
+        get_input().write(text)
+
+    else:
+        try:
+            previous = pyperclip.paste()
+        except pyperclip.PyperclipException:
+            previous = None
+        pyperclip.copy(text)
+        get_input().hotkey("ctrl", "v")
+        time.sleep(PASTE_SETTLE_SECONDS)
+        if previous is not None:
+            pyperclip.copy(previous)
+
+
+def type_text(request: TypeTextModel) -> None:
+    write_text(request.text, request.mode, request.min_interval, request.max_interval)
+
+
+def press_key(request: PressKeyModel) -> None:
+    get_input().press(request.key)
+
+
+def hot_key(request: PressKeysModel) -> None:
+    get_input().hotkey(*request.keys)
+
+
+def scroll(request: ScrollModel) -> None:
+    # clicks > 0: scrolls UP
+    # clicks < 0: scrolls DOWN
+    get_input().scroll(request.clicks)
+
+
+def drag_mouse(request: DragMouseModel) -> None:
+    get_input().drag_to(request.x, request.y)
+
+
+# action name -> (parameters model, function), the names match the action endpoints
+ACTIONS: Dict[str, Tuple[Type[BaseModel], Callable]] = {
+    "move_mouse": (MoveMouseModel, move_mouse),
+    "click": (ClickModel, click),
+    "double_click": (ClickModel, double_click),
+    "type_text": (TypeTextModel, type_text),
+    "press_key": (PressKeyModel, press_key),
+    "hot_key": (PressKeysModel, hot_key),
+    "scroll": (ScrollModel, scroll),
+    "drag_mouse": (DragMouseModel, drag_mouse),
+}
+
+
+def _check_parameters(name: str, parameters: BaseModel) -> None:
+    """Checks what an action would only find out while running, raises ValueError."""
+    location = getattr(parameters, "location", None)
+    if getattr(parameters, "observe", None) is not None or (
+        location is not None and location.observe is not None
+    ):
+        raise ValueError("observe is not supported in a batch, use the batch screenshot")
+    if name == "type_text":
+        check_text(parameters.text, parameters.mode)  # type: ignore
+
+
+def parse_actions(actions: List[BatchActionModel]) -> List[Tuple[str, BaseModel]]:
+    """
+    Validates a batch up front and returns the (name, parameters) of each action, so
+    that a typo in the last action does not leave the first ones half applied.
+    Raises ValueError naming the first invalid action.
+    """
+    parsed = []
+    for i, action in enumerate(actions):
+        if action.name not in ACTIONS:
+            raise ValueError(
+                f"actions[{i}]: unknown action '{action.name}', must be one of: {', '.join(ACTIONS)}"
+            )
+        model, _ = ACTIONS[action.name]
+        try:
+            parameters = model.model_validate(action.parameters)
+            _check_parameters(action.name, parameters)
+        except Exception as e:
+            raise ValueError(f"actions[{i}] ({action.name}): {e}")
+        parsed.append((action.name, parameters))
+    return parsed
+
+
+def run_actions(
+    actions: List[Tuple[str, BaseModel]], delays: List[float]
+) -> List[ActionResultModel]:
+    """
+    Runs parsed actions in order, waiting ``delays[i]`` seconds after action i, and
+    stops at the first one that fails. Returns a result for every action that ran.
+    """
+    results = []
+    for i, (name, parameters) in enumerate(actions):
+        _, function = ACTIONS[name]
+        started = time.time()
+        started_perf = time.perf_counter()
+        try:
+            function(parameters)
+            error = None
+        except Exception as e:
+            error = str(e)
+        results.append(
+            ActionResultModel(
+                name=name,
+                status="error" if error else "success",
+                message=error,
+                started=started,
+                duration_ms=(time.perf_counter() - started_perf) * 1000,
+            )
+        )
+        if error:
+            break
+        if i < len(actions) - 1 and delays[i] > 0:
+            time.sleep(delays[i])
+    return results
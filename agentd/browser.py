@@ -0,0 +1,351 @@
+import atexit
+import logging
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import List, Optional, Set
+
+import psutil
+
+from .chromium import (
+    CHROMIUM_DEBUG_PORT,
+    gracefully_terminate_chromium,
+    is_chromium_running,
+    open_chromium_tab,
+)
+from .firefox import (
+    gracefully_terminate_firefox,
+    is_firefox_running,
+    maximize_firefox_window,
+    open_firefox_tab,
+)
+from .windows import (
+    activate_window,
+    find_windows,
+    get_active_window,
+    iconify_window,
+    maximize_window,
+    wait_for_window,
+)
+
+api_logger = logging.getLogger("api")
+
+# browser started by open_url when none is running, "firefox" or "chromium"
+DEFAULT_BROWSER = os.getenv("DEFAULT_BROWSER", "firefox")
+# seconds a cold-started browser gets to show its window
+BROWSER_START_TIMEOUT = float(os.getenv("BROWSER_START_TIMEOUT", "30"))
+# seconds a browser being restarted gets to exit after SIGTERM
+BROWSER_EXIT_TIMEOUT = 10.0
+# "firefox" or "chromium" to keep a started browser ready for open_url, off if empty
+BROWSER_POOL = os.getenv("BROWSER_POOL", "")
+# where the pooled browsers keep their profiles
+BROWSER_POOL_DIR = os.getenv(
+    "BROWSER_POOL_DIR", os.path.join(tempfile.gettempdir(), "agentd-browsers")
+)
+
+# written to the user.js of pooled Firefox profiles, so a new profile starts without
+# first-run pages and prompts
+FIREFOX_POOL_PREFS = {
+    "browser.shell.checkDefaultBrowser": False,
+    "browser.startup.homepage_override.mstone": "ignore",
+    "browser.aboutwelcome.enabled": False,
+    "startup.homepage_welcome_url": "",
+    "startup.homepage_welcome_url.additional": "",
+    "datareporting.policy.dataSubmissionPolicyBypassNotification": True,
+}
+
+BROWSERS = ("firefox", "chromium")
+
+
+def browser_command(browser: str, url: str) -> List[str]:
+    if browser == "firefox":
+        return ["firefox", url]
+    if browser == "chromium":
+        # DevTools lets later calls open tabs in this instance
+        return [
+            "chromium",
+            f"--remote-debugging-port={CHROMIUM_DEBUG_PORT}",
+            "--start-maximized",
+            url,
+        ]
+    raise ValueError(f"Unknown browser '{browser}', must be one of: {', '.join(BROWSERS)}")
+
+
+def _wait_for_exit(pids: List[int], timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while pids and time.monotonic() < deadline:
+        pids = [pid for pid in pids if os.path.exists(f"/proc/{pid}")]
+        if pids:
+            time.sleep(0.1)
+
+
+def start_browser(browser: str, url: str, display: Optional[str] = None) -> int:
+    """
+    Starts a browser on a URL and waits for its window. Returns the window id, raises
+    TimeoutError if no window showed up within BROWSER_START_TIMEOUT seconds.
+    """
+    api_logger.info(f"starting {browser}...")
+    subprocess.Popen(browser_command(browser, url), stdout=sys.stdout, stderr=sys.stderr)
+    window_id = wait_for_window(browser, BROWSER_START_TIMEOUT, display)
+    if window_id is None:
+        raise TimeoutError(f"{browser} window did not open within {BROWSER_START_TIMEOUT}s")
+    if browser == "firefox":
+        maximize_firefox_window(display)
+    return window_id
+
+
+class PooledBrowser:
+    """A browser the pool started on a profile of its own."""
+
+    def __init__(
+        self, browser: str, profile: str, port: Optional[int], process: subprocess.Popen
+    ) -> None:
+        self.browser = browser
+        self.profile = profile
+        self.port = port
+        self.process = process
+        self.window_id: Optional[int] = None
+
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def pids(self) -> Set[int]:
+        """The browser process and everything it started."""
+        try:
+            children = psutil.Process(self.process.pid).children(recursive=True)
+        except psutil.NoSuchProcess:
+            return set()
+        return {self.process.pid, *(child.pid for child in children)}
+
+    def open_tab(self, url: str, display: Optional[str] = None) -> bool:
+        if self.browser == "firefox":
+            return open_firefox_tab(
+                url, profile=self.profile, display=display, window_id=self.window_id
+            )
+        return open_chromium_tab(url, self.port)  # type: ignore
+
+    def close(self) -> None:
+        if self.alive():
+            self.process.terminate()
+            try:
+                self.process.wait(BROWSER_EXIT_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        shutil.rmtree(self.profile, ignore_errors=True)
+
+
+class BrowserPool:
+    """
+    Keeps a browser started, with its profile created and its window iconified, so
+    open_url can hand it over instead of starting a browser cold. After a handover a
+    replacement warms up in the background.
+
+    The browser handed over becomes the active one, later URLs open in it as tabs.
+    Pooled browsers run on profiles of their own under ``directory`` and Chromium on a
+    DevTools port of its own, so they can be told apart from any other browser.
+    """
+
+    def __init__(
+        self,
+        browser: str,
+        display: Optional[str] = None,
+        directory: str = BROWSER_POOL_DIR,
+    ) -> None:
+        if browser not in BROWSERS:
+            raise ValueError(
+                f"Unknown browser '{browser}', must be one of: {', '.join(BROWSERS)}"
+            )
+        self.browser = browser
+        self.display = display
+        self.directory = directory
+        self.active: Optional[PooledBrowser] = None
+        self._spare: Optional[PooledBrowser] = None
+        self._starting: Optional[PooledBrowser] = None
+        self._warming: Optional[threading.Thread] = None
+        self._next_port = CHROMIUM_DEBUG_PORT + 1
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """Starts warming a browser in the background."""
+        with self._lock:
+            if self._closed or (self._warming is not None and self._warming.is_alive()):
+                return
+            self._warming = threading.Thread(
+                target=self._warm, name="browser-pool", daemon=True
+            )
+            self._warming.start()
+
+    def open_tab(self, url: str) -> bool:
+        """Opens a URL in the active browser. False if there is none or it is unreachable."""
+        active = self.active
+        if active is None or not active.alive():
+            return False
+        return active.open_tab(url, self.display)
+
+    def take(self, url: str) -> bool:
+        """
+        Hands the warm browser over: opens the URL in it and shows its window. Returns
+        False if no browser is ready yet.
+        """
+        with self._lock:
+            spare, self._spare = self._spare, None
+        if spare is None:
+            self.start()
+            return False
+        try:
+            if not spare.alive() or not spare.open_tab(url, self.display):
+                raise RuntimeError("the browser did not take the URL")
+            activate_window(spare.window_id, self.display)  # type: ignore
+            maximize_window(spare.window_id, self.display)  # type: ignore
+        except Exception as e:
+            api_logger.warning(f"browser pool: handing over {self.browser} failed: {e}")
+            spare.close()
+            self.start()
+            return False
+
+        previous, self.active = self.active, spare
+        if previous is not None and not previous.alive():
+            previous.close()
+        self.start()
+        return True
+
+    def pids(self) -> Set[int]:
+        """The processes of the browsers not handed over yet."""
+        pids: Set[int] = set()
+        for pooled in (self._spare, self._starting):
+            if pooled is not None:
+                pids |= pooled.pids()
+        return pids
+
+    def close(self) -> None:
+        """Stops the browsers not handed over yet, the active one is left running."""
+        with self._lock:
+            self._closed = True
+            pooled = [self._spare, self._starting]
+            self._spare = self._starting = None
+        for browser in pooled:
+            if browser is not None:
+                browser.close()
+
+    def _launch(self) -> PooledBrowser:
+        os.makedirs(self.directory, exist_ok=True)
+        profile = tempfile.mkdtemp(prefix=f"{self.browser}-", dir=self.directory)
+        port = None
+        if self.browser == "firefox":
+            with open(os.path.join(profile, "user.js"), "w") as f:
+                for name, value in FIREFOX_POOL_PREFS.items():
+                    value = str(value).lower() if isinstance(value, bool) else f'"{value}"'
+                    f.write(f'user_pref("{name}", {value});\n')
+            command = ["firefox", "--profile", profile, "about:blank"]
+        else:
+            port = self._next_port
+            self._next_port += 1
+            command = [
+                "chromium",
+                f"--user-data-dir={profile}",
+                f"--remote-debugging-port={port}",
+                "--no-first-run",
+                "--no-default-browser-check",
+                "about:blank",
+            ]
+        process = subprocess.Popen(
+            command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        return PooledBrowser(self.browser, profile, port, process)
+
+    def _warm(self) -> None:
+        started = time.monotonic()
+        pooled = None
+        try:
+            focused = get_active_window(self.display)
+            existing = find_windows(self.browser, self.display)
+            pooled = self._launch()
+            self._starting = pooled
+            window_id = wait_for_window(
+                self.browser, BROWSER_START_TIMEOUT, self.display, exclude=existing
+            )
+            if window_id is None:
+                raise TimeoutError(f"no window within {BROWSER_START_TIMEOUT}s")
+            pooled.window_id = window_id
+            iconify_window(window_id, self.display)
+            # the new window took the focus, give it back to what the agent was using
+            if focused is not None:
+                try:
+                    activate_window(focused, self.display)
+                except LookupError:
+                    pass
+        except Exception as e:
+            api_logger.error(f"browser pool: warming {self.browser} failed: {e}")
+            self._starting = None
+            if pooled is not None:
+                pooled.close()
+            return
+
+        with self._lock:
+            self._starting = None
+            if not self._closed:
+                self._spare, pooled = pooled, None
+        if pooled is not None:
+            pooled.close()
+            return
+        api_logger.info(
+            f"browser pool: {self.browser} ready in {time.monotonic() - started:.1f}s"
+        )
+
+
+pool: Optional[BrowserPool] = None
+
+
+def start_pool(display: Optional[str] = None) -> Optional[BrowserPool]:
+    """Starts the browser pool if BROWSER_POOL names a browser."""
+    global pool
+    if BROWSER_POOL and pool is None:
+        pool = BrowserPool(BROWSER_POOL, display)
+        pool.start()
+        atexit.register(pool.close)
+    return pool
+
+
+def open_url(url: str, display: Optional[str] = None) -> str:
+    """
+    Opens a URL in the running browser if there is one, as a new tab, and only starts
+    a browser when none is running or the running one cannot be reached, handing over
+    the pool's warm browser if there is one. Returns how the URL was opened:
+    "firefox-tab", "chromium-tab", "pooled" or "started".
+    """
+    if pool is not None and pool.open_tab(url):
+        return f"{pool.browser}-tab"
+    # the pool's browsers waiting to be handed over do not count as running
+    pooled = pool.pids() if pool is not None else set()
+
+    firefox_pids = [pid for pid in is_firefox_running() if pid not in pooled]
+    if firefox_pids:
+        if open_firefox_tab(url, display=display):
+            return "firefox-tab"
+        api_logger.warning("Firefox did not take the URL, restarting it...")
+        gracefully_terminate_firefox(firefox_pids)
+        _wait_for_exit(firefox_pids, BROWSER_EXIT_TIMEOUT)
+        start_browser("firefox", url, display)
+        return "started"
+
+    chromium_pids = [pid for pid in is_chromium_running() if pid not in pooled]
+    if chromium_pids:
+        if open_chromium_tab(url):
+            return "chromium-tab"
+        # started without DevTools, restart it with the debugging port
+        api_logger.warning("Chromium DevTools is not reachable, restarting it...")
+        gracefully_terminate_chromium(chromium_pids)
+        _wait_for_exit(chromium_pids, BROWSER_EXIT_TIMEOUT)
+        start_browser("chromium", url, display)
+        return "started"
+
+    if pool is not None and pool.take(url):
+        return "pooled"
+    start_browser(DEFAULT_BROWSER, url, display)
+    return "started"
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable
+
+
+class EncodedFrameCache:
+    """
+    A bounded LRU cache of encoded frames (data URIs), keyed by frame identity.
+
+    Entries are evicted least recently used first once their total size passes
+    ``max_bytes``. Lookups for a key that is being encoded right now wait for that
+    encode instead of starting another one. A failed encode is not cached; the error
+    is raised to every caller that was waiting on it.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size = 0
+        self._entries: "OrderedDict[Hashable, str]" = OrderedDict()
+        self._pending: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get_or_encode(self, key: Hashable, encode: Callable[[], str]) -> str:
+        with self._lock:
+            if key in self._entries:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            pending = self._pending.get(key)
+            if pending is None:
+                self.misses += 1
+                future: Future = Future()
+                self._pending[key] = future
+            else:
+                # someone else is encoding this frame, share their result
+                self.hits += 1
+
+        if pending is not None:
+            return pending.result()
+
+        try:
+            value = encode()
+        except BaseException as e:
+            with self._lock:
+                del self._pending[key]
+            future.set_exception(e)
+            raise
+
+        with self._lock:
+            del self._pending[key]
+            self._store(key, value)
+        future.set_result(value)
+        return value
+
+    def put(self, key: Hashable, value: str) -> None:
+        with self._lock:
+            if key not in self._entries:
+                self._store(key, value)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+                "bytes": self._size,
+            }
+
+    def _store(self, key: Hashable, value: str) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._entries[key] = value
+        self._size += len(value)
+        while self._size > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
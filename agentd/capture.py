@@ -0,0 +1,361 @@
+import hashlib
+import itertools
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+import mss
+from PIL import Image
+
+capture_logger = logging.getLogger("capture")
+
+# mss handles are bound to the thread that opened them, so one-off grabs keep one
+# open connection per thread
+_thread_local = threading.local()
+
+# (x, y, width, height) in screen coordinates
+Region = Tuple[int, int, int, int]
+
+
+class Frame:
+    """A single raw screen capture.
+
+    ``raw`` holds the pixels exactly as the X server returned them (BGRA, 4 bytes
+    per pixel). ``timestamp`` is the wall-clock time (``time.time()``) at which the
+    frame was grabbed, comparable with the timestamps of pynput events.
+    """
+
+    __slots__ = ("timestamp", "width", "height", "raw")
+
+    def __init__(self, timestamp: float, width: int, height: int, raw: bytes) -> None:
+        self.timestamp = timestamp
+        self.width = width
+        self.height = height
+        self.raw = raw
+
+    @property
+    def size(self) -> tuple[int, int]:
+        return self.width, self.height
+
+    def to_image(self) -> Image.Image:
+        """Returns the frame as an RGB PIL image."""
+        return Image.frombytes("RGB", self.size, self.raw, "raw", "BGRX")
+
+
+def frame_digest(frame: Frame, row_stride: int = 1) -> bytes:
+    """
+    Returns a content hash of a frame. With ``row_stride`` > 1 only every n-th row
+    is hashed, which is faster but can miss changes that fall between sampled rows.
+    """
+    if row_stride <= 1:
+        return hashlib.blake2b(frame.raw, digest_size=16).digest()
+    digest = hashlib.blake2b(digest_size=16)
+    row_bytes = frame.width * 4
+    view = memoryview(frame.raw)
+    for row in range(0, frame.height, row_stride):
+        digest.update(view[row * row_bytes : (row + 1) * row_bytes])
+    return digest.digest()
+
+
+def grab_frame(sct, monitor: dict) -> Frame:
+    """
+    Grabs one frame with an open mss instance.
+
+    The frame is stamped with the midpoint of the grab, which is the best estimate
+    we have of when the X server actually copied the pixels.
+    """
+    started = time.time()
+    shot = sct.grab(monitor)
+    finished = time.time()
+    return Frame(
+        timestamp=started + (finished - started) / 2,
+        width=shot.width,
+        height=shot.height,
+        raw=bytes(shot.raw),
+    )
+
+
+def clip_region(region: Region, monitor: dict) -> dict:
+    """
+    Clips a region to the bounds of a monitor and returns it as an mss monitor dict.
+    Raises ValueError if nothing of the region is on screen.
+    """
+    x, y, width, height = region
+    left = max(x, monitor["left"])
+    top = max(y, monitor["top"])
+    right = min(x + width, monitor["left"] + monitor["width"])
+    bottom = min(y + height, monitor["top"] + monitor["height"])
+    if right <= left or bottom <= top:
+        raise ValueError("region lies outside the screen")
+    return {"left": left, "top": top, "width": right - left, "height": bottom - top}
+
+
+def _thread_mss(display: Optional[str], with_cursor: bool = True):
+    # one connection per thread for each display and cursor setting it grabs with
+    handles = getattr(_thread_local, "handles", None)
+    if handles is None:
+        handles = _thread_local.handles = {}
+    sct = handles.get((display, with_cursor))
+    if sct is None:
+        sct = mss.mss(display=display, with_cursor=with_cursor)
+        handles[(display, with_cursor)] = sct
+    return sct
+
+
+def screen_region(display: Optional[str] = None) -> Region:
+    """Returns the bounds of the screen as seen by the calling thread's connection."""
+    monitor = _thread_mss(display).monitors[1]
+    return monitor["left"], monitor["top"], monitor["width"], monitor["height"]
+
+
+def grab_screen(
+    display: Optional[str] = None,
+    with_cursor: bool = True,
+    region: Optional[Region] = None,
+) -> Frame:
+    """
+    Grabs the screen over a connection that stays open for the calling thread.
+    Meant to be called from a small, long-lived pool of threads.
+
+    With ``region`` only that part of the screen is requested from the X server, so
+    capture cost scales with the region rather than the whole screen.
+    """
+    sct = _thread_mss(display, with_cursor)
+    monitor = sct.monitors[1]
+    if region is not None:
+        monitor = clip_region(region, monitor)
+    return grab_frame(sct, monitor)
+
+
+class CaptureProfile:
+    """
+    Capture intervals (in seconds) for each activity level:
+
+    - ``burst``: for ``burst_window`` seconds after user input
+    - ``active``: while the screen kept changing within the last ``idle_after`` seconds
+    - ``idle``: once nothing happened for longer than that
+    """
+
+    def __init__(
+        self,
+        burst: float,
+        active: float,
+        idle: float,
+        burst_window: float = 1.0,
+        idle_after: float = 2.0,
+    ) -> None:
+        self.burst = burst
+        self.active = active
+        self.idle = idle
+        self.burst_window = burst_window
+        self.idle_after = idle_after
+
+
+CAPTURE_PROFILES: Dict[str, CaptureProfile] = {
+    # one frame every 150ms regardless of activity
+    "fixed": CaptureProfile(burst=0.15, active=0.15, idle=0.15),
+    "adaptive": CaptureProfile(burst=0.03, active=0.15, idle=1.0),
+    "economy": CaptureProfile(burst=0.1, active=0.3, idle=2.0, idle_after=1.0),
+}
+
+
+class CaptureRateController:
+    """
+    Picks the capture interval from recent input and screen activity according to a
+    capture profile. Input and frame notifications may come from any thread.
+    """
+
+    def __init__(self, profile: CaptureProfile) -> None:
+        self.profile = profile
+        self._last_input = float("-inf")
+        self._last_change = time.monotonic()
+
+    def notify_input(self) -> None:
+        self._last_input = time.monotonic()
+
+    def notify_frame(self, changed: bool) -> None:
+        if changed:
+            self._last_change = time.monotonic()
+
+    def interval(self) -> float:
+        now = time.monotonic()
+        if now - self._last_input < self.profile.burst_window:
+            return self.profile.burst
+        if now - self._last_change < self.profile.idle_after:
+            return self.profile.active
+        return self.profile.idle
+
+
+class CaptureEngine:
+    """
+    Captures the screen on a fixed, drift-free schedule in a background thread.
+
+    The engine keeps one mss instance (and so one X connection, using XShm when the
+    server supports it) open for its whole lifetime instead of spawning a process
+    per frame. Ticks are scheduled against absolute deadlines so slow captures do
+    not accumulate drift; when a capture runs past one or more deadlines, the missed
+    ticks are skipped and counted as overruns.
+
+    ``interval`` is either a fixed number of seconds or a callable that is asked for
+    the interval before every tick, such as ``CaptureRateController.interval``.
+    ``wake()`` re-reads the interval during a wait, so a switch to a faster rate takes
+    effect without waiting out a long idle interval.
+
+    Every captured frame is handed to ``on_frame`` from the capture thread.
+    """
+
+    def __init__(
+        self,
+        interval: Union[float, Callable[[], float]],
+        on_frame: Callable[[Frame], None],
+        display: Optional[str] = None,
+        with_cursor: bool = True,
+    ) -> None:
+        self.interval = interval
+        self.on_frame = on_frame
+        self.display = display
+        self.with_cursor = with_cursor
+        self.frames_captured = 0
+        self.overruns = 0
+        self.last_capture_duration = 0.0
+        self._stop_event = threading.Event()
+        self._wake_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._wake_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name="capture-engine", daemon=True
+        )
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake_event.set()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+        capture_logger.info(
+            f"capture engine stopped: frames: {self.frames_captured} overruns: {self.overruns}"
+        )
+
+    def _run(self) -> None:
+        # mss handles are not thread safe, so the connection is opened by the thread
+        # that uses it and lives exactly as long as the loop
+        with mss.mss(display=self.display, with_cursor=self.with_cursor) as sct:
+            monitor = sct.monitors[1]
+            deadline = time.monotonic()
+            while not self._stop_event.is_set():
+                started = time.monotonic()
+                try:
+                    frame = grab_frame(sct, monitor)
+                    self.frames_captured += 1
+                    self.on_frame(frame)
+                except Exception as e:
+                    capture_logger.error(f"frame capture failed: {e}")
+                self.last_capture_duration = time.monotonic() - started
+
+                tick = deadline
+                interval = self._next_interval()
+                deadline += interval
+                now = time.monotonic()
+                if now > deadline:
+                    missed = int((now - deadline) / interval) + 1
+                    self.overruns += missed
+                    deadline += missed * interval
+                    capture_logger.debug(
+                        f"capture overrun: took {self.last_capture_duration:.3f}s, skipped {missed} tick(s)"
+                    )
+                while self._wake_event.wait(max(0.0, deadline - time.monotonic())):
+                    self._wake_event.clear()
+                    if self._stop_event.is_set():
+                        break
+                    # the rate may have gone up, so reschedule against the last tick
+                    deadline = min(deadline, tick + self._next_interval())
+
+    def _next_interval(self) -> float:
+        return self.interval() if callable(self.interval) else self.interval
+
+
+class LiveCapture:
+    """
+    A capture loop shared by every server-side consumer of live frames.
+
+    The loop runs only while there are subscribers. Each subscriber asks for a frame
+    interval and the loop runs at the fastest one requested; every frame is handed to
+    every subscriber as ``on_frame(frame, changed)``, where ``changed`` says whether it
+    differs from the previous frame. Callbacks run on the capture thread, so they
+    must return quickly.
+    """
+
+    def __init__(self, display: Optional[str] = None, with_cursor: bool = True) -> None:
+        self.display = display
+        self.with_cursor = with_cursor
+        self.latest: Optional[Frame] = None
+        self._latest_digest: Optional[bytes] = None
+        self._subscribers: Dict[int, Tuple[float, Callable[[Frame, bool], None]]] = {}
+        self._ids = itertools.count()
+        self._engine: Optional[CaptureEngine] = None
+        self._lock = threading.Lock()
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(
+        self, on_frame: Callable[[Frame, bool], None], interval: float
+    ) -> int:
+        """Registers a consumer and returns the id to unsubscribe it with."""
+        with self._lock:
+            subscription = next(self._ids)
+            self._subscribers[subscription] = (interval, on_frame)
+            if self._engine is None:
+                self._latest_digest = None
+                self._engine = CaptureEngine(
+                    interval=self._interval,
+                    on_frame=self._dispatch,
+                    display=self.display,
+                    with_cursor=self.with_cursor,
+                )
+                self._engine.start()
+            else:
+                # the new subscriber may want a faster rate
+                self._engine.wake()
+        return subscription
+
+    def unsubscribe(self, subscription: int) -> None:
+        with self._lock:
+            self._subscribers.pop(subscription, None)
+            if self._subscribers or self._engine is None:
+                return
+            engine, self._engine = self._engine, None
+        # stopped outside the lock, the capture thread takes it to dispatch
+        engine.stop()
+
+    def _interval(self) -> float:
+        with self._lock:
+            return min((interval for interval, _ in self._subscribers.values()), default=1.0)
+
+    def _dispatch(self, frame: Frame) -> None:
+        digest = frame_digest(frame)
+        changed = digest != self._latest_digest
+        self._latest_digest = digest
+        self.latest = frame
+        with self._lock:
+            callbacks = [on_frame for _, on_frame in self._subscribers.values()]
+        for on_frame in callbacks:
+            try:
+                on_frame(frame, changed)
+            except Exception as e:
+                capture_logger.error(f"live frame subscriber failed: {e}")
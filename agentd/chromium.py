@@ -1,25 +1,26 @@
-import subprocess
 import os
 import signal
+from typing import Optional
+from urllib.parse import quote
+
+import requests
+
+from .util import find_processes
+from .windows import find_windows
+
+# port Chromium is started with for the DevTools protocol
+CHROMIUM_DEBUG_PORT = int(os.getenv("CHROMIUM_DEBUG_PORT", "9222"))
 
 
 def is_chromium_running() -> list:
     """
     Checks if Chromium is running and returns a list of PIDs.
     """
-    try:
-        output = subprocess.check_output(["pgrep", "-f", "chromium"])
-        return [int(pid) for pid in output.decode().strip().split("\n")]
-    except subprocess.CalledProcessError:
-        return []
+    return find_processes("chromium")
 
 
-def is_chromium_window_open():
-    try:
-        output = subprocess.check_output(["wmctrl", "-l", "-x"])
-        return "Chromium" in output.decode()
-    except subprocess.CalledProcessError:
-        return False
+def is_chromium_window_open(display: Optional[str] = None) -> bool:
+    return bool(find_windows("chromium", display))
 
 
 def gracefully_terminate_chromium(pids: list):
@@ -34,3 +35,25 @@ def gracefully_terminate_chromium(pids: list):
             print(f"Chromium process {pid} not found.")
         except Exception as e:
             print(f"Error terminating Chromium process {pid}: {e}")
+
+
+def open_chromium_tab(
+    url: str, port: int = CHROMIUM_DEBUG_PORT, timeout: float = 5.0
+) -> bool:
+    """
+    Opens a URL in a new tab of the running Chromium through the DevTools protocol
+    and brings the tab to the front. Returns False if DevTools is not listening,
+    e.g. because Chromium was started without ``--remote-debugging-port``.
+    """
+    base = f"http://127.0.0.1:{port}/json"
+    try:
+        # newer versions only accept PUT for creating targets
+        response = requests.put(f"{base}/new?{quote(url, safe='')}", timeout=timeout)
+        if response.status_code == 405:
+            response = requests.get(f"{base}/new?{quote(url, safe='')}", timeout=timeout)
+        response.raise_for_status()
+        target_id = response.json()["id"]
+        requests.get(f"{base}/activate/{target_id}", timeout=timeout)
+        return True
+    except (requests.RequestException, KeyError, ValueError):
+        return False
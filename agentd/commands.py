@@ -0,0 +1,163 @@
+import asyncio
+import codecs
+import logging
+import os
+import signal
+import time
+from typing import AsyncIterator, Dict, Optional
+
+api_logger = logging.getLogger("api")
+
+# commands running at the same time, more wait for a slot
+EXEC_MAX_CONCURRENT = int(os.getenv("EXEC_MAX_CONCURRENT", "4"))
+# default seconds a command may run before it is killed
+EXEC_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "600"))
+# output kept per command, stdout and stderr together; the rest is discarded
+EXEC_MAX_OUTPUT_BYTES = int(os.getenv("EXEC_MAX_OUTPUT_MB", "10")) * 1024 * 1024
+# seconds a command gets to exit after SIGTERM before it is killed
+KILL_GRACE_SECONDS = 2.0
+READ_CHUNK_BYTES = 64 * 1024
+
+
+def _signal_group(process: asyncio.subprocess.Process, sig: int) -> None:
+    # commands run in a session of their own, so this reaches everything they started
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+class CommandRunner:
+    """
+    Runs shell commands as asyncio subprocesses, so a long build or a log tail never
+    holds up the event loop, and streams their output as it is produced.
+
+    At most ``max_concurrent`` commands run at once, later ones wait for a slot.
+    Each command is killed, together with everything it started, when it runs past
+    its timeout or its caller goes away. Output beyond ``max_output`` bytes is
+    drained and discarded, so the command does not block on a full pipe.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = EXEC_MAX_CONCURRENT,
+        max_output: int = EXEC_MAX_OUTPUT_BYTES,
+    ) -> None:
+        self.max_output = max_output
+        self.running = 0
+        self._slots = asyncio.Semaphore(max_concurrent)
+
+    async def stream(
+        self, command: str, timeout: Optional[float] = EXEC_TIMEOUT
+    ) -> AsyncIterator[Dict]:
+        """
+        Runs a command and yields its output as ``{"type": "stdout" | "stderr",
+        "data": str}`` events, followed by one ``{"type": "exit", ...}`` event with
+        the return code, whether it timed out and whether output was truncated.
+        """
+        async with self._slots:
+            started = time.perf_counter()
+            process = await asyncio.create_subprocess_shell(
+                command,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                start_new_session=True,
+            )
+            self.running += 1
+            chunks: "asyncio.Queue[tuple[str, Optional[bytes]]]" = asyncio.Queue()
+            readers = [
+                asyncio.ensure_future(self._read(process.stdout, "stdout", chunks)),
+                asyncio.ensure_future(self._read(process.stderr, "stderr", chunks)),
+            ]
+            decoders = {
+                name: codecs.getincrementaldecoder("utf-8")(errors="replace")
+                for name in ("stdout", "stderr")
+            }
+            loop = asyncio.get_running_loop()
+            deadline = loop.time() + timeout if timeout else None
+            kept = 0
+            truncated = False
+            timed_out = False
+            try:
+                open_streams = len(readers)
+                while open_streams:
+                    remaining = None if deadline is None else deadline - loop.time()
+                    try:
+                        if remaining is not None and remaining <= 0:
+                            raise asyncio.TimeoutError
+                        name, data = await asyncio.wait_for(chunks.get(), remaining)
+                    except asyncio.TimeoutError:
+                        timed_out = True
+                        break
+                    if data is None:
+                        open_streams -= 1
+                        continue
+                    keep = data[: max(0, self.max_output - kept)]
+                    truncated = truncated or len(keep) < len(data)
+                    kept += len(keep)
+                    text = decoders[name].decode(keep)
+                    if text:
+                        yield {"type": name, "data": text}
+
+                if timed_out:
+                    api_logger.warning(f"exec: command timed out after {timeout}s, killing it")
+                    await self._terminate(process)
+                return_code = await process.wait()
+                for name, decoder in decoders.items():
+                    text = decoder.decode(b"", final=True)
+                    if text:
+                        yield {"type": name, "data": text}
+                yield {
+                    "type": "exit",
+                    "return_code": return_code,
+                    "timed_out": timed_out,
+                    "truncated": truncated,
+                    "duration_ms": (time.perf_counter() - started) * 1000,
+                }
+            finally:
+                self.running -= 1
+                # the caller went away or something failed, do not leave it running
+                if process.returncode is None:
+                    _signal_group(process, signal.SIGKILL)
+                for reader in readers:
+                    reader.cancel()
+
+    async def run(self, command: str, timeout: Optional[float] = EXEC_TIMEOUT) -> Dict:
+        """
+        Runs a command to completion and returns its exit event with the collected
+        ``stdout`` and ``stderr`` added.
+        """
+        output: Dict[str, list] = {"stdout": [], "stderr": []}
+        result: Dict = {}
+        async for event in self.stream(command, timeout):
+            if event["type"] == "exit":
+                result = event
+            else:
+                output[event["type"]].append(event["data"])
+        result["stdout"] = "".join(output["stdout"])
+        result["stderr"] = "".join(output["stderr"])
+        return result
+
+    @staticmethod
+    async def _read(
+        stream: asyncio.StreamReader,
+        name: str,
+        chunks: "asyncio.Queue[tuple[str, Optional[bytes]]]",
+    ) -> None:
+        while True:
+            data = await stream.read(READ_CHUNK_BYTES)
+            if not data:
+                break
+            chunks.put_nowait((name, data))
+        # end of stream
+        chunks.put_nowait((name, None))
+
+    @staticmethod
+    async def _terminate(process: asyncio.subprocess.Process) -> None:
+        _signal_group(process, signal.SIGTERM)
+        try:
+            await asyncio.wait_for(process.wait(), KILL_GRACE_SECONDS)
+        except asyncio.TimeoutError:
+            _signal_group(process, signal.SIGKILL)
+            await process.wait()
@@ -0,0 +1,146 @@
+import threading
+import uuid
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import numpy as np
+
+from .capture import Frame
+
+# (x, y, width, height)
+Rect = Tuple[int, int, int, int]
+
+
+def frame_array(frame: Frame) -> np.ndarray:
+    """Returns a (height, width, 4) view over the frame's raw BGRA pixels."""
+    return np.frombuffer(frame.raw, dtype=np.uint8).reshape(
+        frame.height, frame.width, 4
+    )
+
+
+def _changed_pixels(previous: Frame, current: Frame) -> np.ndarray:
+    """Returns a (height, width) mask of the pixels that differ between two frames."""
+    # the 4th (padding) byte is ignored, it is not part of the picture
+    return (frame_array(previous)[..., :3] != frame_array(current)[..., :3]).any(axis=2)
+
+
+def changed_fraction(previous: Frame, current: Frame) -> float:
+    """Returns the fraction of pixels that differ, 1.0 if the frame size changed."""
+    if previous.size != current.size:
+        return 1.0
+    return float(_changed_pixels(previous, current).mean())
+
+
+def changed_tiles(previous: Frame, current: Frame, tile_size: int = 64) -> List[Rect]:
+    """
+    Compares two frames tile by tile and returns the rectangles that changed.
+
+    The comparison is done in one vectorized pass: the per-pixel difference mask is
+    padded to whole tiles and reduced per tile. Horizontally adjacent changed tiles
+    are merged into a single rectangle to keep the number of encoded pieces down.
+    """
+    if previous.size != current.size:
+        raise ValueError("frames must have the same size to be compared")
+
+    width, height = current.size
+    mask = _changed_pixels(previous, current)
+
+    rows = -(-height // tile_size)
+    cols = -(-width // tile_size)
+    padded = np.zeros((rows * tile_size, cols * tile_size), dtype=bool)
+    padded[:height, :width] = mask
+    tiles = padded.reshape(rows, tile_size, cols, tile_size).any(axis=(1, 3))
+
+    rects: List[Rect] = []
+    for row in range(rows):
+        changed = np.flatnonzero(tiles[row])
+        if not changed.size:
+            continue
+        # split the changed columns into runs of consecutive tiles
+        runs = np.split(changed, np.flatnonzero(np.diff(changed) != 1) + 1)
+        y = row * tile_size
+        h = min(tile_size, height - y)
+        for run in runs:
+            x = int(run[0]) * tile_size
+            w = min((int(run[-1]) + 1) * tile_size, width) - x
+            rects.append((x, y, w, h))
+    return rects
+
+
+class ReferenceFrameCache:
+    """
+    Remembers the last frames sent to each client so the next screenshot can be
+    sent as a delta against them.
+
+    Bounded in both directions: each client keeps its ``frames_per_client`` newest
+    frames and only the ``max_clients`` most recently active clients are kept.
+    """
+
+    def __init__(self, max_clients: int = 16, frames_per_client: int = 2) -> None:
+        self.max_clients = max_clients
+        self.frames_per_client = frames_per_client
+        self._clients: "OrderedDict[str, OrderedDict[str, Frame]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, client_id: str, frame_id: str) -> Optional[Frame]:
+        with self._lock:
+            frames = self._clients.get(client_id)
+            if frames is None:
+                return None
+            self._clients.move_to_end(client_id)
+            return frames.get(frame_id)
+
+    def put(self, client_id: str, frame: Frame) -> str:
+        """Stores a frame for a client and returns the id the client should send back."""
+        frame_id = uuid.uuid4().hex
+        with self._lock:
+            frames = self._clients.setdefault(client_id, OrderedDict())
+            self._clients.move_to_end(client_id)
+            frames[frame_id] = frame
+            while len(frames) > self.frames_per_client:
+                frames.popitem(last=False)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        return frame_id
+
+
+class StabilityTracker:
+    """
+    Follows a stream of frames and remembers when the screen last changed by more
+    than ``threshold`` (a fraction of its pixels) from one frame to the next. Small
+    changes below the threshold, such as a blinking caret, do not count.
+    """
+
+    def __init__(self, threshold: float = 0.001) -> None:
+        self.threshold = threshold
+        self.frames = 0
+        self.last_change: Optional[float] = None
+        self._previous: Optional[Frame] = None
+
+    def update(self, frame: Frame, changed: bool = True) -> float:
+        """
+        Adds the next frame and returns how much of it changed. ``changed=False`` says
+        the frame is known to be identical to the previous one and skips the comparison.
+        """
+        self.frames += 1
+        if self._previous is None:
+            fraction = 1.0
+        elif not changed:
+            fraction = 0.0
+        else:
+            fraction = changed_fraction(self._previous, frame)
+        if self.last_change is None or fraction > self.threshold:
+            self.last_change = frame.timestamp
+        self._previous = frame
+        return fraction
+
+    def mark_changed(self, timestamp: float) -> None:
+        """Records a change at ``timestamp`` that no frame shows, e.g. input just sent."""
+        if self.last_change is None or timestamp > self.last_change:
+            self.last_change = timestamp
+
+    def stable_for(self, now: float) -> float:
+        """Seconds the screen has been stable at ``now``, 0 before the first frame."""
+        if self.last_change is None:
+            return 0.0
+        return max(0.0, now - self.last_change)
@@ -0,0 +1,131 @@
+import base64
+import io
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from .capture import Frame
+
+# format name accepted by the API -> (PIL format, mime type)
+IMAGE_FORMATS: Dict[str, Tuple[str, str]] = {
+    "png": ("PNG", "image/png"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "webp": ("WEBP", "image/webp"),
+}
+
+
+def validate_image_options(format: str, quality: int, scale: float) -> None:
+    """Raises ValueError if the requested encoding options are not supported."""
+    if format not in IMAGE_FORMATS:
+        raise ValueError(
+            f"Unsupported image format '{format}', must be one of: {', '.join(IMAGE_FORMATS)}"
+        )
+    if not 1 <= quality <= 100:
+        raise ValueError("quality must be between 1 and 100")
+    if not 0 < scale <= 1:
+        raise ValueError("scale must be greater than 0 and at most 1")
+
+
+def scale_image(image: Image.Image, scale: float) -> Image.Image:
+    if scale == 1:
+        return image
+    width, height = image.size
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return image.resize(size, Image.Resampling.BICUBIC)
+
+
+def fit_scale(size: Tuple[int, int], max_edge: int) -> float:
+    """Returns the scale that fits an image of the given size within max_edge pixels."""
+    return min(1.0, max_edge / max(size))
+
+
+def encode_image(image: Image.Image, format: str = "png", quality: int = 90) -> bytes:
+    """
+    Encodes an image in memory. ``quality`` applies to jpeg and webp; png is always
+    lossless.
+    """
+    pil_format, _ = IMAGE_FORMATS[format]
+    buffer = io.BytesIO()
+    if format == "png":
+        image.save(buffer, pil_format)
+    else:
+        image.save(buffer, pil_format, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_frame(
+    frame: Frame, format: str = "png", quality: int = 90, scale: float = 1.0
+) -> bytes:
+    """Converts a raw frame to an encoded image, scaling it first if requested."""
+    return encode_image(scale_image(frame.to_image(), scale), format, quality)
+
+
+def encode_variants(
+    frame: Frame, variants: List[Tuple[str, int, float]]
+) -> List[bytes]:
+    """
+    Encodes a frame once per (format, quality, scale) variant. The frame is converted to an
+    image only once and every variant is resized from it.
+    """
+    image = frame.to_image()
+    return [
+        encode_image(scale_image(image, scale), format, quality)
+        for format, quality, scale in variants
+    ]
+
+
+def encode_regions(
+    frame: Frame,
+    regions: List[Tuple[int, int, int, int]],
+    format: str = "png",
+    quality: int = 90,
+) -> List[bytes]:
+    """Encodes (x, y, width, height) regions of a frame as separate images."""
+    image = frame.to_image()
+    return [
+        encode_image(image.crop((x, y, x + w, y + h)), format, quality)
+        for x, y, w, h in regions
+    ]
+
+
+_encode_pool: Optional[ProcessPoolExecutor] = None
+_encode_pool_lock = threading.Lock()
+
+
+def get_encode_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the shared process pool for CPU-bound frame encoding, creating it on first use
+    (or again if a worker died). Workers are spawned rather than forked, since the daemon
+    runs listener and server threads that must not be copied into a child mid-operation.
+    """
+    global _encode_pool
+    with _encode_pool_lock:
+        if _encode_pool is None or getattr(_encode_pool, "_broken", False):
+            _encode_pool = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _encode_pool
+
+
+def submit_encode(
+    workers: int, frame: Frame, variants: List[Tuple[str, int, float]]
+) -> "Future[List[bytes]]":
+    """Starts encoding the variants of a frame in the shared process pool."""
+    try:
+        return get_encode_pool(workers).submit(encode_variants, frame, variants)
+    except BrokenProcessPool:
+        # the pool broke after the check above, so this call gets a fresh one
+        return get_encode_pool(workers).submit(encode_variants, frame, variants)
+
+
+def mime_type(format: str) -> Optional[str]:
+    entry = IMAGE_FORMATS.get(format)
+    return entry[1] if entry else None
+
+
+def data_uri(data: bytes, format: str) -> str:
+    return f"data:{mime_type(format)};base64,{base64.b64encode(data).decode('utf-8')}"
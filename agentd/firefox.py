@@ -1,27 +1,26 @@
 import os
 import signal
 import subprocess
+from typing import Optional
+
+from .util import find_processes
+from .windows import (
+    activate_window,
+    close_window,
+    find_windows,
+    maximize_window,
+)
 
 
 def is_firefox_running() -> list:
     """
     Checks if Firefox is running and returns a list of PIDs.
     """
-    try:
-        output = subprocess.check_output(["pgrep", "-f", "firefox"])
-        return [int(pid) for pid in output.decode().strip().split("\n")]
-    except subprocess.CalledProcessError:
-        return []
+    return find_processes("firefox")
 
 
-def is_firefox_window_open():
-    try:
-        output = subprocess.check_output(
-            ["xdotool", "search", "--onlyvisible", "--class", "firefox"]
-        )
-        return bool(output.strip())
-    except subprocess.CalledProcessError:
-        return False
+def is_firefox_window_open(display: Optional[str] = None) -> bool:
+    return bool(find_windows("firefox", display))
 
 
 def gracefully_terminate_firefox(pids: list):
@@ -38,56 +37,67 @@ def gracefully_terminate_firefox(pids: list):
             print(f"Error terminating Firefox process {pid}: {e}")
 
 
-def maximize_firefox_window():
+def maximize_firefox_window(display: Optional[str] = None):
     """
-    Maximizes the Firefox window by resizing it to the full screen size.
+    Activates and maximizes the Firefox windows.
     """
-    try:
-        # Get the window ID(s) of the Firefox window(s)
-        window_ids_output = subprocess.check_output(
-            ["xdotool", "search", "--onlyvisible", "--class", "firefox"]
-        )
-        window_ids = window_ids_output.decode("utf-8").split()
-
-        # Get the display geometry (screen width and height)
-        geometry_output = subprocess.check_output(["xdotool", "getdisplaygeometry"])
-        screen_width, screen_height = geometry_output.decode("utf-8").split()
-
-        for window_id in window_ids:
-            # Activate the window
-            subprocess.run(
-                ["xdotool", "windowactivate", "--sync", window_id], check=True
-            )
-
-            # Resize the window to match the screen dimensions
-            subprocess.run(
-                ["xdotool", "windowsize", window_id, screen_width, screen_height],
-                check=True,
-            )
+    for window_id in find_windows("firefox", display):
+        try:
+            activate_window(window_id, display)
+            maximize_window(window_id, display)
+            print(f"Maximized Firefox window with window ID {window_id}")
+        except LookupError as e:
+            print(f"Failed to maximize Firefox window: {e}")
 
-            # Move the window to the top-left corner
-            subprocess.run(["xdotool", "windowmove", window_id, "0", "0"], check=True)
 
-            print(f"Maximized Firefox window with window ID {window_id}")
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to maximize Firefox window: {e}")
+def close_firefox_window(display: Optional[str] = None):
+    """
+    Closes the Firefox windows gracefully, as their close button would.
+    """
+    for window_id in find_windows("firefox", display):
+        try:
+            close_window(window_id, display)
+            print(f"Closed Firefox window with window ID {window_id}")
+        except LookupError as e:
+            print(f"Failed to close Firefox window: {e}")
 
 
-def close_firefox_window():
+def open_firefox_tab(
+    url: str,
+    timeout: float = 10.0,
+    profile: str = None,
+    display: Optional[str] = None,
+    window_id: Optional[int] = None,
+) -> bool:
     """
-    Closes the Firefox window gracefully using xdotool's windowclose command.
+    Opens a URL in a new tab of the running Firefox through its remote protocol, in
+    the instance using ``profile`` if given, then activates and maximizes its window:
+    ``window_id`` if given, otherwise the Firefox windows. Returns False if Firefox
+    did not hand the URL over within ``timeout`` seconds.
     """
+    profile_args = ["--profile", profile] if profile else []
+    # with a running instance this command forwards the URL and exits right away
+    process = subprocess.Popen(
+        ["firefox", *profile_args, "--new-tab", url],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
     try:
-        # Get the window ID(s) of the Firefox window(s)
-        window_ids_output = subprocess.check_output(
-            ["xdotool", "search", "--onlyvisible", "--class", "firefox"]
-        )
-        window_ids = window_ids_output.decode("utf-8").split()
-
-        for window_id in window_ids:
-            # Close the window
-            subprocess.run(["xdotool", "windowclose", window_id], check=True)
+        if process.wait(timeout=timeout) != 0:
+            return False
+    except subprocess.TimeoutExpired:
+        # it did not find the running instance and is starting a browser of its own
+        process.kill()
+        process.wait()
+        return False
 
-            print(f"Closed Firefox window with window ID {window_id}")
-    except subprocess.CalledProcessError as e:
-        print(f"Failed to close Firefox window: {e}")
+    # the tab opens in the background, bring its window up as a cold start would
+    if window_id is None:
+        maximize_firefox_window(display)
+        return True
+    try:
+        activate_window(window_id, display)
+        maximize_window(window_id, display)
+    except LookupError as e:
+        print(f"Failed to maximize Firefox window: {e}")
+    return True
@@ -0,0 +1,128 @@
+import mmap
+import threading
+from typing import Callable, List, Optional
+
+from .capture import Frame
+
+
+class FrameRingBuffer:
+    """
+    A fixed-size ring of raw frames in one shared, memory-mapped region.
+
+    Each slot holds one raw frame plus its capture timestamp and a sequence number
+    that identifies the frame for as long as it stays in the ring. Writing past the
+    end of the ring overwrites the oldest slot and reports the evicted frame through
+    ``on_evict``. Pinned slots are never overwritten; the writer skips over them and
+    drops the incoming frame only when every slot is pinned.
+    """
+
+    def __init__(
+        self,
+        slots: int,
+        slot_size: int,
+        on_evict: Optional[Callable[[int, float], None]] = None,
+    ) -> None:
+        if slots < 1:
+            raise ValueError("slots must be at least 1")
+        self.slots = slots
+        self.slot_size = slot_size
+        self.on_evict = on_evict
+        self.dropped = 0
+        self._buffer = mmap.mmap(-1, slots * slot_size)
+        self._seqs: List[Optional[int]] = [None] * slots
+        self._timestamps: List[float] = [0.0] * slots
+        self._sizes: List[tuple[int, int]] = [(0, 0)] * slots
+        self._pins: List[int] = [0] * slots
+        self._next_slot = 0
+        self._next_seq = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def write(self, frame: Frame) -> Optional[int]:
+        """Stores a frame and returns its sequence number, or None if it was dropped."""
+        if len(frame.raw) > self.slot_size:
+            raise ValueError(
+                f"frame of {len(frame.raw)} bytes does not fit a {self.slot_size} byte slot"
+            )
+        evicted = None
+        with self._lock:
+            if self._closed:
+                return None
+            slot = self._find_free_slot()
+            if slot is None:
+                self.dropped += 1
+                return None
+            if self._seqs[slot] is not None:
+                evicted = (self._seqs[slot], self._timestamps[slot])
+
+            offset = slot * self.slot_size
+            self._buffer[offset : offset + len(frame.raw)] = frame.raw
+            seq = self._next_seq
+            self._next_seq += 1
+            self._seqs[slot] = seq
+            self._timestamps[slot] = frame.timestamp
+            self._sizes[slot] = frame.size
+            self._next_slot = (slot + 1) % self.slots
+
+        if evicted and self.on_evict:
+            self.on_evict(*evicted)
+        return seq
+
+    def read(self, seq: int) -> Optional[Frame]:
+        """Returns a copy of the frame, or None if it has already been overwritten."""
+        with self._lock:
+            slot = self._slot_of(seq)
+            if slot is None or self._closed:
+                return None
+            width, height = self._sizes[slot]
+            offset = slot * self.slot_size
+            return Frame(
+                timestamp=self._timestamps[slot],
+                width=width,
+                height=height,
+                raw=self._buffer[offset : offset + width * height * 4],
+            )
+
+    def pin(self, seq: int) -> bool:
+        """Protects a frame from being overwritten. Returns False if it is already gone."""
+        with self._lock:
+            slot = self._slot_of(seq)
+            if slot is None:
+                return False
+            self._pins[slot] += 1
+            return True
+
+    def unpin(self, seq: int) -> None:
+        with self._lock:
+            slot = self._slot_of(seq)
+            if slot is not None and self._pins[slot] > 0:
+                self._pins[slot] -= 1
+
+    def release(self, seq: int) -> None:
+        """Drops every pin held on a frame."""
+        with self._lock:
+            slot = self._slot_of(seq)
+            if slot is not None:
+                self._pins[slot] = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._buffer.close()
+
+    def _slot_of(self, seq: int) -> Optional[int]:
+        slot = seq % self.slots if seq < self._next_seq else None
+        # a pinned slot is skipped by the writer, so seq -> slot is only a first guess
+        if slot is not None and self._seqs[slot] == seq:
+            return slot
+        try:
+            return self._seqs.index(seq)
+        except ValueError:
+            return None
+
+    def _find_free_slot(self) -> Optional[int]:
+        for i in range(self.slots):
+            slot = (self._next_slot + i) % self.slots
+            if not self._pins[slot]:
+                return slot
+        return None
@@ -0,0 +1,80 @@
+import bisect
+import threading
+from typing import Generic, List, TypeVar
+
+T = TypeVar("T")
+
+
+class FrameIndex(Generic[T]):
+    """
+    A sorted, thread-safe index of captured frames keyed by capture timestamp.
+
+    The capture thread adds frames as they land and the action senders query it,
+    so lookups are a binary search over memory instead of a directory scan. Every
+    query returns its frames in chronological order (oldest to newest).
+    """
+
+    def __init__(self) -> None:
+        self._timestamps: List[float] = []
+        self._frames: List[T] = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._timestamps)
+
+    def add(self, timestamp: float, frame: T) -> None:
+        with self._lock:
+            # frames almost always arrive in order, so this is an append
+            if not self._timestamps or timestamp >= self._timestamps[-1]:
+                self._timestamps.append(timestamp)
+                self._frames.append(frame)
+                return
+            i = bisect.bisect_right(self._timestamps, timestamp)
+            self._timestamps.insert(i, timestamp)
+            self._frames.insert(i, frame)
+
+    def remove(self, timestamp: float, frame: T) -> None:
+        with self._lock:
+            i = bisect.bisect_left(self._timestamps, timestamp)
+            while i < len(self._timestamps) and self._timestamps[i] == timestamp:
+                if self._frames[i] == frame:
+                    del self._timestamps[i]
+                    del self._frames[i]
+                    return
+                i += 1
+
+    def before(self, timestamp: float, n: int) -> List[T]:
+        """Returns the n frames taken immediately before timestamp."""
+        with self._lock:
+            end = bisect.bisect_left(self._timestamps, timestamp)
+            return self._frames[max(0, end - n) : end]
+
+    def after(self, timestamp: float, n: int) -> List[T]:
+        """Returns the n frames taken immediately after timestamp."""
+        with self._lock:
+            start = bisect.bisect_right(self._timestamps, timestamp)
+            return self._frames[start : start + n]
+
+    def closest(self, timestamp: float, n: int) -> List[T]:
+        """Returns the n frames whose timestamps are closest to timestamp."""
+        with self._lock:
+            timestamps = self._timestamps
+            hi = bisect.bisect_left(timestamps, timestamp)
+            lo = hi - 1
+            # grow the window outwards from the insertion point, one frame at a time
+            while hi - lo - 1 < n and (lo >= 0 or hi < len(timestamps)):
+                if hi >= len(timestamps) or (
+                    lo >= 0 and timestamp - timestamps[lo] <= timestamps[hi] - timestamp
+                ):
+                    lo -= 1
+                else:
+                    hi += 1
+            return self._frames[lo + 1 : hi]
+
+    def latest(self, n: int, start_index: int = 0) -> List[T]:
+        """Returns the n newest frames, optionally skipping the start_index newest ones."""
+        with self._lock:
+            end = len(self._frames) - start_index
+            if end <= 0:
+                return []
+            return self._frames[max(0, end - n) : end]
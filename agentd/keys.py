@@ -0,0 +1,52 @@
+from typing import Dict
+
+from pynput.keyboard import Key
+
+PYNPUT_TO_PYAUTOGUI: Dict[Key, str] = {
+    Key.tab: "tab",
+    Key.enter: "enter",
+    Key.space: "space",
+    Key.backspace: "backspace",
+    Key.delete: "delete",
+    Key.up: "up",
+    Key.down: "down",
+    Key.left: "left",
+    Key.right: "right",
+    Key.home: "home",
+    Key.end: "end",
+    Key.page_up: "pageup",
+    Key.page_down: "pagedown",
+    Key.insert: "insert",
+    Key.esc: "escape",
+    Key.caps_lock: "capslock",
+    Key.shift: "shift",
+    Key.shift_l: "shiftleft",
+    Key.shift_r: "shiftright",
+    Key.ctrl: "ctrl",
+    Key.ctrl_l: "ctrlleft",
+    Key.ctrl_r: "ctrlright",
+    Key.alt: "alt",
+    Key.alt_l: "altleft",
+    Key.alt_r: "altright",
+    Key.cmd: "command",
+    Key.cmd_l: "winleft",
+    Key.cmd_r: "winright",
+    Key.menu: "apps",
+    Key.num_lock: "numlock",
+    Key.scroll_lock: "scrolllock",
+    Key.print_screen: "printscreen",
+    Key.pause: "pause",
+    # Function keys
+    Key.f1: "f1",
+    Key.f2: "f2",
+    Key.f3: "f3",
+    Key.f4: "f4",
+    Key.f5: "f5",
+    Key.f6: "f6",
+    Key.f7: "f7",
+    Key.f8: "f8",
+    Key.f9: "f9",
+    Key.f10: "f10",
+    Key.f11: "f11",
+    Key.f12: "f12",
+}
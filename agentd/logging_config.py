@@ -13,6 +13,10 @@ LOGGING_CONFIG = {
             "format": "[recording] %(asctime)s %(levelname)s [%(funcName)s]: %(message)s",
             "datefmt": "%Y-%m-%d %H:%M:%S",
         },
+        "capture_formatter": {
+            "format": "[capture] %(asctime)s %(levelname)s [%(funcName)s]: %(message)s",
+            "datefmt": "%Y-%m-%d %H:%M:%S",
+        },
     },
     "handlers": {
         "api_console": {
@@ -25,6 +29,11 @@ LOGGING_CONFIG = {
             "formatter": "recording_formatter",
             "stream": "ext://sys.stdout",
         },
+        "capture_console": {
+            "class": "logging.StreamHandler",
+            "formatter": "capture_formatter",
+            "stream": "ext://sys.stdout",
+        },
     },
     "loggers": {
         "api": {
@@ -37,5 +46,10 @@ LOGGING_CONFIG = {
             "level": "INFO",
             "propagate": False,
         },
+        "capture": {
+            "handlers": ["capture_console"],
+            "level": "INFO",
+            "propagate": False,
+        },
     },
 }
\ No newline at end of file
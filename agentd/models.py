@@ -19,26 +19,60 @@ class SystemInfoModel(BaseModel):
     code_version: str | None
 
 
+class ObserveModel(BaseModel):
+    # wait for the screen to settle after the action instead of capturing right away
+    wait_for_stable: bool = False
+    stable_for: float = 0.5
+    timeout: float = 5.0
+    threshold: float = 0.001
+    # seconds to wait before capturing when not waiting for the screen to settle
+    delay: float = 0.0
+    format: str = "png"
+    quality: int = 90
+    scale: float = 1.0
+
+
+class ObservationModel(BaseModel):
+    image: str
+    format: str
+    before_timestamp: float
+    after_timestamp: float
+    settled: Optional[bool] = None
+    settle_ms: Optional[float] = None
+
+
+class ActionResponseModel(BaseModel):
+    status: str
+    observation: Optional[ObservationModel] = None
+    message: Optional[str] = None
+
+
 class MoveMouseModel(BaseModel):
     x: int
     y: int
     duration: float = 1.0
     tween: str = "easeInOutQuad"
+    observe: Optional[ObserveModel] = None
 
 
 class ClickModel(BaseModel):
     button: str = "left"
     location: Optional[MoveMouseModel] = None
+    observe: Optional[ObserveModel] = None
 
 
 class TypeTextModel(BaseModel):
     text: str
     min_interval: float = 0.05
     max_interval: float = 0.25
+    # "human", "fast" or "paste", see TYPE_MODES
+    mode: str = "human"
+    observe: Optional[ObserveModel] = None
 
 
 class PressKeyModel(BaseModel):
     key: str
+    observe: Optional[ObserveModel] = None
 
 
 class useSecretRequest(BaseModel):
@@ -46,6 +80,8 @@ class useSecretRequest(BaseModel):
     server_address: str
     name: str
     field: str
+    # how the secret is typed, see TypeTextModel
+    mode: str = "fast"
 
 class getSecretRequest(BaseModel):
     token: str
@@ -54,20 +90,104 @@ class getSecretRequest(BaseModel):
 
 class PressKeysModel(BaseModel):
     keys: List[str]
+    observe: Optional[ObserveModel] = None
 
 
 class ScrollModel(BaseModel):
     clicks: int = 3
+    observe: Optional[ObserveModel] = None
 
 
 class DragMouseModel(BaseModel):
     x: int
     y: int
+    observe: Optional[ObserveModel] = None
+
+
+class BatchActionModel(BaseModel):
+    # one of the action endpoint names, e.g. "click" or "type_text"
+    name: str
+    # the request body the action's endpoint takes
+    parameters: Dict[str, Any] = {}
+    # seconds to wait after this action, overrides the batch delay
+    delay: Optional[float] = None
+
+
+class BatchActionsModel(BaseModel):
+    actions: List[BatchActionModel]
+    # seconds to wait between actions
+    delay: float = 0.0
+    screenshot: bool = False
+    format: str = "png"
+    quality: int = 90
+    scale: float = 1.0
+
+
+class ActionResultModel(BaseModel):
+    name: str
+    status: str
+    message: Optional[str] = None
+    started: float
+    duration_ms: float
+
+
+class BatchActionsResponseModel(BaseModel):
+    status: str
+    results: List[ActionResultModel]
+    screenshot: Optional[str] = None
+    screenshot_timestamp: Optional[float] = None
+    total_ms: float
+
+
+class RegionModel(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
 
 
 class ScreenshotResponseModel(BaseModel):
     status: str
     images: List[str]
+    format: str = "png"
+    timestamps: List[float] = []
+    region: Optional[RegionModel] = None
+    capture_ms: Optional[float] = None
+    encode_ms: Optional[float] = None
+
+
+class TileModel(BaseModel):
+    x: int
+    y: int
+    width: int
+    height: int
+    image: str
+
+
+class DeltaScreenshotResponseModel(BaseModel):
+    status: str
+    frame_id: str
+    base_frame_id: Optional[str] = None
+    full: bool
+    width: int
+    height: int
+    format: str
+    timestamp: float
+    tiles: List[TileModel]
+    capture_ms: Optional[float] = None
+    encode_ms: Optional[float] = None
+
+
+class StableScreenshotResponseModel(BaseModel):
+    status: str
+    image: str
+    format: str
+    timestamp: float
+    settled: bool
+    settle_ms: float
+    waited_ms: float
+    frames: int
+    encode_ms: Optional[float] = None
 
 
 class CoordinatesModel(BaseModel):
@@ -75,6 +195,84 @@ class CoordinatesModel(BaseModel):
     y: int
 
 
+class WindowModel(BaseModel):
+    id: int
+    title: str
+    wm_class: List[str]
+    pid: Optional[int] = None
+    x: int
+    y: int
+    width: int
+    height: int
+    visible: bool
+    active: bool
+
+
+class WindowsResponseModel(BaseModel):
+    windows: List[WindowModel]
+    active_window: Optional[int] = None
+
+
+class ImageVariantsModel(BaseModel):
+    # "full" sends full-resolution PNGs, "scaled" only the downscaled copies, "both" sends
+    # both: the full images of a state first, then the scaled copies in the same order
+    mode: str = "full"
+    max_edge: int = 640
+    format: str = "png"
+    quality: int = 85
+
+
+class ExecRequestModel(BaseModel):
+    command: str
+    # seconds before the command is killed, EXEC_TIMEOUT if not given
+    timeout: Optional[float] = None
+
+
+class ShellCreateModel(BaseModel):
+    # program to run, SHELL_SESSION_COMMAND if not given
+    command: Optional[str] = None
+    cwd: Optional[str] = None
+    # added to agentd's environment, TERM is "dumb" unless set here
+    env: Dict[str, str] = {}
+    rows: int = 24
+    cols: int = 80
+
+
+class ShellModel(BaseModel):
+    id: str
+    pid: int
+    command: str
+    created: float
+    # offset after the last byte of output so far
+    end: int
+    exited: bool
+    return_code: Optional[int] = None
+
+
+class ShellsModel(BaseModel):
+    sessions: List[ShellModel]
+
+
+class ShellInputModel(BaseModel):
+    data: str
+
+
+class ShellResizeModel(BaseModel):
+    rows: int
+    cols: int
+
+
+class ShellOutputModel(BaseModel):
+    data: str
+    # offset of the first byte in data, past the requested one if output was dropped
+    offset: int
+    # offset to read from next time
+    next_offset: int
+    truncated: bool
+    exited: bool
+    return_code: Optional[int] = None
+
+
 class RecordRequest(BaseModel):
     description: Optional[str] = None
     task_id: Optional[str] = None
@@ -82,6 +280,8 @@ class RecordRequest(BaseModel):
     token: str
     server_address: str
     owner_id: str
+    capture_profile: str = "fixed"
+    image_variants: ImageVariantsModel = ImageVariantsModel()
 
 class StopRequest(BaseModel):
     result: Optional[str] = None
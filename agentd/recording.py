@@ -7,12 +7,10 @@ import json
 import mimetypes
 import os
 import queue
-import re
-import shutil
-import signal
-import subprocess
 import threading
 import time
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
 from .util import OrderLock
 from itertools import chain
 from threading import Lock
@@ -25,9 +23,30 @@ from skillpacks import ActionEvent, EnvState, V1Action, V1ToolRef
 from taskara import Task
 from taskara.task import TaskStatus, V1TaskUpdate
 
+from .cache import EncodedFrameCache
+from .capture import (
+    CAPTURE_PROFILES,
+    CaptureEngine,
+    CaptureRateController,
+    Frame,
+    frame_digest,
+)
 from .celery_worker import celery_app, send_action, update_task
+from .encoding import (
+    data_uri,
+    encode_image,
+    encode_variants,
+    fit_scale,
+    scale_image,
+    submit_encode,
+)
+from .framebuffer import FrameRingBuffer
+from .frames import FrameIndex
+from .keys import PYNPUT_TO_PYAUTOGUI
+from .storage import StorageManager
 from .models import (
     ActionDetails,
+    ImageVariantsModel,
     Recording,
 )
 
@@ -43,61 +62,27 @@ DESKTOP_TOOL_REF = V1ToolRef(
     module="agentdesk.device", type="Desktop", package="agentdesk"
 )
 
-PYNPUT_TO_PYAUTOGUI: Dict[Key, str] = {
-    Key.tab: "tab",
-    Key.enter: "enter",
-    Key.space: "space",
-    Key.backspace: "backspace",
-    Key.delete: "delete",
-    Key.up: "up",
-    Key.down: "down",
-    Key.left: "left",
-    Key.right: "right",
-    Key.home: "home",
-    Key.end: "end",
-    Key.page_up: "pageup",
-    Key.page_down: "pagedown",
-    Key.insert: "insert",
-    Key.esc: "escape",
-    Key.caps_lock: "capslock",
-    Key.shift: "shift",
-    Key.shift_l: "shiftleft",
-    Key.shift_r: "shiftright",
-    Key.ctrl: "ctrl",
-    Key.ctrl_l: "ctrlleft",
-    Key.ctrl_r: "ctrlright",
-    Key.alt: "alt",
-    Key.alt_l: "altleft",
-    Key.alt_r: "altright",
-    Key.cmd: "command",
-    Key.cmd_l: "winleft",
-    Key.cmd_r: "winright",
-    Key.menu: "apps",
-    Key.num_lock: "numlock",
-    Key.scroll_lock: "scrolllock",
-    Key.print_screen: "printscreen",
-    Key.pause: "pause",
-    # Function keys
-    Key.f1: "f1",
-    Key.f2: "f2",
-    Key.f3: "f3",
-    Key.f4: "f4",
-    Key.f5: "f5",
-    Key.f6: "f6",
-    Key.f7: "f7",
-    Key.f8: "f8",
-    Key.f9: "f9",
-    Key.f10: "f10",
-    Key.f11: "f11",
-    Key.f12: "f12",
-}
-
 sessions: Dict[str, RecordingSession] = {}
 lock = Lock()
 
 RECORDINGS_DIR = os.getenv("RECORDINGS_DIR", ".recordings")
 os.makedirs(RECORDINGS_DIR, exist_ok=True)
-SCREENSHOT_INTERVAL = 0.15
+# capture profile used when a recording request does not pick one, see CAPTURE_PROFILES
+DEFAULT_CAPTURE_PROFILE = "fixed"
+# number of raw frames kept in memory per session (~4 MB each at 1280x800)
+FRAME_BUFFER_SLOTS = int(os.getenv("RECORDING_FRAME_BUFFER_SLOTS", "48"))
+# hash every n-th row of a frame when looking for duplicates, 1 hashes the whole frame
+FRAME_HASH_ROW_STRIDE = int(os.getenv("RECORDING_FRAME_HASH_ROW_STRIDE", "1"))
+# seconds after which a frame pin an action never released is dropped, so capture cannot stall
+FRAME_PIN_MAX_SECONDS = float(os.getenv("RECORDING_FRAME_PIN_MAX_SECONDS", "120"))
+# worker processes that PNG-encode frames for the action senders
+ENCODE_WORKERS = int(os.getenv("RECORDING_ENCODE_WORKERS", "2"))
+# memory budget for the data URIs of frames already encoded for actions
+ENCODED_FRAME_CACHE_BYTES = int(os.getenv("RECORDING_ENCODED_FRAME_CACHE_MB", "128")) * 1024 * 1024
+# disk quotas for recorded frames, least recently used frames are evicted past them
+SESSION_QUOTA_BYTES = int(os.getenv("RECORDING_SESSION_QUOTA_MB", "2048")) * 1024 * 1024
+GLOBAL_QUOTA_BYTES = int(os.getenv("RECORDINGS_QUOTA_MB", "8192")) * 1024 * 1024
+storage = StorageManager(session_quota=SESSION_QUOTA_BYTES, global_quota=GLOBAL_QUOTA_BYTES)
 action_delay = .6
 before_screenshot_offset = .03 # offset from the event_time to make sure we can get a true before screenshot
 DOUBLE_CLICK_THRESHOLD = 0.45  # Time threshold for double-click detection (in seconds)
@@ -132,14 +117,36 @@ def wait_for_celery_tasks():
     return {"active_tasks": active_tasks, "reserved_tasks": reserved_tasks}
 
 
+class AfterFrames:
+    """The "after" frames pinned for the actions stamped with one event time."""
+
+    def __init__(self) -> None:
+        # actions still to be sent that look these frames up
+        self.actions = 1
+        self.seqs: List[int] = []
+        self.created = time.monotonic()
+
+
 class RecordingSession:
     """A recording session"""
 
-    def __init__(self, id: str, task: Task) -> None:
+    def __init__(
+        self,
+        id: str,
+        task: Task,
+        capture_profile: str = DEFAULT_CAPTURE_PROFILE,
+        image_variants: Optional[ImageVariantsModel] = None,
+        display: Optional[str] = None,
+    ) -> None:
         self._start_time = time.time()
         self._id = id
+        # X display frames are captured from, $DISPLAY if None
+        self.display = display
         self._task = task  # Store the task object to record actions
         os.makedirs(self._dir(), exist_ok=True)
+        storage.add_session(
+            id, on_evict=self._on_file_evicted, is_referenced=self._is_file_referenced
+        )
 
         self.keyboard_listener = keyboard.Listener(
             on_press=self.on_press,  # type: ignore
@@ -151,11 +158,34 @@ class RecordingSession:
         self.text_buffer = ""
         self.shift_pressed = False
         self.caps_lock_on = False
-        self.screenshot_process = None
+        self.capture_engine: Optional[CaptureEngine] = None
+        self.capture_rate = CaptureRateController(CAPTURE_PROFILES[capture_profile])
+        self.frame_index: FrameIndex[int] = FrameIndex()
+        self.frame_buffer: Optional[FrameRingBuffer] = None
+        # monotonic times of the pins actions hold on each buffered frame
+        self.frame_pins: Dict[int, List[float]] = {}
+        # frames pinned as the "after" screenshots of pending actions, by event time
+        self.after_frames: Dict[float, AfterFrames] = {}
+        self.frame_pins_lock = Lock()
+        self.saved_frames: Dict[int, str] = {}
+        self.saved_frames_lock = Lock()
+        # frames saved under each PNG path; identical frames share a file
+        self.path_frames: Dict[str, Set[int]] = {}
+        # index timestamps of saved frames that have left the ring buffer
+        self.disk_frame_refs: Dict[int, List[float]] = {}
+        # timestamps indexed for each buffered frame, including identical frames that were not stored
+        self.frame_refs: Dict[int, List[float]] = {}
+        self.last_frame: Optional[tuple[bytes, int]] = None
+        self.duplicate_frames = 0
+        self.frame_digests: Dict[int, bytes] = {}
+        self.png_digests: Dict[str, bytes] = {}
+        self.encoded_frames = EncodedFrameCache(max_bytes=ENCODED_FRAME_CACHE_BYTES)
+        self.image_variants = image_variants or ImageVariantsModel()
         self.used_screenshots: Set[str] = set()
         self.test_start_time = None
         self.typing_in_progress = False
         self.text_start_state = None
+        self.text_start_pins: List[int] = []
         self.last_click_args: ActionDetails | None = None
         self.last_click_time = None
         self.last_click_timer = None
@@ -190,7 +220,7 @@ class RecordingSession:
 
         self._status = "running"
         self.action_count = 0
-        self._start_screenshot_subprocess()
+        self._start_capture()
         update_task.delay(
             self._task.id,
             self._task.remote,
@@ -220,6 +250,7 @@ class RecordingSession:
                 # need to set event order to get action place in order.
                 event_order = self.event_order
                 self.event_order += 1
+                self._pin_frames_after(event_time)
                 x, y = pyautogui.position()
                 recording_logger.info(f"releasing lock with name: {secret_name} count of actions {event_order}")
 
@@ -234,10 +265,7 @@ class RecordingSession:
             start_screenshot_path = self._get_screenshots_by_time(2, before_time, "before")
             recording_logger.info(f"task: {self._task.id} event_order: {event_order} start_screenshot_path: {start_screenshot_path}")
             state = EnvState(
-                images=[
-                    self.encode_image_to_base64(screenShot)
-                    for screenShot in start_screenshot_path
-                ],
+                images=self._encode_state_images(start_screenshot_path),
                 coordinates=(int(x), int(y)),
                 timestamp=event_time
             )
@@ -246,10 +274,7 @@ class RecordingSession:
             end_screenshot_path = self._get_screenshots_by_time(2, event_time, "after")
             recording_logger.info(f"task: {self._task.id} event_order: {event_order} end_screenshot_path: {end_screenshot_path}")
             end_state = EnvState(
-                images=[
-                    self.encode_image_to_base64(screenShot)
-                    for screenShot in end_screenshot_path
-                ],
+                images=self._encode_state_images(end_screenshot_path),
                 coordinates=(int(x), int(y)),
                 timestamp=event_time
             )
@@ -291,7 +316,9 @@ class RecordingSession:
                 self._status = "stopping"
                 self.keyboard_listener.stop()
                 self.mouse_listener.stop()
-                self._stop_screenshot_subprocess()
+                self._stop_capture()
+                if self.frame_buffer:
+                    self.frame_buffer.close()
                 self._end_time = time.time()
                 # for action in self.actions:
                 #     self._task.record_action_event(action)
@@ -344,180 +371,437 @@ class RecordingSession:
         
         self._status = "running"
 
-    def _start_screenshot_subprocess(self):
-        screenshot_script = f"""
-import time
-import os
-import subprocess
-
-SCREENSHOT_INTERVAL = {SCREENSHOT_INTERVAL}
-SESSION_DIR = "{self._dir()}"
-
-def take_screenshots():
-    while True:
-        timestamp = time.time()
-        filename = f"screenshot_{{timestamp}}.bmp"
-        file_path = os.path.join(SESSION_DIR, filename)
-        # Use scrot to take a screenshot with the cursor (-p flag)
-        subprocess.Popen(["scrot", "-z", "-p", file_path])
-        time.sleep(SCREENSHOT_INTERVAL)
-
-if __name__ == "__main__":
-    os.makedirs(SESSION_DIR, exist_ok=True)
-    take_screenshots()
-    """
-        screenshot_script_path = os.path.join(self._dir(), "screenshot_script.py")
-        with open(screenshot_script_path, "w") as f:
-            f.write(screenshot_script)
-
-        self.screenshot_process = subprocess.Popen(
-            ["python", screenshot_script_path],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
+    def _start_capture(self):
+        self.capture_engine = CaptureEngine(
+            interval=self.capture_rate.interval,
+            on_frame=self._store_frame,
+            display=self.display,
         )
+        self.capture_engine.start()
+
+    def _store_frame(self, frame: Frame):
+        """
+        Stores a captured frame in the session's frame ring buffer and indexes it by capture time.
+        Nothing touches the disk until a frame is selected for an action.
 
-    def _stop_screenshot_subprocess(self):
-        if self.screenshot_process:
-            os.kill(self.screenshot_process.pid, signal.SIGTERM)
-            self.screenshot_process.wait()
-            # Give scrot (and OS) a moment to finish cleaning up
-            time.sleep(.1)
+        A frame identical to the previous one is not stored again; its timestamp is indexed as a
+        reference to the frame already in the buffer.
+        """
+        digest = frame_digest(frame, FRAME_HASH_ROW_STRIDE)
+        if self.last_frame and self.last_frame[0] == digest:
+            seq = self.last_frame[1]
+            self.frame_refs[seq].append(frame.timestamp)
+            self._index_frame(frame.timestamp, seq)
+            self.duplicate_frames += 1
+            self.capture_rate.notify_frame(changed=False)
+            return
+
+        if self.frame_pins:
+            self._expire_frame_pins()
+        if self.frame_buffer is None:
+            # sized from the first frame so the slots match the actual screen geometry
+            self.frame_buffer = FrameRingBuffer(
+                slots=FRAME_BUFFER_SLOTS,
+                slot_size=len(frame.raw),
+                on_evict=self._on_frame_evicted,
+            )
+        seq = self.frame_buffer.write(frame)
+        if seq is None:
+            recording_logger.warning("frame dropped: every frame buffer slot is pinned")
+            return
+        self.last_frame = (digest, seq)
+        self.capture_rate.notify_frame(changed=True)
+        self.frame_refs[seq] = [frame.timestamp]
+        self.frame_digests[seq] = digest
+        self._index_frame(frame.timestamp, seq)
+
+    def _index_frame(self, timestamp: float, seq: int):
+        """
+        Indexes a frame and pins it for the pending actions it is an "after" frame of. Both
+        happen under the pin lock, so an action registering its after frames at the same time
+        pins each frame once.
+        """
+        with self.frame_pins_lock:
+            self.frame_index.add(timestamp, seq)
+            if not self.after_frames or self.frame_buffer is None:
+                return
+            now = time.monotonic()
+            for event_time, after in self.after_frames.items():
+                if event_time < timestamp and len(after.seqs) < 2 and self.frame_buffer.pin(seq):
+                    self.frame_pins.setdefault(seq, []).append(now)
+                    after.seqs.append(seq)
+
+    def _on_frame_evicted(self, seq: int, timestamp: float):
+        timestamps = self.frame_refs.pop(seq, [])
+        # frames already written to disk stay selectable after they leave the ring,
+        # until the storage manager evicts their file
+        with self.saved_frames_lock:
+            if seq in self.saved_frames:
+                self.disk_frame_refs[seq] = timestamps
+                return
+        self.frame_digests.pop(seq, None)
+        for ts in timestamps:
+            self.frame_index.remove(ts, seq)
+
+    def _is_file_referenced(self, png_path: str) -> bool:
+        """A PNG is still referenced while any of its frames is in the ring buffer."""
+        with self.saved_frames_lock:
+            return any(seq in self.frame_refs for seq in self.path_frames.get(png_path, ()))
+
+    def _on_file_evicted(self, png_path: str):
+        """Forgets a PNG the storage manager deleted, so its frames are no longer selected."""
+        with self.saved_frames_lock:
+            seqs = self.path_frames.pop(png_path, set())
+            self.png_digests.pop(png_path, None)
+            for seq in seqs:
+                self.saved_frames.pop(seq, None)
+            refs = {seq: self.disk_frame_refs.pop(seq, []) for seq in seqs}
+        for seq, timestamps in refs.items():
+            self.frame_digests.pop(seq, None)
+            for ts in timestamps:
+                self.frame_index.remove(ts, seq)
+
+    def _notify_capture_input(self):
+        """Switches the capture loop to its burst rate after user input."""
+        self.capture_rate.notify_input()
+        if self.capture_engine:
+            self.capture_engine.wake()
+
+    def _stop_capture(self):
+        if self.capture_engine:
+            self.capture_engine.stop()
+            recording_logger.info(
+                f"duplicate frames not stored: {self.duplicate_frames} of {self.capture_engine.frames_captured}"
+            )
+        recording_logger.info(f"encoded frame cache: {self.encoded_frames.stats()}")
+
+    def _pin_frames_before(self, event_time: float) -> List[int]:
+        """
+        Pins the frames an action will later use as its "before" screenshots, so they stay in
+        the ring buffer until the action is sent and they are written out as PNG. Returns the
+        frames pinned.
+        """
+        if self.frame_buffer is None:
+            return []
+        before_time = event_time - before_screenshot_offset
+        now = time.monotonic()
+        pinned = []
+        with self.frame_pins_lock:
+            for seq in self.frame_index.before(before_time, 2):
+                if self.frame_buffer.pin(seq):
+                    self.frame_pins.setdefault(seq, []).append(now)
+                    pinned.append(seq)
+        return pinned
+
+    def _pin_frame(self, seq: int) -> bool:
+        """Pins one frame, False if it already left the ring buffer."""
+        with self.frame_pins_lock:
+            if self.frame_buffer is None or not self.frame_buffer.pin(seq):
+                return False
+            self.frame_pins.setdefault(seq, []).append(time.monotonic())
+            return True
+
+    def _pin_frames_after(self, event_time: float):
+        """
+        Pins the frames an action will later use as its "after" screenshots: the two indexed
+        right after ``event_time``, including frames that are captured only later on. They
+        stay in the ring buffer until the action's sender looks them up.
+        """
+        with self.frame_pins_lock:
+            after = self.after_frames.get(event_time)
+            if after is not None:
+                after.actions += 1
+                return
+            after = self.after_frames[event_time] = AfterFrames()
+            if self.frame_buffer is None:
+                return
+            now = time.monotonic()
+            for seq in self.frame_index.after(event_time, 2):
+                if self.frame_buffer.pin(seq):
+                    self.frame_pins.setdefault(seq, []).append(now)
+                    after.seqs.append(seq)
+
+    def _close_frames_after(self, event_time: float, unpin: bool = False):
+        """
+        Stops pinning frames for an action's "after" screenshots once its sender looked them
+        up. ``unpin`` also drops the pins already taken, for an action that is not sent.
+        """
+        with self.frame_pins_lock:
+            after = self.after_frames.get(event_time)
+            if after is None:
+                return
+            after.actions -= 1
+            if after.actions > 0:
+                return
+            del self.after_frames[event_time]
+        if unpin:
+            self._unpin_frames(after.seqs)
+
+    def _unpin_frames(self, seqs: List[int]):
+        """Drops one pin from each frame, for an action that will not be sent after all."""
+        with self.frame_pins_lock:
+            for seq in seqs:
+                pins = self.frame_pins.get(seq)
+                if not pins:
+                    continue
+                pins.pop(0)
+                if not pins:
+                    del self.frame_pins[seq]
+                if self.frame_buffer:
+                    self.frame_buffer.unpin(seq)
+
+    def _release_frame(self, seq: int):
+        """Drops every pin actions took on a frame, once it is saved or known to be gone."""
+        with self.frame_pins_lock:
+            pins = self.frame_pins.pop(seq, [])
+            if self.frame_buffer:
+                for _ in pins:
+                    self.frame_buffer.unpin(seq)
+
+    def _expire_frame_pins(self):
+        """
+        Drops pins held longer than FRAME_PIN_MAX_SECONDS, and the "after" frames still
+        awaited for actions that old. An action that never saves its frames would otherwise
+        keep them pinned, and once every slot is pinned no frame is stored.
+        """
+        cutoff = time.monotonic() - FRAME_PIN_MAX_SECONDS
+        with self.frame_pins_lock:
+            for event_time, after in list(self.after_frames.items()):
+                if after.created < cutoff:
+                    del self.after_frames[event_time]
+            for seq, pins in list(self.frame_pins.items()):
+                kept = [pinned_at for pinned_at in pins if pinned_at >= cutoff]
+                if len(kept) == len(pins):
+                    continue
+                recording_logger.warning(
+                    f"frame {seq}: dropping {len(pins) - len(kept)} pin(s) held over {FRAME_PIN_MAX_SECONDS}s"
+                )
+                if self.frame_buffer:
+                    for _ in range(len(pins) - len(kept)):
+                        self.frame_buffer.unpin(seq)
+                if kept:
+                    self.frame_pins[seq] = kept
+                else:
+                    del self.frame_pins[seq]
+
+    def _save_frames_as_png(self, seqs: List[int]) -> List[str]:
+        """
+        Saves the given frames as PNG and returns their paths, skipping frames that are gone.
+        Frames that are not encoded yet are all submitted to the encode process pool up front,
+        so they encode in parallel while this thread waits.
+        """
+        pending: Dict[int, Future] = {}
+        submitted: Set[bytes] = set()
+        for seq in dict.fromkeys(seqs):
+            digest = self.frame_digests.get(seq)
+            if seq in self.saved_frames or digest is None or digest in submitted or digest in self.encoded_frames:
+                continue
+            frame = self.frame_buffer.read(seq) if self.frame_buffer else None
+            if frame is not None:
+                pending[seq] = submit_encode(
+                    ENCODE_WORKERS, frame, self._frame_variants(frame.size)
+                )
+                submitted.add(digest)
+        paths = [self._save_frame_as_png(seq, pending.get(seq)) for seq in seqs]
+        return [path for path in paths if path]
 
-    def _convert_bmp_to_png(self, bmp_path: str) -> str:
+    def _save_frame_as_png(self, seq: int, encoded: Optional[Future] = None) -> Optional[str]:
         """
-        Converts a BMP file to PNG and returns the path of the converted PNG file.
+        Writes a buffered frame to the session directory as screenshot_{digest}.png, or in the
+        scaled copy's format when the session only sends scaled copies, and returns the path.
+        Files are named by content, so each distinct frame is encoded and written once, and its
+        encoded data URI is cached for every action that uses it. The frame's pins are
+        released on every path, whether it was saved now, saved before or is already gone.
+
+        The frame is pinned while it is saved and registered as saved before the pins are
+        released, so it cannot be evicted from the index half way through.
         """
-        png_path = bmp_path.replace(".bmp", ".png")
-        with Image.open(bmp_path) as img:
-            img.save(png_path, "PNG")
+        try:
+            with self.saved_frames_lock:
+                png_path = self.saved_frames.get(seq)
+            if png_path:
+                return png_path
+            if not self._pin_frame(seq):
+                recording_logger.warning(f"frame {seq} was overwritten before it could be saved")
+                return None
+            digest = self.frame_digests.get(seq)
+            if digest is None:
+                recording_logger.warning(f"frame {seq} was overwritten before it could be saved")
+                return None
+            png_path = os.path.join(
+                self._dir(), f"screenshot_{digest.hex()}.{self._stored_format()}"
+            )
+            try:
+                self.encoded_frames.get_or_encode(
+                    digest, lambda: self._png_data_uri(png_path, seq, encoded, digest)
+                )
+            except LookupError as e:
+                recording_logger.warning(str(e))
+                return None
+            with self.saved_frames_lock:
+                self.saved_frames[seq] = png_path
+                self.png_digests[png_path] = digest
+                self.path_frames.setdefault(png_path, set()).add(seq)
+        finally:
+            self._release_frame(seq)
+        storage.add_file(self._id, png_path)
         return png_path
 
+    def _png_data_uri(
+        self,
+        png_path: str,
+        seq: Optional[int] = None,
+        encoded: Optional[Future] = None,
+        digest: Optional[bytes] = None,
+    ) -> str:
+        """
+        Returns a frame's stored image as a data URI, first writing it from the frame buffer if
+        it is not on disk yet. The image comes from ``encoded`` when the encode was already
+        submitted, otherwise the frame is encoded in the encode process pool. With "both", the
+        scaled variant is encoded in the same pass and cached under the frame's digest.
+        """
+        if os.path.exists(png_path):
+            with open(png_path, "rb") as f:
+                png = f.read()
+        else:
+            frame = None
+            if encoded is None:
+                frame = self._read_frame(seq)
+                encoded = submit_encode(
+                    ENCODE_WORKERS, frame, self._frame_variants(frame.size)
+                )
+            try:
+                variants = encoded.result()
+            except BrokenProcessPool:
+                recording_logger.warning("encode pool broke, encoding frame in-process")
+                frame = frame or self._read_frame(seq)
+                variants = encode_variants(frame, self._frame_variants(frame.size))
+            png = variants[0]
+            if len(variants) > 1 and digest is not None:
+                self.encoded_frames.put(
+                    (digest, "scaled"), data_uri(variants[1], self.image_variants.format)
+                )
+            # write under a temporary name so readers never see a partial image
+            tmp_path = f"{png_path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(png)
+            os.replace(tmp_path, png_path)
+        return data_uri(png, self._stored_format())
+
+    def _stored_format(self) -> str:
+        """The format frames are kept on disk in: the scaled copy's when only that is sent."""
+        if self.image_variants.mode == "scaled":
+            return self.image_variants.format
+        return "png"
+
+    def _frame_variants(self, size: tuple[int, int]) -> List[tuple[str, int, float]]:
+        """The (format, quality, scale) encodings needed for a frame, the one kept on disk
+        first: the full PNG unless the session only sends scaled copies, then the scaled copy
+        when the session sends one. A "scaled" session never encodes the full frame."""
+        variants = []
+        if self.image_variants.mode != "scaled":
+            variants.append(("png", 100, 1.0))
+        if self.image_variants.mode != "full":
+            variants.append(
+                (
+                    self.image_variants.format,
+                    self.image_variants.quality,
+                    fit_scale(size, self.image_variants.max_edge),
+                )
+            )
+        return variants
+
+    def _encode_state_images(self, image_paths: List[str]) -> List[Optional[str]]:
+        """
+        Returns the EnvState images for the given screenshots, following the session's image
+        variants option. With "scaled" the screenshots on disk already are the scaled copies.
+        With "both" the list always holds two entries per screenshot in a fixed order: first
+        the full-resolution images, then the scaled copies in the same order.
+        """
+        images = [self.encode_image_to_base64(path) for path in image_paths]
+        if self.image_variants.mode == "both":
+            images += [self._encode_scaled_image(path) for path in image_paths]
+        return images
+
+    def _encode_scaled_image(self, image_path: str) -> Optional[str]:
+        digest = self.png_digests.get(image_path)
+        key = (digest if digest is not None else image_path, "scaled")
+        try:
+            return self.encoded_frames.get_or_encode(
+                key, lambda: self._scale_png_file(image_path)
+            )
+        except Exception as e:
+            recording_logger.info(f"Error encoding scaled image {image_path}: {e}")
+            return None
+
+    def _scale_png_file(self, image_path: str) -> str:
+        # only needed when the scaled copy was not made with the full PNG, e.g. after cache eviction
+        with Image.open(image_path) as image:
+            image = image.convert("RGB")
+        _, (format, quality, scale) = self._frame_variants(image.size)
+        return data_uri(encode_image(scale_image(image, scale), format, quality), format)
+
+    def _read_frame(self, seq: Optional[int]) -> Frame:
+        frame = self.frame_buffer.read(seq) if self.frame_buffer and seq is not None else None
+        if frame is None:
+            raise LookupError(f"frame {seq} was overwritten before it could be saved")
+        return frame
+
     def _get_screenshots_by_time(self, n: int, target_timestamp: float, mode: str = "closest") -> list[str]:
         """
         Return the file paths for the n screenshots based on the given mode relative to the target timestamp.
 
         Modes:
-          - "closest": Returns the n screenshots whose filename-embedded timestamps are closest to target_timestamp.
+          - "closest": Returns the n screenshots whose capture timestamps are closest to target_timestamp.
           - "before":  Returns the n screenshots taken before target_timestamp.
           - "after":   Returns the n screenshots taken after target_timestamp.
 
-        Screenshots must be named in the format "screenshot_{timestamp}.bmp" where {timestamp} is a float.
-        The returned list is always sorted in chronological order (oldest to newest).
+        Screenshots are looked up in the session's in-memory frame index, which the capture engine
+        updates as frames are buffered. The returned list is always sorted in chronological order (oldest to newest).
 
-        The function will convert all selected BMP files to PNG and return the PNG file paths.
+        The selected frames are written from the frame buffer to PNG and the PNG file paths are returned.
         """
-        session_dir = self._dir()
-        # Collect all .bmp screenshot files
-        screenshot_files = [
-            f for f in os.listdir(session_dir)
-            if f.startswith("screenshot_") and f.endswith(".bmp")
-        ]
-        if not screenshot_files:
-            return []
-
-        # Regex to extract the timestamp from the filename
-        timestamp_pattern = re.compile(r"screenshot_(\d+\.\d+)\.bmp")
-        screenshots = []
-        for filename in screenshot_files:
-            match = timestamp_pattern.match(filename)
-            if not match:
-                continue
-            try:
-                file_timestamp = float(match.group(1))
-                screenshots.append((filename, file_timestamp))
-            except ValueError:
-                continue
-
-        selected_paths: list[str] = []
-
-        # Select screenshots based on the mode
         if mode == "closest":
-            # Calculate absolute difference from target_timestamp
-            screenshots_with_diff = [
-                (abs(file_timestamp - target_timestamp), filename, file_timestamp)
-                for filename, file_timestamp in screenshots
-            ]
-            # Sort by difference (ascending)
-            screenshots_with_diff.sort(key=lambda x: x[0])
-            selected = screenshots_with_diff[:n]
-            # Sort selected screenshots in chronological order.
-            selected.sort(key=lambda x: x[2])
-            selected_paths = [os.path.join(session_dir, filename) for _, filename, _ in selected]
+            selected = self.frame_index.closest(target_timestamp, n)
         elif mode == "before":
-            # Filter for screenshots taken before target_timestamp.
-            filtered = [
-                (filename, file_timestamp)
-                for filename, file_timestamp in screenshots
-                if file_timestamp < target_timestamp
-            ]
-            if filtered:
-                # Sort descending so that the screenshot immediately before target time is first.
-                filtered.sort(key=lambda x: x[1], reverse=True)
-                selected = filtered[:n]
-                # Sort final selection by timestamp ascending for chronological order
-                selected.sort(key=lambda x: x[1])
-                selected_paths = [os.path.join(session_dir, filename) for filename, _ in selected]
+            selected = self.frame_index.before(target_timestamp, n)
         elif mode == "after":
-            # Filter screenshots taken after target_timestamp
-            filtered = [(fname, ts) for (fname, ts) in screenshots if ts > target_timestamp]
-            if filtered:
-                # Sort ascending by timestamp so the one immediately after is first
-                filtered.sort(key=lambda x: x[1])
-                selected = filtered[:n]
-                selected_paths = [os.path.join(session_dir, fname) for fname, _ in selected]
-
+            selected = self.frame_index.after(target_timestamp, n)
         else:
             raise ValueError("Invalid mode: must be 'closest', 'before', or 'after'")
 
-        # Convert BMP files to PNG and collect PNG paths
-        png_paths = [self._convert_bmp_to_png(path) for path in selected_paths]
+        # Write the selected frames to PNG and collect the PNG paths
+        png_paths = self._save_frames_as_png(selected)
+        if mode == "after":
+            self._close_frames_after(target_timestamp)
 
         # Update the used_screenshots set with PNG files
         self.used_screenshots.update(png_paths)
+        storage.touch(png_paths)
 
         return png_paths
 
     def _get_latest_screenshots(self, n: int, start_index: int = 0) -> List[str]:
         """
-        Return the n latest screenshots (by modification time), optionally skipping some at the start.
-        Screenshots must be named in the format "screenshot_{timestamp}.bmp".
+        Return the n latest screenshots (by capture time), optionally skipping some at the start.
 
-        The function will convert all selected BMP files to PNG and return the PNG file paths.
+        The selected frames are written from the frame buffer to PNG and the PNG file paths are returned.
         """
-        session_dir = self._dir()
-        # Get all .bmp screenshot files
-        screenshot_files = [
-            f for f in os.listdir(session_dir)
-            if f.startswith("screenshot_") and f.endswith(".bmp")
-        ]
-        if not screenshot_files:
-            return []
+        # Select the n latest screenshots in chronological order (oldest->newest)
+        selected = self.frame_index.latest(n, start_index)
 
-        # Sort files from newest to oldest by modification time
-        sorted_screenshots = sorted(
-            screenshot_files,
-            key=lambda f: os.path.getmtime(os.path.join(session_dir, f)),
-            reverse=True
-        )
-
-        # Select the n latest screenshots, then reverse for chronological order (oldest->newest)
-        selected_screenshots = sorted_screenshots[start_index : start_index + n]
-        selected_screenshots = selected_screenshots[::-1]
-
-        # Get full paths of screenshots
-        selected_paths = [os.path.join(session_dir, screenshot) for screenshot in selected_screenshots]
-
-        # Convert BMP files to PNG
-        png_paths = [self._convert_bmp_to_png(path) for path in selected_paths]
+        # Write the selected frames to PNG
+        png_paths = self._save_frames_as_png(selected)
 
         # Track which files we've used
         self.used_screenshots.update(png_paths)
+        storage.touch(png_paths)
 
         return png_paths
 
     def _cleanup_unused_screenshots(self):
-        session_dir = self._dir()
-        shutil.rmtree(session_dir)
+        # deleting thousands of frames can take a while, the reaper does it in the background
+        storage.remove_session(self._id, self._dir())
 
     def _record_mouse_move_action_details(self, x, y, event_time: float | None = None):
         """Records the mouse movement action."""
@@ -533,6 +817,7 @@ if __name__ == "__main__":
         start_state = self.mouse_move_start_state
         event_order = self.event_order
         self.event_order += 1
+        self._pin_frames_after(event_time)
 
         # Reset movement tracking variables
         self.mouse_moving = False
@@ -589,7 +874,7 @@ if __name__ == "__main__":
             if mouse_move_details.start_state.timestamp:
                 before_time = mouse_move_details.start_state.timestamp - before_screenshot_offset  # 30ms earlier to make sure we get true before screenshots
                 additional_screenshots = self._get_screenshots_by_time(2, before_time, "before")
-                mouse_move_details.start_state.images = list(filter(None, (self.encode_image_to_base64(screenShot) for screenShot in additional_screenshots)))
+                mouse_move_details.start_state.images = list(filter(None, self._encode_state_images(additional_screenshots)))
                 recording_logger.info("_send_mouse_move_action getting start state screenshots completed")
 
         # Use the provided end screenshot, or take new ones
@@ -605,10 +890,7 @@ if __name__ == "__main__":
         # Prepare end state
         recording_logger.info("_send_mouse_move_action setting end state")
         end_state = EnvState(
-            images=[
-                self.encode_image_to_base64(screenshot)
-                for screenshot in end_screenshots
-            ],
+            images=self._encode_state_images(end_screenshots),
             coordinates=(int(final_x), int(final_y)),
             timestamp=mouse_move_details.end_stamp
         )
@@ -644,6 +926,7 @@ if __name__ == "__main__":
     def on_move(self, x, y):
         """Handles mouse movement events."""
         event_time = time.time()
+        self._notify_capture_input()
         text_action_details = None
         recording_logger.info(f"Mouse moved to ({x}, {y})")
 
@@ -686,6 +969,7 @@ if __name__ == "__main__":
                     coordinates=tuple(map(int, self.last_mouse_position)),
                     timestamp=event_time
                 )
+                self._pin_frames_before(event_time)
                 self.movement_buffer = [(x, y, current_time)]
             else:
                 # Continue existing movement sequence
@@ -724,6 +1008,7 @@ if __name__ == "__main__":
     def on_press(self, key: Key):
         recording_logger.info(f"on_press waiting for lock with key {key} count of actions {len(self.actions)}")
         event_time = time.time()
+        self._notify_capture_input()
         mouse_move_details = None
         special_key_details = None
         text_action_details = None
@@ -800,6 +1085,8 @@ if __name__ == "__main__":
                     )
                     event_order = self.event_order
                     self.event_order += 1
+                    self._pin_frames_before(event_time)
+                    self._pin_frames_after(event_time)
                     special_key_details = ActionDetails(
                         x=x,
                         y=y,
@@ -856,6 +1143,7 @@ if __name__ == "__main__":
 
     def on_click(self, x, y, button, pressed):
         event_time = time.time()
+        self._notify_capture_input()
         before_time = event_time - before_screenshot_offset  # 30ms earlier to make sure we get screenshots before the click
         mouse_move_details = None
         text_action_details = None
@@ -927,6 +1215,14 @@ if __name__ == "__main__":
                 event_order = self.event_order
                 self.event_order += 1
                 click_details = ActionDetails(x=x, y=y, action=action, event_order=event_order, end_stamp=event_time, start_state=None)
+                # a double-click takes its "before" frames from the first press, which pinned them,
+                # and the first press is not sent on its own
+                if is_double_click:
+                    if self.last_click_args is not None and self.last_click_args.end_stamp is not None:
+                        self._close_frames_after(self.last_click_args.end_stamp, unpin=True)
+                else:
+                    self._pin_frames_before(event_time)
+                self._pin_frames_after(event_time)
                 recording_logger.info(f"clicked button: {x}, {y}, {button}, {pressed}", )
                 
             except Exception as e:
@@ -1003,20 +1299,14 @@ if __name__ == "__main__":
             # start_screenshot_path.append(start_screenshot_path[0])
 
             start_state = EnvState(
-                    images=[
-                        self.encode_image_to_base64(screenShot)
-                        for screenShot in start_screenshot_path
-                    ],
+                    images=self._encode_state_images(start_screenshot_path),
                     coordinates=(int(click_details.x), int(click_details.y)),
                     timestamp=before_time
                 )
 
             end_screenshot_path = self._get_screenshots_by_time(2, event_time, "after")
             end_state = EnvState(
-                images=[
-                    self.encode_image_to_base64(screenShot)
-                    for screenShot in end_screenshot_path
-                ],
+                images=self._encode_state_images(end_screenshot_path),
                 coordinates=(int(click_details.x), int(click_details.y)),
                 timestamp=event_time
             )
@@ -1044,6 +1334,7 @@ if __name__ == "__main__":
 
     def on_scroll(self, x, y, dx, dy):
         event_time = time.time()
+        self._notify_capture_input()
         mouse_move_details = None
         text_action_details = None
         recording_logger.info(
@@ -1090,6 +1381,9 @@ if __name__ == "__main__":
                     coordinates=(int(mouse_x), int(mouse_y)),
                     timestamp=event_time
                 )
+                self._pin_frames_before(event_time)
+                # the scroll's "after" screenshots are looked up from when it started
+                self._pin_frames_after(event_time)
             event_order = self.event_order
             self.event_order += 1
             self.scroll_timer = threading.Timer(
@@ -1142,10 +1436,7 @@ if __name__ == "__main__":
                 start_screenshot_path = self._get_screenshots_by_time(2, before_time, "before")
 
                 state = EnvState(
-                    images=[
-                        self.encode_image_to_base64(screenShot)
-                        for screenShot in start_screenshot_path
-                    ],
+                    images=self._encode_state_images(start_screenshot_path),
                     coordinates=(int(x), int(y)),
                     timestamp=event_time
                 )
@@ -1153,10 +1444,7 @@ if __name__ == "__main__":
                 end_screenshot_path = self._get_screenshots_by_time(2, event_time, "closest")
 
                 end_state = EnvState(
-                    images=[
-                        self.encode_image_to_base64(screenShot)
-                        for screenShot in end_screenshot_path
-                    ],
+                    images=self._encode_state_images(end_screenshot_path),
                     coordinates=(int(x), int(y)),
                     timestamp=event_time
                 )
@@ -1231,7 +1519,7 @@ if __name__ == "__main__":
         if (state.images is None or len(state.images) < 2) and state.timestamp:
             before_time = state.timestamp - before_screenshot_offset  # 30ms earlier to make sure we get screenshots before the click
             start_screenshot_path = self._get_screenshots_by_time(2, before_time, "before")
-            state.images = list(filter(None, (self.encode_image_to_base64(screenShot) for screenShot in start_screenshot_path)))
+            state.images = list(filter(None, self._encode_state_images(start_screenshot_path)))
 
         # Get the end screenshots
         end_screenshot_path = []
@@ -1239,10 +1527,7 @@ if __name__ == "__main__":
         end_screenshot_path = self._get_screenshots_by_time(2, end_stamp, "after")
 
         end_state = EnvState(
-            images=[
-                self.encode_image_to_base64(screenShot)
-                for screenShot in end_screenshot_path
-            ],
+            images=self._encode_state_images(end_screenshot_path),
             coordinates=(int(x), int(y)),
             timestamp=end_stamp
         )
@@ -1279,6 +1564,7 @@ if __name__ == "__main__":
             coordinates=(int(x), int(y)),
             timestamp=event_time
         )
+        self.text_start_pins = self._pin_frames_before(event_time)
         self.typing_in_progress = True
 
     def record_text_action_details(self):
@@ -1295,11 +1581,13 @@ if __name__ == "__main__":
             text_start_state = self.text_start_state
             event_order = self.event_order
             self.event_order += 1
+            self._pin_frames_after(end_stamp)
 
             # Reset the typing state
             self.text_buffer = ""
             self.typing_in_progress = False
             self.text_start_state = None
+            self.text_start_pins = []
 
             return ActionDetails(
                     x=x,
@@ -1315,6 +1603,9 @@ if __name__ == "__main__":
             self.text_buffer = ""
             self.typing_in_progress = False
             self.text_start_state = None
+            # no action is sent, so nothing will save the frames pinned for it
+            self._unpin_frames(self.text_start_pins)
+            self.text_start_pins = []
             raise ValueError(f"text_buffer_error cannot strip text_buffer: {text_buffer_error}")
 
     def send_text_action(self, text_action_details: ActionDetails):
@@ -1329,10 +1620,7 @@ if __name__ == "__main__":
         recording_logger.info(f'end_screenshot_path: {end_screenshot_path}')
 
         end_state = EnvState(
-            images=[
-                self.encode_image_to_base64(screenShot)
-                for screenShot in end_screenshot_path
-            ],
+            images=self._encode_state_images(end_screenshot_path),
             coordinates=(int(text_action_details.x), int(text_action_details.y)),
             timestamp=text_action_details.end_stamp
         )
@@ -1343,7 +1631,7 @@ if __name__ == "__main__":
             if text_action_details.start_state.timestamp:
                 before_time = text_action_details.start_state.timestamp - before_screenshot_offset  # 30ms earlier to make sure we get true before screenshots
                 additional_screenshots = self._get_screenshots_by_time(2, before_time, "before")
-                text_action_details.start_state.images = list(filter(None, (self.encode_image_to_base64(screenShot) for screenShot in additional_screenshots)))
+                text_action_details.start_state.images = list(filter(None, self._encode_state_images(additional_screenshots)))
                 recording_logger.info("send_text_action getting start state screenshots completed")                    
 
         action_event = ActionEvent(
@@ -1420,6 +1708,17 @@ if __name__ == "__main__":
     def encode_image_to_base64(
         self, image_path: str, max_retries: int = 3, delay: float = 0.1
     ) -> Optional[str]:
+        digest = self.png_digests.get(image_path)
+        if digest is not None:
+            # a frame this session saved itself, usually already encoded
+            try:
+                return self.encoded_frames.get_or_encode(
+                    digest, lambda: self._png_data_uri(image_path)
+                )
+            except Exception as e:
+                recording_logger.info(f"Error encoding image {image_path}: {e}")
+                return None
+
         for attempt in range(max_retries):
             try:
                 with open(image_path, "rb") as image_file:
@@ -1,56 +1,93 @@
+import asyncio
 import base64
 import getpass
+import json
 import logging
 import os
 import platform
-import random
 import subprocess
-import sys
 import threading
 import time
 import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional, Tuple
 import pyperclip
 import requests
 
 import psutil
 import pyautogui
-from fastapi import Body, FastAPI, HTTPException, Request
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from taskara.task import Task
 
 from agentd.util import log_subprocess_output
 
-from .firefox import (
-    gracefully_terminate_firefox,
-    is_firefox_running,
-    is_firefox_window_open,
-    maximize_firefox_window,
+from . import actions, browser
+
+from .capture import (
+    CAPTURE_PROFILES,
+    Frame,
+    LiveCapture,
+    Region,
+    clip_region,
+    grab_screen,
+    screen_region,
+)
+from .commands import EXEC_TIMEOUT, CommandRunner
+from .delta import ReferenceFrameCache, StabilityTracker, changed_tiles
+from .encoding import (
+    encode_frame,
+    encode_regions,
+    mime_type,
+    validate_image_options,
 )
 from .models import (
+    ActionResponseModel,
+    BatchActionsModel,
+    BatchActionsResponseModel,
     ClickModel,
     CoordinatesModel,
+    DeltaScreenshotResponseModel,
     DragMouseModel,
+    ExecRequestModel,
     MoveMouseModel,
+    ObservationModel,
+    ObserveModel,
     OpenURLModel,
     PressKeyModel,
     PressKeysModel,
     RecordRequest,
     RecordResponse,
+    RegionModel,
     ScreenshotResponseModel,
     ScreenSizeModel,
     ScrollModel,
+    ShellCreateModel,
+    ShellInputModel,
+    ShellModel,
+    ShellOutputModel,
+    ShellResizeModel,
+    ShellsModel,
+    StableScreenshotResponseModel,
     SystemInfoModel,
     SystemUsageModel,
+    TileModel,
     TypeTextModel,
+    WindowModel,
+    WindowsResponseModel,
     StopRequest,
     useSecretRequest,
     getSecretRequest
 )
-from .recording import RecordingSession, lock
+from .recording import RecordingSession, lock, storage
+from .shells import SHELL_COMMAND, SessionLimitError, ShellSession, ShellSessionManager
+from .stream import ScreenStream
+from .windows import get_active_window, get_window_geometry, get_window_tracker
+from .xtest import get_input, set_input_display
 
 import logging
 import logging.config
@@ -66,6 +103,34 @@ api_logger.info(f"current user: {current_user}")
 
 active_session: Optional[RecordingSession] = None
 
+# mouse and keyboard input runs one action at a time, in the order requests arrived,
+# on a single thread so that the event loop stays free while actions run
+input_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="input")
+# display the screenshot endpoints capture from and input is sent to
+SCREEN_DISPLAY = ":1.0"
+set_input_display(SCREEN_DISPLAY)
+# keeps a warm browser ready for open_url if BROWSER_POOL is set
+browser.start_pool(SCREEN_DISPLAY)
+# screenshots are grabbed on one long-lived thread so its X connection is reused
+capture_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="capture")
+# last frames sent to each delta screenshot client
+reference_frames = ReferenceFrameCache()
+# fraction of the screen that may change before a delta falls back to a full frame
+DELTA_FULL_FRAME_RATIO = 0.6
+# capture loop shared by the endpoints that watch the screen continuously
+live_capture = LiveCapture(display=SCREEN_DISPLAY)
+# how often the screen is sampled while waiting for it to settle
+STABLE_POLL_INTERVAL = 0.05
+# paced, change-only frame streams for websocket viewers
+screen_stream = ScreenStream(live_capture)
+MAX_STREAM_FPS = 30.0
+# shell commands run by /v1/exec, as asyncio subprocesses
+command_runner = CommandRunner()
+# persistent shells on pseudo-terminals
+shell_sessions = ShellSessionManager()
+# longest a shell output request may wait for output, it holds a worker thread
+MAX_SHELL_WAIT = 30.0
+
 app = FastAPI()
 
 app.add_middleware(
@@ -85,6 +150,84 @@ async def log_requests(request: Request, call_next):
     return response
 
 
+async def _run_input(func, *args):
+    """Runs a blocking input function on the input thread and waits for it."""
+    return await asyncio.get_running_loop().run_in_executor(input_executor, func, *args)
+
+
+def _check_observe(observe: Optional[ObserveModel]) -> None:
+    """Rejects invalid observe options before the action runs."""
+    if observe is None:
+        return
+    try:
+        validate_image_options(observe.format, observe.quality, observe.scale)
+        if observe.delay < 0:
+            raise ValueError("delay must not be negative")
+        if observe.wait_for_stable:
+            if observe.stable_for <= 0 or observe.timeout <= 0:
+                raise ValueError("stable_for and timeout must be positive")
+            if not 0 <= observe.threshold < 1:
+                raise ValueError("threshold must be at least 0 and less than 1")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"observe: {e}")
+
+
+def _grab_and_run(function, request) -> Frame:
+    """
+    Grabs the "before" frame and runs the action in the same input-thread job, so input
+    still queued ahead of the action has been sent when the frame is taken.
+    """
+    before = grab_screen(SCREEN_DISPLAY, True)
+    function(request)
+    return before
+
+
+async def _act(function, request) -> ActionResponseModel:
+    """
+    Runs an action on the input thread. If the request asks to observe it, the screen
+    is captured right before the action and again after it, once settled if asked to,
+    and the after image is returned with both capture timestamps.
+    """
+    observe: Optional[ObserveModel] = request.observe
+    if observe is None:
+        await _run_input(function, request)
+        return ActionResponseModel(status="success")
+
+    before = await _run_input(_grab_and_run, function, request)
+    acted = time.time()
+
+    settled = None
+    settle_ms = None
+    frame = None
+    if observe.wait_for_stable:
+        tracker = StabilityTracker(observe.threshold)
+        # the screen is compared against how it looked before the action, and is only
+        # stable for the time since the input was sent
+        tracker.update(before)
+        tracker.mark_changed(acted)
+        frame, settled = await _wait_for_stable(
+            tracker, observe.stable_for, observe.timeout
+        )
+        settle_ms = max(0.0, tracker.last_change - acted) * 1000  # type: ignore
+    elif observe.delay > 0:
+        await asyncio.sleep(observe.delay)
+    if frame is None:
+        frame = (await _capture_frames(1, 0.0))[0]
+
+    image = await asyncio.to_thread(
+        encode_frame, frame, observe.format, observe.quality, observe.scale
+    )
+    observation = ObservationModel(
+        image=base64.b64encode(image).decode("utf-8"),
+        format=observe.format,
+        before_timestamp=before.timestamp,
+        after_timestamp=frame.timestamp,
+        settled=settled,
+        settle_ms=settle_ms,
+    )
+    return ActionResponseModel(status="success", observation=observation)
+
+
 @app.get("/")
 async def root():
     return {"message": "Agent in the shell"}
@@ -96,7 +239,7 @@ async def health():
 
 
 @app.get("/v1/info", response_model=SystemInfoModel)
-async def get_info():
+def get_info():
     # Screen size
     width, height = pyautogui.size()
     screen_size = ScreenSizeModel(x=width, y=height)
@@ -145,187 +288,334 @@ def get_screen_size() -> ScreenSizeModel:
     return ScreenSizeModel(x=width, y=height)
 
 
+@app.get("/v1/windows", response_model=WindowsResponseModel)
+def list_windows(
+    wm_class: Optional[str] = None, visible_only: bool = False
+) -> WindowsResponseModel:
+    """
+    Lists the top-level windows from the window tracker's copy of the window tree,
+    optionally only those whose WM_CLASS contains ``wm_class`` or that are visible.
+    """
+    tracker = get_window_tracker(SCREEN_DISPLAY)
+    active = tracker.active_window()
+    windows = [
+        WindowModel(
+            id=info.id,
+            title=info.title,
+            wm_class=list(info.wm_class),
+            pid=info.pid,
+            x=info.x,
+            y=info.y,
+            width=info.width,
+            height=info.height,
+            visible=info.visible,
+            active=info.id == active,
+        )
+        for info in tracker.windows()
+        if (wm_class is None or info.matches(wm_class))
+        and (info.visible or not visible_only)
+    ]
+    return WindowsResponseModel(windows=windows, active_window=active)
+
+
 @app.get("/v1/mouse_coordinates")
 async def mouse_coordinates() -> CoordinatesModel:
-    x, y = pyautogui.position()
+    # queued behind pending input, so the position reflects moves already requested
+    x, y = await _run_input(get_input().position)
     return CoordinatesModel(x=x, y=y)  # type: ignore
 
 
 @app.post("/v1/open_url")
-async def open_url(request: OpenURLModel):
+def open_url(request: OpenURLModel):
+    """
+    Opens the URL in a new tab of the running browser, starting a browser only when
+    none is running.
+    """
     try:
-        firefox_pids = is_firefox_running()
-        if firefox_pids:
-            api_logger.info("Firefox is running. Restarting it...")
-            gracefully_terminate_firefox(firefox_pids)
-            time.sleep(5)
-
-        api_logger.info("Starting Firefox...")
-        subprocess.Popen(
-            [
-                "firefox",
-                request.url,
-            ],
-            stdout=sys.stdout,
-            stderr=sys.stderr,
-        )
-
-        while not is_firefox_window_open():
-            time.sleep(1)
-            api_logger.info("Waiting for the Firefox window to open...")
-
-        maximize_firefox_window()
-
+        how = browser.open_url(request.url, SCREEN_DISPLAY)
+        api_logger.info(f"opened url: {how}")
         return {"status": "success"}
 
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
 
-@app.post("/v1/move_mouse")
+@app.post(
+    "/v1/move_mouse", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def move_mouse_to(request: MoveMouseModel):
+    _check_observe(request.observe)
     try:
-        tween_func = getattr(pyautogui, request.tween, pyautogui.linear)
-        pyautogui.moveTo(
-            request.x, request.y, duration=request.duration, tween=tween_func
-        )
-        return {"status": "success"}
+        return await _act(actions.move_mouse, request)
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return ActionResponseModel(status="error", message=str(e))
 
 
-@app.post("/v1/click")
+@app.post(
+    "/v1/click", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def click(request: ClickModel):
-    if request.location:
-        tween_func = getattr(pyautogui, request.location.tween, pyautogui.linear)
-        pyautogui.moveTo(
-            request.location.x,
-            request.location.y,
-            duration=request.location.duration,
-            tween=tween_func,
-        )
+    _check_observe(request.observe)
     try:
-        pyautogui.click(button=request.button)
-        return {"status": "success"}
+        return await _act(actions.click, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/double_click")
+@app.post(
+    "/v1/double_click", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def double_click(request: ClickModel):
-    if request.location:
-        tween_func = getattr(pyautogui, request.location.tween, pyautogui.linear)
-        pyautogui.moveTo(
-            request.location.x,
-            request.location.y,
-            duration=request.location.duration,
-            tween=tween_func,
-        )
+    _check_observe(request.observe)
     try:
-        pyautogui.doubleClick(button=request.button)
-        return {"status": "success"}
+        return await _act(actions.double_click, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/type_text")
+@app.post(
+    "/v1/type_text", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def type_text(request: TypeTextModel):
+    _check_observe(request.observe)
     try:
-        for char in request.text:
-            pyautogui.write(
-                char,
-                interval=random.uniform(request.min_interval, request.max_interval),
-            )
-            time.sleep(random.uniform(request.min_interval, request.max_interval))
-        return {"status": "success"}
+        return await _act(actions.type_text, request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/press_key")
+@app.post(
+    "/v1/press_key", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def press_key(request: PressKeyModel):
+    _check_observe(request.observe)
     try:
-        pyautogui.press(request.key)
-        return {"status": "success"}
+        return await _act(actions.press_key, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/hot_key")
+@app.post(
+    "/v1/hot_key", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def hot_key(request: PressKeysModel):
+    _check_observe(request.observe)
     try:
-        pyautogui.hotkey(*request.keys)
-        return {"status": "success"}
+        return await _act(actions.hot_key, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/scroll")
+@app.post(
+    "/v1/scroll", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def scroll(request: ScrollModel):
+    _check_observe(request.observe)
     try:
-        # clicks > 0: scrolls UP
-        # clicks < 0: scrolls DOWN
-        pyautogui.scroll(request.clicks)
-        return {"status": "success"}
+        return await _act(actions.scroll, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/drag_mouse")
+@app.post(
+    "/v1/drag_mouse", response_model=ActionResponseModel, response_model_exclude_none=True
+)
 async def drag_mouse(request: DragMouseModel):
+    _check_observe(request.observe)
     try:
-        pyautogui.dragTo(request.x, request.y)
-        return {"status": "success"}
+        return await _act(actions.drag_mouse, request)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/screenshot", response_model=ScreenshotResponseModel)
-async def take_screenshot(
-    count: int = 1, delay: float = 0.0
-) -> ScreenshotResponseModel:
+@app.post("/v1/actions", response_model=BatchActionsResponseModel)
+async def execute_actions(request: BatchActionsModel) -> BatchActionsResponseModel:
+    """
+    Runs a list of actions back to back in a single request, stopping at the first one
+    that fails, and optionally takes a screenshot once they are done. Each action is
+    given as the name of its endpoint and that endpoint's request body.
+    """
+    try:
+        parsed = actions.parse_actions(request.actions)
+        if request.delay < 0 or any(a.delay is not None and a.delay < 0 for a in request.actions):
+            raise ValueError("delays must not be negative")
+        if request.screenshot:
+            validate_image_options(request.format, request.quality, request.scale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    delays = [a.delay if a.delay is not None else request.delay for a in request.actions]
+    started = time.perf_counter()
     try:
-        os.environ["DISPLAY"] = ":1.0"
+        results = await _run_input(actions.run_actions, parsed, delays)
+        failed = len(results) < len(parsed) or any(r.status != "success" for r in results)
+
+        response = BatchActionsResponseModel(
+            status="error" if failed else "success",
+            results=results,
+            total_ms=0.0,
+        )
+        # taken even after a failure, it shows the state the failed action left behind
+        if request.screenshot:
+            frame = (await _capture_frames(1, 0.0))[0]
+            image = await asyncio.to_thread(
+                encode_frame, frame, request.format, request.quality, request.scale
+            )
+            response.screenshot = base64.b64encode(image).decode("utf-8")
+            response.screenshot_timestamp = frame.timestamp
+        response.total_ms = (time.perf_counter() - started) * 1000
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+def _resolve_region(
+    x: Optional[int],
+    y: Optional[int],
+    width: Optional[int],
+    height: Optional[int],
+    window_id: Optional[int],
+    active_window: bool,
+) -> Optional[Region]:
+    """
+    Works out the screen region a screenshot request asks for, or None for the whole
+    screen. The region is clipped to the screen, so it is exactly what gets captured.
+    Raises ValueError for invalid combinations and LookupError if the window does not
+    exist. Runs on the capture thread.
+    """
+    rect = (x, y, width, height)
+    has_rect = any(v is not None for v in rect)
+    if has_rect + (window_id is not None) + active_window > 1:
+        raise ValueError("Only one of a rectangle, window_id or active_window may be given")
+
+    if has_rect:
+        if any(v is None for v in rect):
+            raise ValueError("x, y, width and height must all be given for a rectangle")
+        if width <= 0 or height <= 0:  # type: ignore
+            raise ValueError("width and height must be positive")
+        region: Region = rect  # type: ignore
+    elif active_window or window_id is not None:
+        if active_window:
+            window_id = get_active_window(SCREEN_DISPLAY)
+            if window_id is None:
+                raise LookupError("No active window")
+        region = get_window_geometry(window_id, SCREEN_DISPLAY)  # type: ignore
+    else:
+        return None
+
+    x, y, w, h = screen_region(SCREEN_DISPLAY)
+    clipped = clip_region(region, {"left": x, "top": y, "width": w, "height": h})
+    return clipped["left"], clipped["top"], clipped["width"], clipped["height"]
+
+
+async def _screenshot_region(
+    x: Optional[int],
+    y: Optional[int],
+    width: Optional[int],
+    height: Optional[int],
+    window_id: Optional[int],
+    active_window: bool,
+) -> Optional[Region]:
+    """Resolves the requested region, mapping bad requests to HTTP errors."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(
+            capture_executor,
+            _resolve_region,
+            x,
+            y,
+            width,
+            height,
+            window_id,
+            active_window,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 
-        # Create a directory for screenshots if it doesn't exist
-        screenshots_dir = "screenshots"
-        os.makedirs(screenshots_dir, exist_ok=True)
+def _region_model(region: Optional[Region]) -> Optional[RegionModel]:
+    if region is None:
+        return None
+    x, y, width, height = region
+    return RegionModel(x=x, y=y, width=width, height=height)
 
-        file_paths = []
 
-        # Loop for the number of screenshots specified by 'count'
-        for i in range(count):
-            # Generate a unique file name based on the current timestamp and index
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            file_path = os.path.join(
-                screenshots_dir, f"screenshot_{timestamp}_{i + 1}.png"
+async def _capture_frames(
+    count: int, delay: float, region: Optional[Region] = None
+) -> List[Frame]:
+    """Captures count frames on the capture thread, delay seconds apart."""
+    loop = asyncio.get_running_loop()
+    frames = []
+    for i in range(count):
+        frames.append(
+            await loop.run_in_executor(
+                capture_executor, grab_screen, SCREEN_DISPLAY, True, region
             )
+        )
 
-            # Use scrot to take a screenshot with the cursor (-p flag)
-            subprocess.run(["scrot", "-z", "-p", file_path], check=True)
+        # Delay between screenshots if specified
+        if i < count - 1:
+            await asyncio.sleep(delay)
+    return frames
 
-            file_paths.append(file_path)
 
-            # Delay between screenshots if specified
-            if i < count - 1:
-                time.sleep(delay)
+def _encode_frames(
+    frames: List[Frame], format: str, quality: int, scale: float
+) -> List["asyncio.Future[bytes]"]:
+    """Starts encoding every frame in parallel, off the event loop."""
+    return [
+        asyncio.ensure_future(
+            asyncio.to_thread(encode_frame, frame, format, quality, scale)
+        )
+        for frame in frames
+    ]
 
-        # Now that all screenshots are taken, read, encode, and delete them
-        encoded_images = []
 
-        for file_path in file_paths:
-            # Read and encode the image
-            with open(file_path, "rb") as image_file:
-                encoded_image = base64.b64encode(image_file.read()).decode("utf-8")
-                encoded_images.append(encoded_image)
+@app.post("/v1/screenshot", response_model=ScreenshotResponseModel)
+async def take_screenshot(
+    count: int = 1,
+    delay: float = 0.0,
+    format: str = "png",
+    quality: int = 90,
+    scale: float = 1.0,
+    x: Optional[int] = None,
+    y: Optional[int] = None,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    window_id: Optional[int] = None,
+    active_window: bool = False,
+) -> ScreenshotResponseModel:
+    try:
+        validate_image_options(format, quality, scale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-            # Delete the file after encoding
-            os.remove(file_path)
+    region = await _screenshot_region(x, y, width, height, window_id, active_window)
+    try:
+        started = time.perf_counter()
+        frames = await _capture_frames(count, delay, region)
+        captured = time.perf_counter()
+
+        encoded = await asyncio.gather(*_encode_frames(frames, format, quality, scale))
+        encoded_images = [
+            base64.b64encode(image).decode("utf-8") for image in encoded
+        ]
+        encoded_at = time.perf_counter()
 
         # Return the list of encoded images
         response = ScreenshotResponseModel(
             status="success",
             images=encoded_images,  # List of all encoded images
+            format=format,
+            timestamps=[frame.timestamp for frame in frames],
+            region=_region_model(region),
+            capture_ms=(captured - started) * 1000,
+            encode_ms=(encoded_at - captured) * 1000,
         )
 
         return response
@@ -334,33 +624,444 @@ async def take_screenshot(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/v1/exec")
-async def exec_command(command: str = Body(..., embed=True)):
-    try:
-        # Execute the provided command
-        result = subprocess.run(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
+@app.post("/v1/screenshot/binary")
+async def take_screenshot_binary(
+    count: int = 1,
+    delay: float = 0.0,
+    format: str = "png",
+    quality: int = 90,
+    scale: float = 1.0,
+    x: Optional[int] = None,
+    y: Optional[int] = None,
+    width: Optional[int] = None,
+    height: Optional[int] = None,
+    window_id: Optional[int] = None,
+    active_window: bool = False,
+):
+    """
+    Same as /v1/screenshot, but returns the encoded image bytes directly instead of
+    base64 in JSON. A single screenshot is returned as the response body; for count > 1
+    the images are streamed as multipart/mixed parts as soon as each is encoded.
+    Capture metadata is sent in X-Capture-* headers.
+    """
+    try:
+        validate_image_options(format, quality, scale)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    media_type = mime_type(format)
+    region = await _screenshot_region(x, y, width, height, window_id, active_window)
+    try:
+        started = time.perf_counter()
+        frames = await _capture_frames(count, delay, region)
+        captured = time.perf_counter()
+        encodes = _encode_frames(frames, format, quality, scale)
+        headers = {
+            "X-Capture-Timestamps": ",".join(str(frame.timestamp) for frame in frames),
+            "X-Capture-Ms": f"{(captured - started) * 1000:.3f}",
+        }
+        if region:
+            headers["X-Capture-Region"] = ",".join(str(v) for v in region)
+
+        if count == 1:
+            image = await encodes[0]
+            headers["X-Encode-Ms"] = f"{(time.perf_counter() - captured) * 1000:.3f}"
+            return Response(content=image, media_type=media_type, headers=headers)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    boundary = uuid.uuid4().hex
+
+    async def parts():
+        try:
+            for frame, encode in zip(frames, encodes):
+                image = await encode
+                part_headers = (
+                    f"--{boundary}\r\n"
+                    f"Content-Type: {media_type}\r\n"
+                    f"Content-Length: {len(image)}\r\n"
+                    f"X-Capture-Timestamp: {frame.timestamp}\r\n\r\n"
+                )
+                yield part_headers.encode() + image + b"\r\n"
+            yield f"--{boundary}--\r\n".encode()
+        finally:
+            for encode in encodes:
+                encode.cancel()
+
+    return StreamingResponse(
+        parts(),
+        media_type=f"multipart/mixed; boundary={boundary}",
+        headers=headers,
+    )
+
+
+@app.post("/v1/screenshot/delta", response_model=DeltaScreenshotResponseModel)
+async def take_delta_screenshot(
+    client_id: str,
+    since: Optional[str] = None,
+    format: str = "png",
+    quality: int = 90,
+    tile_size: int = 64,
+) -> DeltaScreenshotResponseModel:
+    """
+    Takes a screenshot and, when ``since`` names the last frame this client received,
+    returns only the tiles that changed since that frame. Otherwise, or when most of
+    the screen changed, the whole frame is returned as a single tile.
+    """
+    try:
+        validate_image_options(format, quality, 1.0)
+        if not 8 <= tile_size <= 512:
+            raise ValueError("tile_size must be between 8 and 512")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        started = time.perf_counter()
+        frame = (await _capture_frames(1, 0.0))[0]
+        captured = time.perf_counter()
+
+        reference = reference_frames.get(client_id, since) if since else None
+        regions = None
+        if reference is not None and reference.size == frame.size:
+            regions = await asyncio.to_thread(changed_tiles, reference, frame, tile_size)
+            changed_area = sum(w * h for _, _, w, h in regions)
+            # past this point a single full frame encodes smaller and faster
+            if changed_area > DELTA_FULL_FRAME_RATIO * frame.width * frame.height:
+                regions = None
+        full = regions is None
+        if regions is None:
+            regions = [(0, 0, frame.width, frame.height)]
+
+        images = await asyncio.to_thread(encode_regions, frame, regions, format, quality)
+        encoded_at = time.perf_counter()
+        frame_id = reference_frames.put(client_id, frame)
+
+        return DeltaScreenshotResponseModel(
+            status="success",
+            frame_id=frame_id,
+            base_frame_id=None if full else since,
+            full=full,
+            width=frame.width,
+            height=frame.height,
+            format=format,
+            timestamp=frame.timestamp,
+            tiles=[
+                TileModel(
+                    x=x,
+                    y=y,
+                    width=w,
+                    height=h,
+                    image=base64.b64encode(image).decode("utf-8"),
+                )
+                for (x, y, w, h), image in zip(regions, images)
+            ],
+            capture_ms=(captured - started) * 1000,
+            encode_ms=(encoded_at - captured) * 1000,
+        )
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _wait_for_stable(
+    tracker: StabilityTracker, stable_for: float, timeout: float
+) -> Tuple[Optional[Frame], bool]:
+    """
+    Feeds frames from the live capture loop to the tracker until the screen has been
+    stable for ``stable_for`` seconds or ``timeout`` runs out. Returns the last frame
+    (None if none arrived in time) and whether the screen settled.
+    """
+    loop = asyncio.get_running_loop()
+    frames: "asyncio.Queue[tuple[Frame, bool]]" = asyncio.Queue()
+    frame: Optional[Frame] = None
+    settled = False
+    first = True
+
+    deadline = loop.time() + timeout
+    subscription = live_capture.subscribe(
+        lambda f, changed: loop.call_soon_threadsafe(frames.put_nowait, (f, changed)),
+        STABLE_POLL_INTERVAL,
+    )
+    try:
+        while not settled:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                frame, changed = await asyncio.wait_for(frames.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            # the loop's changed flag is relative to its own previous frame, which is not
+            # what the tracker holds when it was seeded with a frame from elsewhere
+            await asyncio.to_thread(tracker.update, frame, changed or first)
+            first = False
+            # the first frame only starts the clock, it cannot show stability
+            settled = (
+                tracker.frames > 1
+                and tracker.stable_for(frame.timestamp) >= stable_for
+            )
+    finally:
+        # the last unsubscribe joins the capture thread
+        await asyncio.to_thread(live_capture.unsubscribe, subscription)
+    return frame, settled
+
+
+@app.post("/v1/screenshot/stable", response_model=StableScreenshotResponseModel)
+async def take_stable_screenshot(
+    stable_for: float = 0.5,
+    timeout: float = 10.0,
+    threshold: float = 0.001,
+    format: str = "png",
+    quality: int = 90,
+    scale: float = 1.0,
+) -> StableScreenshotResponseModel:
+    """
+    Waits until the screen has stopped changing and returns the settled frame. The
+    screen counts as settled once no frame differed from the one before it by more
+    than ``threshold`` (a fraction of the pixels) for ``stable_for`` seconds. If that
+    does not happen within ``timeout`` seconds, the latest frame is returned with
+    ``settled`` set to false.
+    """
+    try:
+        validate_image_options(format, quality, scale)
+        if stable_for <= 0 or timeout <= 0:
+            raise ValueError("stable_for and timeout must be positive")
+        if not 0 <= threshold < 1:
+            raise ValueError("threshold must be at least 0 and less than 1")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    tracker = StabilityTracker(threshold)
+    started = time.time()
+    frame, settled = await _wait_for_stable(tracker, stable_for, timeout)
+
+    if frame is None:
+        raise HTTPException(status_code=500, detail="No frame was captured")
+
+    try:
+        encode_started = time.perf_counter()
+        image = await asyncio.to_thread(encode_frame, frame, format, quality, scale)
+        return StableScreenshotResponseModel(
+            status="success",
+            image=base64.b64encode(image).decode("utf-8"),
+            format=format,
+            timestamp=frame.timestamp,
+            settled=settled,
+            settle_ms=max(0.0, tracker.last_change - started) * 1000,  # type: ignore
+            waited_ms=(time.time() - started) * 1000,
+            frames=tracker.frames,
+            encode_ms=(time.perf_counter() - encode_started) * 1000,
         )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.websocket("/v1/screenshot/stream")
+async def stream_screen(
+    websocket: WebSocket,
+    fps: float = 5.0,
+    format: str = "jpeg",
+    quality: int = 80,
+    scale: float = 1.0,
+):
+    """
+    Streams the screen over a websocket. For every frame a JSON text message with its
+    metadata is sent, followed by a binary message with the encoded image. Frames are
+    sent at most ``fps`` times a second and only when the screen changed; a client
+    that cannot keep up gets the latest frame rather than a backlog. All viewers share
+    one capture loop and viewers with the same options share one encode per frame.
+    """
+    try:
+        validate_image_options(format, quality, scale)
+        if not 0 < fps <= MAX_STREAM_FPS:
+            raise ValueError(f"fps must be greater than 0 and at most {MAX_STREAM_FPS}")
+    except ValueError as e:
+        await websocket.close(code=1008, reason=str(e))
+        return
+
+    await websocket.accept()
+
+    async def send_frames():
+        async with aclosing(
+            screen_stream.frames(1 / fps, format, quality, scale)
+        ) as frames:
+            async for frame, image in frames:
+                await websocket.send_json(
+                    {
+                        "timestamp": frame.timestamp,
+                        "width": frame.width,
+                        "height": frame.height,
+                        "format": format,
+                        "size": len(image),
+                    }
+                )
+                await websocket.send_bytes(image)
+
+    async def wait_for_disconnect():
+        # clients are not expected to send anything, this only notices them leaving
+        while (await websocket.receive())["type"] != "websocket.disconnect":
+            pass
+
+    tasks = [
+        asyncio.create_task(send_frames()),
+        asyncio.create_task(wait_for_disconnect()),
+    ]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        sender = tasks[0]
+        if sender in done and sender.exception():
+            api_logger.error(f"screen stream failed: {sender.exception()}")
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
-        # Check if the command was successful
-        if result.returncode == 0:
-            return {"status": "success", "output": result.stdout.strip()}
-        else:
-            return {
-                "status": "error",
-                "output": result.stderr.strip(),
-                "return_code": result.returncode,
-            }
 
+def _exec_timeout(request: ExecRequestModel) -> float:
+    if request.timeout is not None and request.timeout <= 0:
+        raise HTTPException(status_code=400, detail="timeout must be positive")
+    return request.timeout or EXEC_TIMEOUT
+
+
+@app.post("/v1/exec")
+async def exec_command(request: ExecRequestModel):
+    timeout = _exec_timeout(request)
+    try:
+        result = await command_runner.run(request.command, timeout)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    # Check if the command was successful
+    if result["return_code"] == 0 and not result["timed_out"]:
+        response = {"status": "success", "output": result["stdout"].strip()}
+    else:
+        response = {
+            "status": "error",
+            "output": result["stderr"].strip(),
+            "return_code": result["return_code"],
+        }
+        if result["timed_out"]:
+            response["timed_out"] = True
+    if result["truncated"]:
+        response["truncated"] = True
+    return response
+
+
+@app.post("/v1/exec/stream")
+async def exec_command_stream(request: ExecRequestModel):
+    """
+    Runs a command and streams its output as newline-delimited JSON events while it
+    runs: ``stdout`` and ``stderr`` chunks, then a final ``exit`` event. The command
+    is killed if the client disconnects.
+    """
+    timeout = _exec_timeout(request)
+
+    async def events():
+        async with aclosing(command_runner.stream(request.command, timeout)) as stream:
+            async for event in stream:
+                yield json.dumps(event) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+def _shell_model(session: ShellSession) -> ShellModel:
+    return ShellModel(
+        id=session.id,
+        pid=session.pid,
+        command=session.command,
+        created=session.created,
+        end=session.end,
+        exited=session.exited,
+        return_code=session.return_code,
+    )
+
+
+@app.post("/v1/shells", response_model=ShellModel)
+def create_shell(request: ShellCreateModel) -> ShellModel:
+    """Starts a shell on a pseudo-terminal that stays alive between requests."""
+    if request.rows <= 0 or request.cols <= 0:
+        raise HTTPException(status_code=400, detail="rows and cols must be positive")
+    try:
+        session = shell_sessions.create(
+            command=request.command or SHELL_COMMAND,
+            cwd=request.cwd,
+            env=request.env,
+            rows=request.rows,
+            cols=request.cols,
+        )
+    except SessionLimitError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    except OSError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _shell_model(session)
+
+
+@app.get("/v1/shells", response_model=ShellsModel)
+def list_shells() -> ShellsModel:
+    return ShellsModel(sessions=[_shell_model(s) for s in shell_sessions.list()])
+
+
+def _get_shell(session_id: str) -> ShellSession:
+    try:
+        return shell_sessions.get(session_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.post("/v1/shells/{session_id}/input")
+def shell_input(session_id: str, request: ShellInputModel):
+    session = _get_shell(session_id)
+    try:
+        session.write(request.data)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "success"}
+
+
+@app.post("/v1/shells/{session_id}/resize")
+def shell_resize(session_id: str, request: ShellResizeModel):
+    if request.rows <= 0 or request.cols <= 0:
+        raise HTTPException(status_code=400, detail="rows and cols must be positive")
+    _get_shell(session_id).resize(request.rows, request.cols)
+    return {"status": "success"}
+
+
+@app.get("/v1/shells/{session_id}/output", response_model=ShellOutputModel)
+def shell_output(session_id: str, offset: int = 0, wait: float = 0.0) -> ShellOutputModel:
+    """
+    Returns the output written since ``offset``. With ``wait``, waits up to that many
+    seconds (at most MAX_SHELL_WAIT) for output if there is none yet.
+    """
+    if offset < 0 or wait < 0:
+        raise HTTPException(status_code=400, detail="offset and wait must not be negative")
+    session = _get_shell(session_id)
+    data, start, next_offset, truncated = session.read(offset, min(wait, MAX_SHELL_WAIT))
+    return ShellOutputModel(
+        data=data,
+        offset=start,
+        next_offset=next_offset,
+        truncated=truncated,
+        exited=session.exited,
+        return_code=session.return_code,
+    )
+
+
+@app.delete("/v1/shells/{session_id}")
+def close_shell(session_id: str):
+    try:
+        shell_sessions.close(session_id)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {"status": "success"}
+
+
 @app.post("/v1/use_secret")
-async def use_secret(request: useSecretRequest):
+def use_secret(request: useSecretRequest):
     global active_session
     api_logger.info(f"using secret {request.name} and applying {request.field}")
     try:
@@ -396,12 +1097,8 @@ async def use_secret(request: useSecretRequest):
             else:
                 api_logger.error("secret used but without active session")
 
-            for char in password: 
-                pyautogui.write(
-                    char,
-                    # interval=random.uniform(request.min_interval, request.max_interval),
-                )
-                # time.sleep(random.uniform(request.min_interval, request.max_interval))
+            # typed in order with the other input
+            input_executor.submit(actions.write_text, password, request.mode).result()
             pyperclip.copy(password) # TODO consider copy paste instead of writing
             api_logger.info("secret Text copied to clipboard.")
 
@@ -421,7 +1118,7 @@ async def use_secret(request: useSecretRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/v1/get_secrets")
-async def get_secret(request: getSecretRequest):
+def get_secret(request: getSecretRequest):
     api_logger.info(f"geting secrets: {request.model_dump_json()}")
     try:
         # Get the secret
@@ -475,7 +1172,7 @@ async def system_usage():
 
 
 @app.post("/v1/start_recording", response_model=RecordResponse)
-async def start_recording(request: RecordRequest):
+def start_recording(request: RecordRequest):
     global active_session
     session_id = str(uuid.uuid4())
 
@@ -484,6 +1181,24 @@ async def start_recording(request: RecordRequest):
             status_code=400,
             detail="Either description or task_id must be provided",
         )
+    if request.capture_profile not in CAPTURE_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown capture_profile, must be one of: {', '.join(CAPTURE_PROFILES)}",
+        )
+    if request.image_variants.mode not in ("full", "scaled", "both"):
+        raise HTTPException(
+            status_code=400,
+            detail="image_variants.mode must be one of: full, scaled, both",
+        )
+    try:
+        validate_image_options(
+            request.image_variants.format, request.image_variants.quality, 1.0
+        )
+        if request.image_variants.max_edge < 16:
+            raise ValueError("image_variants.max_edge must be at least 16")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
     if request.description:
         task = Task(
@@ -521,14 +1236,20 @@ async def start_recording(request: RecordRequest):
                 status_code=400,
                 detail="A recording session is already active. Stop it first",
             )
-        session = RecordingSession(id=session_id, task=task)
+        session = RecordingSession(
+            id=session_id,
+            task=task,
+            capture_profile=request.capture_profile,
+            image_variants=request.image_variants,
+            display=SCREEN_DISPLAY,
+        )
         session.start()
         active_session = session
     return RecordResponse(task_id=task.id)
 
 
 @app.post("/v1/stop_recording")
-async def stop_recording(request: StopRequest):
+def stop_recording(request: StopRequest):
     global active_session
     with lock:
         if not active_session:
@@ -545,9 +1266,21 @@ async def stop_recording(request: StopRequest):
 ##
 
 video_recording_process = None
+video_recording_path: Optional[str] = None
 video_recording_lock = threading.Lock()
 video_recordings_dir = "video_recordings"
 os.makedirs(video_recordings_dir, exist_ok=True)
+# finished videos are deleted once older than the retention age, or oldest first once
+# together they take more than the retention size
+VIDEO_RETENTION_SECONDS = float(os.getenv("VIDEO_RETENTION_HOURS", "168")) * 3600
+VIDEO_RETENTION_BYTES = int(os.getenv("VIDEO_RETENTION_MB", "4096")) * 1024 * 1024
+storage.add_retention(
+    video_recordings_dir,
+    max_age=VIDEO_RETENTION_SECONDS,
+    max_bytes=VIDEO_RETENTION_BYTES,
+    # never the video being recorded right now
+    exclude=lambda: [video_recording_path] if video_recording_path else [],
+)
 
 
 class VideoRecordRequest(BaseModel):
@@ -568,8 +1301,8 @@ class VideoRecordModel(BaseModel):
 
 
 @app.post("/v1/start_video_recording", response_model=VideoRecordResponse)
-async def start_video_recording(request: VideoRecordRequest):
-    global video_recording_process
+def start_video_recording(request: VideoRecordRequest):
+    global video_recording_process, video_recording_path
     with video_recording_lock:
         if video_recording_process is not None:
             raise HTTPException(
@@ -593,13 +1326,14 @@ async def start_video_recording(request: VideoRecordRequest):
                 file_path,
             ]
         )
+        video_recording_path = file_path
 
     return VideoRecordResponse(session_id=session_id)
 
 
 @app.post("/v1/stop_video_recording", response_model=VideoRecordModel)
-async def stop_video_recording():
-    global video_recording_process
+def stop_video_recording():
+    global video_recording_process, video_recording_path
     with video_recording_lock:
         if video_recording_process is None:
             raise HTTPException(
@@ -608,6 +1342,7 @@ async def stop_video_recording():
 
         video_recording_process.terminate()
         video_recording_process = None
+        video_recording_path = None
 
         session_id = str(uuid.uuid4())
         file_path = os.path.join(video_recordings_dir, f"{session_id}.mp4")
@@ -616,13 +1351,13 @@ async def stop_video_recording():
 
 
 @app.get("/v1/video_recordings", response_model=VideoRecordings)
-async def list_video_recordings():
+def list_video_recordings():
     recordings = os.listdir(video_recordings_dir)
     return VideoRecordings(recordings=recordings)
 
 
 @app.get("/v1/video_recordings/{session_id}", response_class=FileResponse)
-async def get_video_recording(session_id: str):
+def get_video_recording(session_id: str):
     file_path = os.path.join(video_recordings_dir, f"{session_id}.mp4")
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Recording not found.")
@@ -631,7 +1366,7 @@ async def get_video_recording(session_id: str):
 
 
 @app.delete("/v1/video_recordings/{session_id}", response_model=VideoRecordModel)
-async def delete_video_recording(session_id: str):
+def delete_video_recording(session_id: str):
     file_path = os.path.join(video_recordings_dir, f"{session_id}.mp4")
     if not os.path.exists(file_path):
         raise HTTPException(status_code=404, detail="Recording not found.")
@@ -0,0 +1,312 @@
+import codecs
+import fcntl
+import logging
+import os
+import shlex
+import signal
+import struct
+import subprocess
+import sys
+import termios
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+api_logger = logging.getLogger("api")
+
+# program started for a shell session when the request does not name one
+SHELL_COMMAND = os.getenv("SHELL_SESSION_COMMAND", "/bin/bash")
+# sessions that may exist at once
+SHELL_MAX_SESSIONS = int(os.getenv("SHELL_MAX_SESSIONS", "8"))
+# seconds without input or reads after which a session is closed
+SHELL_IDLE_TIMEOUT = float(os.getenv("SHELL_IDLE_TIMEOUT", "1800"))
+# output kept per session; older output is dropped and can no longer be read
+SHELL_BUFFER_BYTES = int(os.getenv("SHELL_BUFFER_KB", "1024")) * 1024
+# seconds a session gets to exit after SIGHUP before it is killed
+SHELL_KILL_GRACE_SECONDS = 2.0
+READ_CHUNK_BYTES = 64 * 1024
+# run in the child instead of a preexec_fn, which is not safe to use from a threaded
+# server: makes the pty, already stdin, the controlling terminal, then execs the command
+_CONTROLLING_TTY_HELPER = (
+    "import fcntl, os, sys, termios; "
+    "fcntl.ioctl(0, termios.TIOCSCTTY, 0); "
+    "os.execvp(sys.argv[1], sys.argv[1:])"
+)
+
+
+class SessionLimitError(Exception):
+    """Raised when a session is requested while the maximum number exist."""
+
+
+def _complete_utf8(data: bytes) -> int:
+    """The length of the longest prefix of ``data`` that does not end mid-character."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    decoder.decode(data)
+    return len(data) - len(decoder.getstate()[0])
+
+
+class ShellSession:
+    """
+    A shell running on a pseudo-terminal, kept alive between requests so its working
+    directory, environment and shell state carry over from one command to the next.
+
+    Everything the shell writes is appended to a buffer addressed by absolute byte
+    offsets: the first byte it ever wrote is offset 0. Readers pass the offset they
+    got back last time and receive only what is new. The buffer keeps the last
+    ``buffer_size`` bytes; reading from an offset that was dropped returns what is
+    left and says so.
+    """
+
+    def __init__(
+        self,
+        command: str = SHELL_COMMAND,
+        cwd: Optional[str] = None,
+        env: Optional[Dict[str, str]] = None,
+        rows: int = 24,
+        cols: int = 80,
+        buffer_size: int = SHELL_BUFFER_BYTES,
+    ) -> None:
+        self.id = uuid.uuid4().hex
+        self.command = command
+        self.buffer_size = buffer_size
+        self.created = time.time()
+        self.last_used = time.monotonic()
+        # absolute offset of the first byte in the buffer
+        self._start = 0
+        self._buffer = bytearray()
+        self._changed = threading.Condition()
+        self._closed = False
+
+        argv = shlex.split(command)
+        if not argv:
+            raise ValueError("command must not be empty")
+        master, slave = os.openpty()
+        self._set_size(slave, rows, cols)
+        shell_env = {**os.environ, "TERM": "dumb", **(env or {})}
+        try:
+            self.process = subprocess.Popen(
+                # the pty becomes the controlling terminal, so job control and ^C work
+                [sys.executable, "-c", _CONTROLLING_TTY_HELPER, *argv],
+                stdin=slave,
+                stdout=slave,
+                stderr=slave,
+                cwd=cwd,
+                env=shell_env,
+                start_new_session=True,
+            )
+        except Exception:
+            os.close(master)
+            raise
+        finally:
+            os.close(slave)
+        self._master = master
+        self._reader = threading.Thread(
+            target=self._read, name=f"shell-{self.id[:8]}", daemon=True
+        )
+        self._reader.start()
+
+    @property
+    def pid(self) -> int:
+        return self.process.pid
+
+    @property
+    def exited(self) -> bool:
+        return self.process.poll() is not None
+
+    @property
+    def return_code(self) -> Optional[int]:
+        return self.process.poll()
+
+    @property
+    def end(self) -> int:
+        """The offset after the last byte written so far."""
+        return self._start + len(self._buffer)
+
+    def write(self, data: str) -> None:
+        """Sends input to the shell, as if typed; include "\\n" to run a command."""
+        if self._closed or self.exited:
+            raise ValueError("The shell has exited")
+        self.last_used = time.monotonic()
+        payload = data.encode("utf-8")
+        while payload:
+            written = os.write(self._master, payload)
+            payload = payload[written:]
+
+    def read(self, offset: int = 0, wait: float = 0.0) -> Tuple[str, int, int, bool]:
+        """
+        Returns the output from ``offset`` on as (text, start offset, next offset,
+        truncated). If there is none yet, waits up to ``wait`` seconds for some.
+        ``truncated`` is set if part of the requested output was already dropped.
+        """
+        if offset < 0:
+            raise ValueError("offset must not be negative")
+        self.last_used = time.monotonic()
+        deadline = time.monotonic() + wait
+        with self._changed:
+            while self.end <= offset and not self._reader_done():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+            start = max(offset, self._start)
+            data = bytes(self._buffer[start - self._start :])
+        # a character split over two reads is returned whole by the second one
+        complete = data if self._reader_done() else data[: _complete_utf8(data)]
+        return (
+            complete.decode("utf-8", errors="replace"),
+            start,
+            start + len(complete),
+            start > offset,
+        )
+
+    def resize(self, rows: int, cols: int) -> None:
+        self._set_size(self._master, rows, cols)
+        self.last_used = time.monotonic()
+
+    def close(self) -> None:
+        """Hangs up the shell, kills it if it does not exit, and frees the terminal."""
+        if self._closed:
+            return
+        self._closed = True
+        self._signal(signal.SIGHUP)
+        try:
+            self.process.wait(SHELL_KILL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            self._signal(signal.SIGKILL)
+            self.process.wait()
+        self._reader.join(SHELL_KILL_GRACE_SECONDS)
+        try:
+            os.close(self._master)
+        except OSError:
+            pass
+
+    def _signal(self, sig: int) -> None:
+        # the shell leads a session of its own, this reaches its jobs as well
+        try:
+            os.killpg(self.process.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def _reader_done(self) -> bool:
+        return not self._reader.is_alive()
+
+    def _read(self) -> None:
+        while True:
+            try:
+                data = os.read(self._master, READ_CHUNK_BYTES)
+            except OSError:
+                # EIO once the shell and everything holding the terminal exited
+                data = b""
+            with self._changed:
+                if data:
+                    self._buffer += data
+                    overflow = len(self._buffer) - self.buffer_size
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self._start += overflow
+                self._changed.notify_all()
+            if not data:
+                break
+
+    @staticmethod
+    def _set_size(fd: int, rows: int, cols: int) -> None:
+        fcntl.ioctl(fd, termios.TIOCSWINSZ, struct.pack("HHHH", rows, cols, 0, 0))
+
+
+class ShellSessionManager:
+    """
+    Keeps the shell sessions, at most ``max_sessions`` at once. A reaper thread
+    closes sessions whose shell has exited and those that have not been used for
+    ``idle_timeout`` seconds.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SHELL_MAX_SESSIONS,
+        idle_timeout: float = SHELL_IDLE_TIMEOUT,
+    ) -> None:
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self._sessions: Dict[str, ShellSession] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+
+    def create(self, **kwargs) -> ShellSession:
+        """
+        Starts a session, see ShellSession for the arguments. Raises
+        SessionLimitError if the maximum number of sessions exist.
+        """
+        self.reap()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                raise SessionLimitError(
+                    f"{self.max_sessions} shell sessions exist, close one first"
+                )
+            session = ShellSession(**kwargs)
+            self._sessions[session.id] = session
+        self._ensure_reaper()
+        api_logger.info(f"shell session {session.id} started: {session.command}")
+        return session
+
+    def get(self, session_id: str) -> ShellSession:
+        """Raises LookupError if there is no such session."""
+        with self._lock:
+            session = self._sessions.get(session_id)
+        if session is None:
+            raise LookupError(f"shell session {session_id} not found")
+        return session
+
+    def list(self) -> List[ShellSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def close(self, session_id: str) -> None:
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            raise LookupError(f"shell session {session_id} not found")
+        session.close()
+        api_logger.info(f"shell session {session_id} closed")
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), {}
+        for session in sessions:
+            session.close()
+
+    def reap(self) -> None:
+        """
+        Closes the sessions whose shell has exited and those that have been idle for
+        longer than the idle timeout.
+        """
+        now = time.monotonic()
+        with self._lock:
+            done = [
+                session
+                for session in self._sessions.values()
+                if session.exited or now - session.last_used > self.idle_timeout
+            ]
+            for session in done:
+                del self._sessions[session.id]
+        for session in done:
+            reason = "exited" if session.exited else "idle"
+            api_logger.info(f"shell session {session.id} {reason}, closing it")
+            session.close()
+
+    def _ensure_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(
+                target=self._reap_forever, name="shell-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap_forever(self) -> None:
+        while True:
+            time.sleep(min(60.0, self.idle_timeout / 2))
+            try:
+                self.reap()
+            except Exception as e:
+                api_logger.error(f"shell reaper failed: {e}")
@@ -0,0 +1,308 @@
+import logging
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+recording_logger = logging.getLogger("recording")
+
+
+def prune_directory(
+    directory: str,
+    max_age: Optional[float] = None,
+    max_bytes: Optional[int] = None,
+    exclude: Iterable[str] = (),
+    now: Optional[float] = None,
+) -> List[str]:
+    """
+    Returns the files in a directory that fall outside a retention policy: files
+    older than ``max_age`` seconds, then the oldest remaining files until the rest
+    fit in ``max_bytes``. Paths in ``exclude`` are never returned.
+    """
+    now = time.time() if now is None else now
+    excluded = {os.path.abspath(path) for path in exclude}
+    files: List[Tuple[float, int, str]] = []
+    try:
+        entries = list(os.scandir(directory))
+    except FileNotFoundError:
+        return []
+    for entry in entries:
+        if not entry.is_file() or os.path.abspath(entry.path) in excluded:
+            continue
+        stat = entry.stat()
+        files.append((stat.st_mtime, stat.st_size, entry.path))
+    files.sort()
+
+    expired = []
+    if max_age is not None:
+        while files and now - files[0][0] > max_age:
+            expired.append(files.pop(0)[2])
+    if max_bytes is not None:
+        total = sum(size for _, size, _ in files)
+        while files and total > max_bytes:
+            _, size, path = files.pop(0)
+            expired.append(path)
+            total -= size
+    return expired
+
+
+class _Retention:
+    def __init__(
+        self,
+        directory: str,
+        max_age: Optional[float],
+        max_bytes: Optional[int],
+        exclude: Callable[[], Iterable[str]],
+    ) -> None:
+        self.directory = directory
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.exclude = exclude
+
+
+class _Session:
+    def __init__(
+        self,
+        on_evict: Callable[[str], None],
+        is_referenced: Callable[[str], bool],
+    ) -> None:
+        self.on_evict = on_evict
+        self.is_referenced = is_referenced
+        self.size = 0
+
+
+class StorageManager:
+    """
+    Keeps the files written by recording sessions within disk quotas.
+
+    Sessions register every file they write. When a session goes over
+    ``session_quota`` bytes, or all sessions together over ``global_quota``, the
+    least recently used files are evicted until the usage is back under quota. Files
+    the session still references, or used within the last ``min_age`` seconds, are
+    never evicted. The session is told about each eviction so it can forget the file.
+
+    Deleting files (and whole session directories) happens on a background reaper
+    thread, which also applies the retention policies of other directories such as
+    video recordings every ``retention_interval`` seconds.
+    """
+
+    def __init__(
+        self,
+        session_quota: int,
+        global_quota: int,
+        min_age: float = 10.0,
+        retention_interval: float = 60.0,
+    ) -> None:
+        self.session_quota = session_quota
+        self.global_quota = global_quota
+        self.min_age = min_age
+        self.retention_interval = retention_interval
+        self.evicted = 0
+        self._size = 0
+        # path -> [session id, size, last used], least recently used first
+        self._files: "OrderedDict[str, list]" = OrderedDict()
+        self._sessions: Dict[str, _Session] = {}
+        self._retentions: List[_Retention] = []
+        self._lock = threading.Lock()
+        # paths to delete, and flush markers
+        self._deletions: queue.Queue = queue.Queue()
+        self._reaper: Optional[threading.Thread] = None
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def session_size(self, session_id: str) -> int:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session.size if session else 0
+
+    def add_session(
+        self,
+        session_id: str,
+        on_evict: Callable[[str], None],
+        is_referenced: Callable[[str], bool],
+    ) -> None:
+        with self._lock:
+            self._sessions[session_id] = _Session(on_evict, is_referenced)
+
+    def remove_session(self, session_id: str, directory: Optional[str] = None) -> None:
+        """Stops accounting for a session and deletes its directory in the background."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            for path in [p for p, entry in self._files.items() if entry[0] == session_id]:
+                self._size -= self._files.pop(path)[1]
+        if directory and os.path.isdir(directory):
+            self.delete(directory)
+
+    def add_file(self, session_id: str, path: str) -> None:
+        """Accounts for a file a session wrote and evicts old files if over quota."""
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or path in self._files:
+                return
+            self._files[path] = [session_id, size, time.monotonic()]
+            session.size += size
+            self._size += size
+            evictions = self._select_evictions(session_id)
+
+        for path, owner in evictions:
+            self.delete(path)
+            try:
+                owner.on_evict(path)
+            except Exception as e:
+                recording_logger.error(f"storage eviction callback failed for {path}: {e}")
+
+    def touch(self, paths: Iterable[str]) -> None:
+        """Marks files as just used, moving them to the back of the eviction order."""
+        now = time.monotonic()
+        with self._lock:
+            for path in paths:
+                entry = self._files.get(path)
+                if entry is not None:
+                    entry[2] = now
+                    self._files.move_to_end(path)
+
+    def add_retention(
+        self,
+        directory: str,
+        max_age: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        exclude: Callable[[], Iterable[str]] = lambda: (),
+    ) -> None:
+        """Applies a retention policy to a directory periodically on the reaper thread."""
+        with self._lock:
+            self._retentions.append(_Retention(directory, max_age, max_bytes, exclude))
+        self._ensure_reaper()
+
+    def apply_retention(self) -> None:
+        """Applies the retention policies now, on the calling thread."""
+        with self._lock:
+            retentions = list(self._retentions)
+        for retention in retentions:
+            for path in prune_directory(
+                retention.directory,
+                retention.max_age,
+                retention.max_bytes,
+                retention.exclude(),
+            ):
+                recording_logger.info(f"retention: removing {path}")
+                self._remove(path)
+
+    def delete(self, path: str) -> None:
+        """
+        Queues a file or directory for deletion on the reaper thread. It is renamed
+        first, so it is gone from its old path right away and a new file written
+        under the same name is not deleted by mistake.
+        """
+        doomed = f"{path}.deleting-{uuid.uuid4().hex[:8]}"
+        try:
+            os.rename(path, doomed)
+        except FileNotFoundError:
+            return
+        except OSError:
+            doomed = path
+        self._ensure_reaper()
+        self._deletions.put(doomed)
+
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """Waits until every queued deletion is done."""
+        done = threading.Event()
+        self._ensure_reaper()
+        self._deletions.put(done)
+        done.wait(timeout)
+
+    def usage(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "bytes": self._size,
+                "files": len(self._files),
+                "sessions": len(self._sessions),
+                "evicted": self.evicted,
+            }
+
+    def _select_evictions(self, session_id: str) -> List[Tuple[str, _Session]]:
+        """Picks files to evict, oldest first, and removes them from the accounting."""
+        evictions: List[Tuple[str, _Session]] = []
+        now = time.monotonic()
+        session = self._sessions[session_id]
+
+        def over_quota() -> bool:
+            return session.size > self.session_quota or self._size > self.global_quota
+
+        if not over_quota():
+            return evictions
+        for path, (owner_id, size, last_used) in list(self._files.items()):
+            if not over_quota():
+                break
+            # over the global quota any session's files go, otherwise only this one's
+            if owner_id != session_id and self._size <= self.global_quota:
+                continue
+            if now - last_used < self.min_age:
+                # files are ordered by last use, everything after this is newer
+                break
+            owner = self._sessions.get(owner_id)
+            if owner is None or owner.is_referenced(path):
+                continue
+            del self._files[path]
+            owner.size -= size
+            self._size -= size
+            self.evicted += 1
+            evictions.append((path, owner))
+
+        if over_quota():
+            recording_logger.warning(
+                f"storage over quota and nothing left to evict: session {session_id}: "
+                f"{session.size} bytes, total: {self._size} bytes"
+            )
+        return evictions
+
+    def _ensure_reaper(self) -> None:
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(
+                target=self._reap, name="storage-reaper", daemon=True
+            )
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        next_retention = time.monotonic()
+        while True:
+            if time.monotonic() >= next_retention:
+                try:
+                    self.apply_retention()
+                except Exception as e:
+                    recording_logger.error(f"retention failed: {e}")
+                next_retention = time.monotonic() + self.retention_interval
+            try:
+                item = self._deletions.get(
+                    timeout=max(0.0, next_retention - time.monotonic())
+                )
+            except queue.Empty:
+                continue
+            if isinstance(item, threading.Event):
+                # a flush marker, everything queued before it is done
+                item.set()
+            else:
+                self._remove(item)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            recording_logger.error(f"could not delete {path}: {e}")
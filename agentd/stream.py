@@ -0,0 +1,111 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Optional, Tuple
+
+from .capture import Frame, LiveCapture
+from .encoding import encode_frame
+
+capture_logger = logging.getLogger("capture")
+
+
+class _Subscriber:
+    """
+    Holds the one frame waiting to be sent to a stream consumer. A newer frame
+    replaces it rather than queueing behind it, so a slow consumer skips frames
+    instead of falling behind.
+    """
+
+    def __init__(self) -> None:
+        self.pending: Optional[Frame] = None
+        self.ready = asyncio.Event()
+        # the first frame is always sent, whether or not it changed
+        self.dirty = True
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, frame: Frame, changed: bool) -> None:
+        if changed:
+            self.dirty = True
+        if not self.dirty:
+            return
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = frame
+        self.ready.set()
+
+    def take(self) -> Frame:
+        frame = self.pending
+        assert frame is not None
+        self.pending = None
+        self.dirty = False
+        self.ready.clear()
+        self.sent += 1
+        return frame
+
+
+class ScreenStream:
+    """
+    Turns the shared live capture into paced streams of encoded frames.
+
+    Every consumer gets at most one frame per ``interval`` and only when the screen
+    changed since the last frame it was sent. Consumers that ask for the same
+    encoding options share a single encode of each frame.
+    """
+
+    def __init__(self, live: LiveCapture, max_encodes: int = 8) -> None:
+        self.live = live
+        self.max_encodes = max_encodes
+        self._encodes: "OrderedDict[tuple, asyncio.Future[bytes]]" = OrderedDict()
+
+    async def frames(
+        self,
+        interval: float,
+        format: str = "jpeg",
+        quality: int = 80,
+        scale: float = 1.0,
+    ) -> AsyncIterator[Tuple[Frame, bytes]]:
+        """
+        Yields (frame, encoded image) pairs. Close the iterator (e.g. with
+        ``contextlib.aclosing``) to stop the subscription.
+        """
+        loop = asyncio.get_running_loop()
+        subscriber = _Subscriber()
+        subscription = self.live.subscribe(
+            lambda frame, changed: loop.call_soon_threadsafe(
+                subscriber.offer, frame, changed
+            ),
+            interval,
+        )
+        try:
+            next_due = loop.time()
+            while True:
+                await subscriber.ready.wait()
+                delay = next_due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                frame = subscriber.take()
+                # a consumer that falls behind is not allowed to catch up in a burst
+                next_due = max(next_due + interval, loop.time())
+                yield frame, await self._encode(frame, format, quality, scale)
+        finally:
+            capture_logger.info(
+                f"screen stream closed: sent: {subscriber.sent} dropped: {subscriber.dropped}"
+            )
+            # the last unsubscribe joins the capture thread
+            await asyncio.to_thread(self.live.unsubscribe, subscription)
+
+    async def _encode(
+        self, frame: Frame, format: str, quality: int, scale: float
+    ) -> bytes:
+        key = (id(frame), frame.timestamp, format, quality, scale)
+        encode = self._encodes.get(key)
+        if encode is None:
+            encode = asyncio.ensure_future(
+                asyncio.to_thread(encode_frame, frame, format, quality, scale)
+            )
+            self._encodes[key] = encode
+            while len(self._encodes) > self.max_encodes:
+                self._encodes.popitem(last=False)
+        # shielded so a consumer going away does not cancel an encode others wait on
+        return await asyncio.shield(encode)
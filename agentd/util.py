@@ -1,8 +1,12 @@
 import os
 import pwd
+import re
 import subprocess
 import threading
 import queue
+from typing import List
+
+import psutil
 
 
 def run_as_user(command, username):
@@ -17,6 +21,21 @@ def run_as_user(command, username):
 
     return subprocess.Popen(command, preexec_fn=preexec_fn)
 
+
+def find_processes(pattern: str) -> List[int]:
+    """
+    Returns the PIDs of the processes whose command line matches a regex, like
+    ``pgrep -f`` but without forking it. This process is never included.
+    """
+    regex = re.compile(pattern)
+    pids = []
+    for process in psutil.process_iter(["cmdline"]):
+        cmdline = " ".join(process.info["cmdline"] or [])
+        if process.pid != os.getpid() and regex.search(cmdline):
+            pids.append(process.pid)
+    return pids
+
+
 def log_subprocess_output(pipe, sub_process):
     for line in iter(pipe.readline, b''): # b'\n'-separated lines
         if line:  # Check if the line is not empty
@@ -0,0 +1,484 @@
+import logging
+import select
+import threading
+import time
+from typing import (
+    Callable,
+    Collection,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+    Union,
+)
+
+from Xlib import X, Xutil, display as xdisplay, error as xerror
+from Xlib.protocol import event as xevent
+
+from .capture import Region
+
+capture_logger = logging.getLogger("capture")
+
+T = TypeVar("T")
+
+# a single X connection is kept open for window lookups instead of connecting (or
+# shelling out to xdotool) on every request; Xlib connections are not thread safe, so
+# every use goes through the lock
+_display: Optional[xdisplay.Display] = None
+_display_lock = threading.Lock()
+
+
+def _get_display(name: Optional[str]) -> xdisplay.Display:
+    global _display
+    if _display is None:
+        _display = xdisplay.Display(name)
+    return _display
+
+
+def _reset_display() -> None:
+    global _display
+    if _display is not None:
+        try:
+            _display.close()
+        except Exception:
+            pass
+    _display = None
+
+
+# seconds the first query waits for the tracker to read the window tree
+TRACKER_READY_TIMEOUT = 2.0
+# how often the tracker thread wakes up to check whether it should stop
+TRACKER_POLL_SECONDS = 1.0
+TRACKER_RECONNECT_SECONDS = 1.0
+# the wait between reconnects doubles while the display stays unreachable, up to this
+TRACKER_RECONNECT_MAX_SECONDS = 30.0
+
+
+class WindowInfo:
+    """A top-level window as the window manager lists it."""
+
+    __slots__ = (
+        "id",
+        "frame",
+        "title",
+        "wm_class",
+        "pid",
+        "x",
+        "y",
+        "width",
+        "height",
+        "visible",
+    )
+
+    def __init__(self, window_id: int) -> None:
+        self.id = window_id
+        # the window manager's frame the window is reparented into, or the window
+        self.frame = window_id
+        self.title = ""
+        self.wm_class: Tuple[str, ...] = ()
+        self.pid: Optional[int] = None
+        self.x = self.y = self.width = self.height = 0
+        self.visible = False
+
+    def copy(self) -> "WindowInfo":
+        info = WindowInfo(self.id)
+        for name in self.__slots__:
+            setattr(info, name, getattr(self, name))
+        return info
+
+    def matches(self, wm_class: str) -> bool:
+        """Whether the WM_CLASS instance or class name contains ``wm_class``."""
+        return any(wm_class.lower() in name.lower() for name in self.wm_class)
+
+    @property
+    def region(self) -> Region:
+        return self.x, self.y, self.width, self.height
+
+
+class WindowTracker:
+    """
+    Keeps an in-memory copy of the window manager's client list, so questions like
+    "is a Firefox window open" or "where is window X" are answered without a round
+    trip to the X server, let alone forking xdotool or wmctrl.
+
+    A background thread holds a connection of its own and listens for the client
+    list and active window changing on the root window, and for each client being
+    configured, mapped, unmapped, renamed or destroyed. Waiters are woken up on every
+    change. If the connection drops the tree is cleared and rebuilt on reconnect.
+    """
+
+    # events selected on every client window
+    CLIENT_EVENTS = X.PropertyChangeMask | X.StructureNotifyMask
+
+    def __init__(self, display: Optional[str] = None) -> None:
+        self.display_name = display
+        self._windows: Dict[int, WindowInfo] = {}
+        # frame window id -> client window id
+        self._frames: Dict[int, int] = {}
+        self._active: Optional[int] = None
+        self._changed = threading.Condition()
+        self._ready = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = False
+        self._atoms: Dict[str, int] = {}
+
+    def start(self) -> None:
+        """Starts tracking and waits briefly for the first copy of the tree."""
+        with self._changed:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopped = False
+                self._thread = threading.Thread(
+                    target=self._run, name="window-tracker", daemon=True
+                )
+                self._thread.start()
+        self._ready.wait(TRACKER_READY_TIMEOUT)
+
+    def stop(self) -> None:
+        self._stopped = True
+        if self._thread is not None:
+            self._thread.join()
+
+    def windows(self) -> List[WindowInfo]:
+        with self._changed:
+            return [info.copy() for info in self._windows.values()]
+
+    def get(self, window_id: int) -> Optional[WindowInfo]:
+        with self._changed:
+            info = self._windows.get(window_id)
+            return info.copy() if info else None
+
+    def active_window(self) -> Optional[int]:
+        return self._active
+
+    def find(self, wm_class: str, visible_only: bool = True) -> List[WindowInfo]:
+        return [
+            info
+            for info in self.windows()
+            if info.matches(wm_class) and (info.visible or not visible_only)
+        ]
+
+    def wait_for(
+        self, predicate: Callable[[List[WindowInfo]], Optional[T]], timeout: float
+    ) -> Optional[T]:
+        """
+        Calls ``predicate`` with the windows now and after every change until it
+        returns something truthy, which is returned, or ``timeout`` runs out.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                result = predicate([info.copy() for info in self._windows.values()])
+                if result:
+                    return result
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return None
+                self._changed.wait(remaining)
+
+    def _run(self) -> None:
+        delay = TRACKER_RECONNECT_SECONDS
+        # set while the display is unreachable, an outage is logged once
+        outage = False
+        while not self._stopped:
+            d = None
+            try:
+                d = xdisplay.Display(self.display_name)
+                if outage:
+                    capture_logger.info("window tracker: display reachable again")
+                    outage = False
+                delay = TRACKER_RECONNECT_SECONDS
+                # requests racing a window's destruction fail, that is expected
+                d.set_error_handler(lambda *args: None)
+                self._track(d)
+            except Exception as e:
+                if d is None and outage:
+                    capture_logger.debug(f"window tracker: display still unreachable: {e}")
+                else:
+                    capture_logger.error(f"window tracker: {e}")
+                outage = outage or d is None
+            finally:
+                if d is not None:
+                    try:
+                        d.close()
+                    except Exception:
+                        pass
+                with self._changed:
+                    self._windows.clear()
+                    self._frames.clear()
+                    self._active = None
+                    self._changed.notify_all()
+                # queries should not wait for a display that is not there
+                self._ready.set()
+            if not self._stopped:
+                time.sleep(delay)
+                if outage:
+                    delay = min(delay * 2, TRACKER_RECONNECT_MAX_SECONDS)
+
+    def _track(self, d: xdisplay.Display) -> None:
+        root = d.screen().root
+        self._atoms = {
+            name: d.intern_atom(name)
+            for name in (
+                "_NET_CLIENT_LIST",
+                "_NET_ACTIVE_WINDOW",
+                "_NET_WM_NAME",
+                "_NET_WM_PID",
+                "UTF8_STRING",
+                "WM_NAME",
+                "WM_CLASS",
+            )
+        }
+        # subscribe before reading the tree, so no change falls in between
+        root.change_attributes(event_mask=X.PropertyChangeMask | X.SubstructureNotifyMask)
+        self._sync_clients(d)
+        self._read_active(d)
+        self._ready.set()
+        capture_logger.info(f"window tracker: tracking {len(self._windows)} windows")
+
+        while not self._stopped:
+            if not d.pending_events():
+                select.select([d], [], [], TRACKER_POLL_SECONDS)
+                if not d.pending_events():
+                    continue
+            self._handle(d, d.next_event())
+
+    def _handle(self, d: xdisplay.Display, event) -> None:
+        root = d.screen().root
+        window = getattr(event, "window", None)
+        if window is None:
+            return
+        window_id = window.id
+        if event.type == X.PropertyNotify:
+            if window_id == root.id:
+                if event.atom == self._atoms["_NET_CLIENT_LIST"]:
+                    self._sync_clients(d)
+                elif event.atom == self._atoms["_NET_ACTIVE_WINDOW"]:
+                    self._read_active(d)
+            elif window_id in self._windows and event.atom in (
+                self._atoms["_NET_WM_NAME"],
+                self._atoms["WM_NAME"],
+                self._atoms["WM_CLASS"],
+                self._atoms["_NET_WM_PID"],
+            ):
+                self._update(d, window_id)
+        elif event.type in (
+            X.ConfigureNotify,
+            X.MapNotify,
+            X.UnmapNotify,
+            X.ReparentNotify,
+        ):
+            # moves come in on the frame, resizes and mapping on the client
+            client = self._frames.get(window_id, window_id)
+            if client in self._windows:
+                self._update(d, client)
+        elif event.type == X.DestroyNotify and window_id in self._windows:
+            self._remove(window_id)
+
+    def _sync_clients(self, d: xdisplay.Display) -> None:
+        prop = d.screen().root.get_full_property(
+            self._atoms["_NET_CLIENT_LIST"], X.AnyPropertyType
+        )
+        clients = [int(w) for w in prop.value] if prop is not None else []
+        for window_id in [w for w in self._windows if w not in clients]:
+            self._remove(window_id)
+        for window_id in clients:
+            if window_id not in self._windows:
+                window = d.create_resource_object("window", window_id)
+                window.change_attributes(event_mask=self.CLIENT_EVENTS)
+                self._update(d, window_id)
+
+    def _read_active(self, d: xdisplay.Display) -> None:
+        prop = d.screen().root.get_full_property(
+            self._atoms["_NET_ACTIVE_WINDOW"], X.AnyPropertyType
+        )
+        active = int(prop.value[0]) if prop is not None and len(prop.value) else 0
+        with self._changed:
+            self._active = active or None
+            self._changed.notify_all()
+
+    def _update(self, d: xdisplay.Display, window_id: int) -> None:
+        """Reads a window's properties and geometry from the server."""
+        root = d.screen().root
+        window = d.create_resource_object("window", window_id)
+        try:
+            info = WindowInfo(window_id)
+            info.frame = self._frame_of(window, root.id)
+            info.wm_class = tuple(window.get_wm_class() or ())
+            info.title = self._title(window)
+            pid = window.get_full_property(self._atoms["_NET_WM_PID"], X.AnyPropertyType)
+            info.pid = int(pid.value[0]) if pid is not None and len(pid.value) else None
+            info.visible = window.get_attributes().map_state == X.IsViewable
+            geometry = window.get_geometry()
+            # get_geometry is relative to the frame, translate the origin to the root
+            origin = root.translate_coords(window, 0, 0)
+        except (xerror.BadWindow, xerror.BadDrawable):
+            self._remove(window_id)
+            return
+        info.x, info.y = origin.x, origin.y
+        info.width, info.height = geometry.width, geometry.height
+        with self._changed:
+            previous = self._windows.get(window_id)
+            if previous is not None and previous.frame != info.frame:
+                self._frames.pop(previous.frame, None)
+            self._windows[window_id] = info
+            if info.frame != window_id:
+                self._frames[info.frame] = window_id
+            self._changed.notify_all()
+
+    def _remove(self, window_id: int) -> None:
+        with self._changed:
+            info = self._windows.pop(window_id, None)
+            if info is not None:
+                self._frames.pop(info.frame, None)
+            self._changed.notify_all()
+
+    def _title(self, window) -> str:
+        prop = window.get_full_property(
+            self._atoms["_NET_WM_NAME"], self._atoms["UTF8_STRING"]
+        )
+        if prop is not None and prop.value:
+            value = prop.value
+            return value.decode("utf-8", "replace") if isinstance(value, bytes) else str(value)
+        name = window.get_wm_name()
+        if isinstance(name, bytes):
+            return name.decode("latin-1")
+        return name or ""
+
+    @staticmethod
+    def _frame_of(window, root_id: int) -> int:
+        """The ancestor of a window that is a child of the root window."""
+        while True:
+            parent = window.query_tree().parent
+            if parent is None or parent.id == root_id or parent.id == 0:
+                return window.id
+            window = parent
+
+
+_trackers: Dict[Optional[str], WindowTracker] = {}
+_trackers_lock = threading.Lock()
+
+
+def get_window_tracker(display: Optional[str] = None) -> WindowTracker:
+    """Returns the window tracker for a display, starting it on first use."""
+    with _trackers_lock:
+        tracker = _trackers.get(display)
+        if tracker is None:
+            tracker = _trackers[display] = WindowTracker(display)
+    tracker.start()
+    return tracker
+
+
+def get_active_window(display: Optional[str] = None) -> Optional[int]:
+    """Returns the id of the focused window as reported by the window manager."""
+    return get_window_tracker(display).active_window()
+
+
+def get_window_geometry(window_id: int, display: Optional[str] = None) -> Region:
+    """
+    Returns the (x, y, width, height) of a window in root window coordinates.
+    Raises LookupError if there is no such window.
+    """
+    info = get_window_tracker(display).get(window_id)
+    if info is not None:
+        return info.region
+
+    # not a top-level window, e.g. a child window, ask the server
+    with _display_lock:
+        try:
+            d = _get_display(display)
+            root = d.screen().root
+            window = d.create_resource_object("window", window_id)
+            geometry = window.get_geometry()
+            origin = root.translate_coords(window, 0, 0)
+        except (xerror.BadWindow, xerror.BadDrawable):
+            raise LookupError(f"window {window_id} not found")
+        except xerror.ConnectionClosedError:
+            _reset_display()
+            raise
+    capture_logger.debug(
+        f"window {window_id} geometry: {origin.x},{origin.y} {geometry.width}x{geometry.height}"
+    )
+    return origin.x, origin.y, geometry.width, geometry.height
+
+
+def find_windows(wm_class: str, display: Optional[str] = None) -> List[int]:
+    """Returns the visible windows whose WM_CLASS contains ``wm_class``."""
+    return [info.id for info in get_window_tracker(display).find(wm_class)]
+
+
+def wait_for_window(
+    wm_class: str,
+    timeout: float,
+    display: Optional[str] = None,
+    exclude: Collection[int] = (),
+) -> Optional[int]:
+    """
+    Waits up to ``timeout`` seconds for a visible window whose WM_CLASS contains
+    ``wm_class``, other than the windows in ``exclude``, and returns its id, or None
+    on timeout. The tracker wakes it up on every change, there is no polling.
+    """
+
+    def first_match(windows: List[WindowInfo]) -> Optional[int]:
+        for info in windows:
+            if info.visible and info.matches(wm_class) and info.id not in exclude:
+                return info.id
+        return None
+
+    return get_window_tracker(display).wait_for(first_match, timeout)
+
+
+def _send_to_window_manager(
+    window_id: int, message: str, data: Sequence[Union[int, str]], display: Optional[str]
+) -> None:
+    """
+    Sends a client message about a window to the window manager, as EWMH asks.
+    Strings in ``data`` are atom names.
+    """
+    with _display_lock:
+        try:
+            d = _get_display(display)
+            root = d.screen().root
+            window = d.create_resource_object("window", window_id)
+            values = [d.intern_atom(v) if isinstance(v, str) else v for v in data]
+            padded = values + [0] * (5 - len(values))
+            root.send_event(
+                xevent.ClientMessage(
+                    window=window,
+                    client_type=d.intern_atom(message),
+                    data=(32, padded),
+                ),
+                event_mask=X.SubstructureRedirectMask | X.SubstructureNotifyMask,
+            )
+            d.sync()
+        except (xerror.BadWindow, xerror.BadDrawable):
+            raise LookupError(f"window {window_id} not found")
+        except xerror.ConnectionClosedError:
+            _reset_display()
+            raise
+
+
+def iconify_window(window_id: int, display: Optional[str] = None) -> None:
+    _send_to_window_manager(window_id, "WM_CHANGE_STATE", [Xutil.IconicState], display)
+
+
+def activate_window(window_id: int, display: Optional[str] = None) -> None:
+    """Raises and focuses a window, restoring it first if it is iconified."""
+    # source 2 is a pager, which window managers do not second-guess like applications
+    _send_to_window_manager(window_id, "_NET_ACTIVE_WINDOW", [2, X.CurrentTime], display)
+
+
+def maximize_window(window_id: int, display: Optional[str] = None) -> None:
+    # action 1 adds the states
+    _send_to_window_manager(
+        window_id,
+        "_NET_WM_STATE",
+        [1, "_NET_WM_STATE_MAXIMIZED_VERT", "_NET_WM_STATE_MAXIMIZED_HORZ", 2],
+        display,
+    )
+
+
+def close_window(window_id: int, display: Optional[str] = None) -> None:
+    """Asks the window's application to close it, like clicking its close button."""
+    _send_to_window_manager(window_id, "_NET_CLOSE_WINDOW", [X.CurrentTime, 2], display)
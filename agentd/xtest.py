@@ -0,0 +1,429 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from Xlib import XK, X, display as xdisplay, error as xerror
+from Xlib.ext import xtest
+
+from .keys import PYNPUT_TO_PYAUTOGUI
+
+api_logger = logging.getLogger("api")
+
+# seconds to wait after every input call, pyautogui waits 0.1s by default
+INPUT_PAUSE = float(os.getenv("INPUT_PAUSE", "0"))
+# time between the steps of an animated mouse move
+MOVE_STEP_SECONDS = 0.01
+# time clients get to handle the keys typed on a spare keycode before it is rebound,
+# as clients that read the keymap lazily decode pending keys with the latest mapping
+REMAP_DELAY_SECONDS = float(os.getenv("INPUT_REMAP_DELAY", "0.05"))
+
+BUTTONS = {"left": 1, "middle": 2, "right": 3}
+SCROLL_UP, SCROLL_DOWN = 4, 5
+
+
+# keysym names python-xlib does not load by default: media keys and Korean input keys
+XK.load_keysym_group("xf86")
+XK.load_keysym_group("korean")
+
+
+def _named_keysyms() -> Dict[str, int]:
+    """
+    Keysyms for the pyautogui key names. The names recorded from pynput are mapped
+    through their pynput keys (whose ``vk`` is the X keysym), other pyautogui names
+    and aliases through their X keysym names.
+    """
+    keysyms = {
+        name: key.value.vk
+        for key, name in PYNPUT_TO_PYAUTOGUI.items()
+        if getattr(key.value, "vk", None)
+    }
+    aliases = {
+        "esc": "Escape",
+        "return": "Return",
+        "\n": "Return",
+        "\r": "Return",
+        "\t": "Tab",
+        "del": "Delete",
+        "pgup": "Prior",
+        "pgdn": "Next",
+        "win": "Super_L",
+        "cmd": "Super_L",
+        "option": "Alt_L",
+        "optionleft": "Alt_L",
+        "optionright": "Alt_R",
+        "prtsc": "Print",
+        "prtscr": "Print",
+        "printscreen": "Print",
+        "prntscrn": "Print",
+        "print": "Print",
+        "\b": "BackSpace",
+        "super": "Super_L",
+        "clear": "Clear",
+        "select": "Select",
+        "execute": "Execute",
+        "help": "Help",
+        "multiply": "KP_Multiply",
+        "add": "KP_Add",
+        "separator": "KP_Separator",
+        "subtract": "KP_Subtract",
+        "decimal": "KP_Decimal",
+        "divide": "KP_Divide",
+        "modechange": "Mode_switch",
+        "convert": "Henkan",
+        "nonconvert": "Muhenkan",
+        "kanji": "Kanji",
+        "hangul": "Hangul",
+        "hanguel": "Hangul",
+        "hanja": "Hangul_Hanja",
+        "yen": "yen",
+        "volumeup": "XF86_AudioRaiseVolume",
+        "volumedown": "XF86_AudioLowerVolume",
+        "volumemute": "XF86_AudioMute",
+        "playpause": "XF86_AudioPlay",
+        "stop": "XF86_AudioStop",
+        "nexttrack": "XF86_AudioNext",
+        "prevtrack": "XF86_AudioPrev",
+        "browserback": "XF86_Back",
+        "browserforward": "XF86_Forward",
+        "browserrefresh": "XF86_Refresh",
+        "browserstop": "XF86_Stop",
+        "browsersearch": "XF86_Search",
+        "browserfavorites": "XF86_Favorites",
+        "browserhome": "XF86_HomePage",
+        "launchmail": "XF86_Mail",
+        "launchmediaselect": "XF86_AudioMedia",
+        "sleep": "XF86_Sleep",
+    }
+    for name, keysym_name in aliases.items():
+        keysyms.setdefault(name, XK.string_to_keysym(keysym_name))
+    for n in range(10):
+        keysyms.setdefault(f"num{n}", XK.string_to_keysym(f"KP_{n}"))
+    for n in range(1, 25):
+        keysyms.setdefault(f"f{n}", XK.string_to_keysym(f"F{n}"))
+    return keysyms
+
+
+KEYSYMS = _named_keysyms()
+
+
+def char_keysym(char: str) -> int:
+    """The keysym that types a character: latin-1 keysyms equal their code point."""
+    if char in KEYSYMS:
+        return KEYSYMS[char]
+    code = ord(char)
+    if code < 0x20 or code == 0x7F:
+        raise ValueError(f"Cannot type control character {code:#x}")
+    return code if code <= 0xFF else 0x01000000 | code
+
+
+def key_keysym(key: str) -> int:
+    """Resolves a pyautogui key name, a single character or an X keysym name."""
+    if len(key) == 1:
+        return char_keysym(key)
+    keysym = KEYSYMS.get(key.lower()) or XK.string_to_keysym(key)
+    if not keysym:
+        raise ValueError(f"Unknown key '{key}'")
+    return keysym
+
+
+class XTestInput:
+    """
+    Injects mouse and keyboard events through the XTest extension over a single,
+    persistent X connection.
+
+    The keyboard layout is read once per connection into a keysym -> (keycode,
+    shift) table, so typing is a table lookup per character. Characters the layout
+    has no key for are typed by binding their keysym to a spare keycode, the same
+    way xdotool does. Each such character gets a spare keycode of its own while
+    there are free ones; the spare keycodes are unbound again at the end of the call.
+
+    Every call waits for the X server to process its events before returning, then
+    sleeps ``pause`` seconds if set. Calls are serialized, the connection is not
+    thread safe.
+    """
+
+    def __init__(self, display: Optional[str] = None, pause: float = INPUT_PAUSE) -> None:
+        self.display_name = display
+        self.pause = pause
+        self._display: Optional[xdisplay.Display] = None
+        self._keycodes: Dict[int, Tuple[int, bool]] = {}
+        self._spare_keycodes: List[int] = []
+        # keysym -> spare keycode it is bound to, least recently used first
+        self._bound: "OrderedDict[int, int]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def position(self) -> Tuple[int, int]:
+        with self._lock:
+            pointer = self._run(lambda d: d.screen().root.query_pointer(), pause=False)
+        return pointer.root_x, pointer.root_y
+
+    def size(self) -> Tuple[int, int]:
+        with self._lock:
+            screen = self._run(lambda d: d.screen(), pause=False)
+        return screen.width_in_pixels, screen.height_in_pixels
+
+    def move_to(
+        self,
+        x: int,
+        y: int,
+        duration: float = 0.0,
+        tween: Optional[Callable[[float], float]] = None,
+    ) -> None:
+        """Moves the pointer, along a tweened path over ``duration`` seconds if given."""
+        with self._lock:
+            if duration > 0:
+                start_x, start_y = self.position()
+                steps = max(1, round(duration / MOVE_STEP_SECONDS))
+                started = time.monotonic()
+                for step in range(1, steps):
+                    progress = tween(step / steps) if tween else step / steps
+                    self._run(
+                        self._motion(
+                            round(start_x + (x - start_x) * progress),
+                            round(start_y + (y - start_y) * progress),
+                        ),
+                        pause=False,
+                    )
+                    # scheduled against the start so slow steps do not stretch the move
+                    delay = started + duration * step / steps - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+            self._run(self._motion(x, y))
+
+    def mouse_down(self, button: str = "left") -> None:
+        with self._lock:
+            self._run(lambda d: xtest.fake_input(d, X.ButtonPress, self._button(button)))
+
+    def mouse_up(self, button: str = "left") -> None:
+        with self._lock:
+            self._run(lambda d: xtest.fake_input(d, X.ButtonRelease, self._button(button)))
+
+    def click(self, button: str = "left", clicks: int = 1, interval: float = 0.0) -> None:
+        detail = self._button(button)
+        with self._lock:
+            for i in range(clicks):
+                self._run(
+                    lambda d: (
+                        xtest.fake_input(d, X.ButtonPress, detail),
+                        xtest.fake_input(d, X.ButtonRelease, detail),
+                    ),
+                    pause=False,
+                )
+                if interval and i < clicks - 1:
+                    time.sleep(interval)
+            self._finish()
+
+    def scroll(self, clicks: int) -> None:
+        """Scrolls up for positive ``clicks`` and down for negative ones."""
+        detail = SCROLL_UP if clicks > 0 else SCROLL_DOWN
+
+        def send(d):
+            for _ in range(abs(clicks)):
+                xtest.fake_input(d, X.ButtonPress, detail)
+                xtest.fake_input(d, X.ButtonRelease, detail)
+
+        with self._lock:
+            self._run(send)
+
+    def drag_to(
+        self,
+        x: int,
+        y: int,
+        duration: float = 0.0,
+        button: str = "left",
+        tween: Optional[Callable[[float], float]] = None,
+    ) -> None:
+        with self._lock:
+            self.mouse_down(button)
+            try:
+                self.move_to(x, y, duration, tween)
+            finally:
+                self.mouse_up(button)
+
+    def key_down(self, key: str) -> None:
+        with self._lock:
+            self._run(lambda d: self._key(d, key_keysym(key), X.KeyPress))
+
+    def key_up(self, key: str) -> None:
+        with self._lock:
+            self._run(lambda d: self._key(d, key_keysym(key), X.KeyRelease))
+
+    def press(self, key: str) -> None:
+        keysym = key_keysym(key)
+        with self._lock:
+            self._run(lambda d: self._tap(d, keysym))
+
+    def hotkey(self, *keys: str) -> None:
+        """Holds down the keys in order and releases them in reverse order."""
+        keysyms = [key_keysym(key) for key in keys]
+
+        def send(d):
+            for keysym in keysyms:
+                self._key(d, keysym, X.KeyPress)
+            for keysym in reversed(keysyms):
+                self._key(d, keysym, X.KeyRelease)
+
+        with self._lock:
+            self._run(send)
+
+    def write(self, text: str, interval: float = 0.0) -> None:
+        """
+        Types text, ``interval`` seconds apart per character. Every character is
+        resolved before anything is typed, so a ValueError leaves nothing half typed.
+        """
+        keysyms = [char_keysym(char) for char in text]
+        with self._lock:
+            if not interval:
+                self._run(lambda d: [self._tap(d, keysym) for keysym in keysyms])
+                return
+            for keysym in keysyms:
+                self._run(lambda d: self._tap(d, keysym), pause=False)
+                time.sleep(interval)
+            self._finish()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._display is not None:
+                try:
+                    self._display.close()
+                except Exception:
+                    pass
+            self._display = None
+
+    def _run(self, send: Callable[[xdisplay.Display], object], pause: bool = True):
+        """
+        Sends events on the connection and waits until the server processed them.
+        ``pause`` marks the end of a call: spare keycodes bound during it are unbound.
+        """
+        d = self._connect()
+        try:
+            result = send(d)
+            d.sync()
+            if pause and self._bound:
+                self._unbind_spare_keycodes(d)
+        except xerror.ConnectionClosedError:
+            self.close()
+            raise
+        if pause:
+            self._pause()
+        return result
+
+    def _finish(self) -> None:
+        self._run(lambda d: None)
+
+    def _pause(self) -> None:
+        if self.pause > 0:
+            time.sleep(self.pause)
+
+    def _connect(self) -> xdisplay.Display:
+        if self._display is None:
+            self._display = xdisplay.Display(self.display_name)
+            self._load_keyboard_mapping(self._display)
+        return self._display
+
+    def _load_keyboard_mapping(self, d: xdisplay.Display) -> None:
+        first = d.display.info.min_keycode
+        count = d.display.info.max_keycode - first + 1
+        keycodes: Dict[int, Tuple[int, bool]] = {}
+        spare: List[int] = []
+        for offset, keysyms in enumerate(d.get_keyboard_mapping(first, count)):
+            keycode = first + offset
+            if not any(keysyms):
+                spare.append(keycode)
+                continue
+            # index 0 is the plain keysym, index 1 the shifted one
+            for index, keysym in enumerate(keysyms[:2]):
+                if keysym and (keysym not in keycodes or (keycodes[keysym][1] and not index)):
+                    keycodes[keysym] = (keycode, bool(index))
+        self._keycodes = keycodes
+        # the highest keycodes first, as xdotool does
+        self._spare_keycodes = spare[::-1]
+        self._bound = OrderedDict()
+        api_logger.info(
+            f"xtest input connected: {len(keycodes)} keysyms mapped, {len(spare)} spare keycodes"
+        )
+
+    def _keycode(self, d: xdisplay.Display, keysym: int) -> Tuple[int, bool]:
+        mapped = self._keycodes.get(keysym)
+        if mapped:
+            return mapped
+        keycode = self._bound.get(keysym)
+        if keycode is not None:
+            self._bound.move_to_end(keysym)
+            return keycode, False
+        if not self._spare_keycodes:
+            # the keysym is not named in the error, the text typed may be a secret
+            raise ValueError("No key for a character and no spare keycode to bind it to")
+        if len(self._bound) < len(self._spare_keycodes):
+            keycode = self._spare_keycodes[len(self._bound)]
+        else:
+            # every spare keycode is bound, rebind the least recently used one once the
+            # keys typed on it had time to be handled
+            _, keycode = self._bound.popitem(last=False)
+            d.sync()
+            time.sleep(REMAP_DELAY_SECONDS)
+        d.change_keyboard_mapping(keycode, [(keysym, keysym)])
+        d.sync()
+        self._bound[keysym] = keycode
+        return keycode, False
+
+    def _unbind_spare_keycodes(self, d: xdisplay.Display) -> None:
+        """Restores the spare keycodes to unbound, once the keys typed on them were handled."""
+        time.sleep(REMAP_DELAY_SECONDS)
+        for keycode in self._bound.values():
+            d.change_keyboard_mapping(keycode, [(X.NoSymbol, X.NoSymbol)])
+        self._bound.clear()
+        d.sync()
+
+    def _key(self, d: xdisplay.Display, keysym: int, event: int) -> None:
+        keycode, _ = self._keycode(d, keysym)
+        xtest.fake_input(d, event, keycode)
+
+    def _tap(self, d: xdisplay.Display, keysym: int) -> None:
+        keycode, shift = self._keycode(d, keysym)
+        if shift:
+            shift_keycode, _ = self._keycode(d, XK.XK_Shift_L)
+            xtest.fake_input(d, X.KeyPress, shift_keycode)
+        xtest.fake_input(d, X.KeyPress, keycode)
+        xtest.fake_input(d, X.KeyRelease, keycode)
+        if shift:
+            xtest.fake_input(d, X.KeyRelease, shift_keycode)
+
+    @staticmethod
+    def _motion(x: int, y: int) -> Callable[[xdisplay.Display], None]:
+        return lambda d: xtest.fake_input(d, X.MotionNotify, x=x, y=y)
+
+    @staticmethod
+    def _button(button: str) -> int:
+        if button not in BUTTONS:
+            raise ValueError(f"Unknown button '{button}', must be one of: {', '.join(BUTTONS)}")
+        return BUTTONS[button]
+
+
+_input: Optional[XTestInput] = None
+_input_display: Optional[str] = None
+_input_lock = threading.Lock()
+
+
+def set_input_display(display: Optional[str]) -> None:
+    """Sets the display the shared input backend sends to, None for $DISPLAY."""
+    global _input, _input_display
+    with _input_lock:
+        if display == _input_display:
+            return
+        _input_display = display
+        previous, _input = _input, None
+    if previous is not None:
+        previous.close()
+
+
+def get_input() -> XTestInput:
+    """Returns the shared input backend, connecting on first use."""
+    global _input
+    with _input_lock:
+        if _input is None:
+            _input = XTestInput(_input_display)
+        return _input
@@ -0,0 +1,12 @@
+from agentd.capture import Frame
+
+
+def make_frame(timestamp=0.0, value=0, width=2, height=1, changes=()):
+    """
+    A frame of ``width`` x ``height`` raw BGRA pixels with every byte set to ``value``.
+    The pixels at the (x, y) positions in ``changes`` get a different blue byte.
+    """
+    raw = bytearray([value] * width * height * 4)
+    for x, y in changes:
+        raw[(y * width + x) * 4] = (value + 200) % 256
+    return Frame(timestamp=timestamp, width=width, height=height, raw=bytes(raw))
@@ -0,0 +1,90 @@
+from unittest.mock import patch
+
+from agentd import browser, firefox
+
+
+def test_running_firefox_gets_a_new_tab():
+    with patch("agentd.browser.is_firefox_running", return_value=[42]), patch(
+        "agentd.browser.open_firefox_tab", return_value=True
+    ) as mock_tab, patch("agentd.browser.gracefully_terminate_firefox") as mock_terminate, patch(
+        "agentd.browser.subprocess.Popen"
+    ) as mock_popen:
+        assert browser.open_url("http://example.com") == "firefox-tab"
+
+    mock_tab.assert_called_once_with("http://example.com", display=None)
+    mock_terminate.assert_not_called()
+    mock_popen.assert_not_called()
+
+
+def test_running_chromium_gets_a_devtools_tab():
+    with patch("agentd.browser.is_firefox_running", return_value=[]), patch(
+        "agentd.browser.is_chromium_running", return_value=[42]
+    ), patch("agentd.browser.open_chromium_tab", return_value=True) as mock_tab, patch(
+        "agentd.browser.subprocess.Popen"
+    ) as mock_popen:
+        assert browser.open_url("http://example.com") == "chromium-tab"
+
+    mock_tab.assert_called_once_with("http://example.com")
+    mock_popen.assert_not_called()
+
+
+def test_cold_start_waits_for_the_window():
+    with patch("agentd.browser.is_firefox_running", return_value=[]), patch(
+        "agentd.browser.is_chromium_running", return_value=[]
+    ), patch("agentd.browser.subprocess.Popen") as mock_popen, patch(
+        "agentd.browser.wait_for_window", return_value=123
+    ) as mock_wait, patch("agentd.browser.maximize_firefox_window"):
+        assert browser.open_url("http://example.com", ":1") == "started"
+
+    assert mock_popen.call_args[0][0] == ["firefox", "http://example.com"]
+    mock_wait.assert_called_once_with("firefox", browser.BROWSER_START_TIMEOUT, ":1")
+
+
+def test_pool_hands_over_the_warm_browser():
+    pool = browser.BrowserPool("firefox")
+    spare = browser.PooledBrowser("firefox", "/tmp/profile", None, process=None)
+    spare.window_id = 7
+    pool._spare = spare
+
+    with patch("agentd.browser.pool", pool), patch(
+        "agentd.browser.is_firefox_running", return_value=[]
+    ), patch("agentd.browser.is_chromium_running", return_value=[]), patch.object(
+        pool, "pids", return_value=set()
+    ), patch.object(
+        pool, "start"
+    ) as mock_start, patch.object(
+        spare, "alive", return_value=True
+    ), patch(
+        "agentd.browser.open_firefox_tab", return_value=True
+    ) as mock_tab, patch(
+        "agentd.browser.activate_window"
+    ) as mock_activate, patch(
+        "agentd.browser.maximize_window"
+    ), patch(
+        "agentd.browser.subprocess.Popen"
+    ) as mock_popen:
+        assert browser.open_url("http://example.com") == "pooled"
+        # the next URL goes to the browser that was handed over
+        assert browser.open_url("http://example.org") == "firefox-tab"
+
+    assert pool.active is spare
+    mock_tab.assert_called_with(
+        "http://example.org", profile="/tmp/profile", display=None, window_id=7
+    )
+    mock_activate.assert_called_once_with(7, None)
+    # a replacement starts warming up
+    mock_start.assert_called_once()
+    mock_popen.assert_not_called()
+
+
+def test_new_firefox_tab_shows_its_window():
+    with patch("agentd.firefox.subprocess.Popen") as mock_popen, patch(
+        "agentd.firefox.find_windows", return_value=[5]
+    ), patch("agentd.firefox.activate_window") as mock_activate, patch(
+        "agentd.firefox.maximize_window"
+    ) as mock_maximize:
+        mock_popen.return_value.wait.return_value = 0
+        assert firefox.open_firefox_tab("http://example.com", display=":1")
+
+    mock_activate.assert_called_once_with(5, ":1")
+    mock_maximize.assert_called_once_with(5, ":1")
@@ -0,0 +1,60 @@
+import threading
+import time
+
+import pytest
+
+from agentd.cache import EncodedFrameCache
+
+
+def test_cache_counts_hits_and_misses():
+    cache = EncodedFrameCache(max_bytes=100)
+    assert cache.get_or_encode("a", lambda: "data-a") == "data-a"
+    assert cache.get_or_encode("a", lambda: "other") == "data-a"
+    assert cache.stats() == {"hits": 1, "misses": 1, "entries": 1, "bytes": 6}
+
+
+def test_cache_evicts_least_recently_used_by_size():
+    cache = EncodedFrameCache(max_bytes=10)
+    cache.get_or_encode("a", lambda: "aaaa")
+    cache.get_or_encode("b", lambda: "bbbb")
+    cache.get_or_encode("a", lambda: "unused")
+    cache.get_or_encode("c", lambda: "cccc")
+
+    assert len(cache) == 2
+    assert cache.get_or_encode("a", lambda: "new") == "aaaa"
+    assert cache.get_or_encode("b", lambda: "new") == "new"
+
+
+def test_concurrent_requests_share_one_encode():
+    cache = EncodedFrameCache(max_bytes=100)
+    calls = []
+
+    def encode():
+        calls.append(1)
+        time.sleep(0.05)
+        return "data"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_encode("k", encode)))
+        for _ in range(5)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == ["data"] * 5
+    assert len(calls) == 1
+    assert cache.misses == 1
+
+
+def test_failed_encodes_are_not_cached():
+    cache = EncodedFrameCache(max_bytes=100)
+
+    def fail():
+        raise LookupError("gone")
+
+    with pytest.raises(LookupError):
+        cache.get_or_encode("k", fail)
+    assert cache.get_or_encode("k", lambda: "data") == "data"
@@ -0,0 +1,177 @@
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from agentd.capture import (
+    CaptureEngine,
+    CaptureProfile,
+    CaptureRateController,
+    Frame,
+    LiveCapture,
+    clip_region,
+    frame_digest,
+    grab_screen,
+)
+
+
+class FakeShot:
+    def __init__(self, width=4, height=2):
+        self.width = width
+        self.height = height
+        self.raw = bytearray(width * height * 4)
+
+
+class FakeMSS:
+    def __init__(self, delay=0.0, **kwargs):
+        self.delay = delay
+        self.monitors = [{}, {"left": 0, "top": 0, "width": 4, "height": 2}]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def grab(self, monitor):
+        time.sleep(self.delay)
+        return FakeShot(monitor["width"], monitor["height"])
+
+
+def test_frame_to_image():
+    frame = Frame(timestamp=1.0, width=2, height=1, raw=bytes([1, 2, 3, 255] * 2))
+    image = frame.to_image()
+    assert image.size == (2, 1)
+    assert image.getpixel((0, 0)) == (3, 2, 1)
+
+
+def test_frame_digest_detects_changes():
+    frame = Frame(timestamp=1.0, width=2, height=4, raw=bytes(32))
+    same = Frame(timestamp=2.0, width=2, height=4, raw=bytes(32))
+    changed_row = bytearray(32)
+    changed_row[8] = 1  # first pixel of the second row
+    changed = Frame(timestamp=3.0, width=2, height=4, raw=bytes(changed_row))
+
+    assert frame_digest(frame) == frame_digest(same)
+    assert frame_digest(frame) != frame_digest(changed)
+    # sampling every other row skips the second row
+    assert frame_digest(frame, row_stride=2) == frame_digest(changed, row_stride=2)
+
+
+def test_clip_region_to_screen():
+    screen = {"left": 0, "top": 0, "width": 100, "height": 50}
+    assert clip_region((10, 10, 20, 20), screen) == {
+        "left": 10,
+        "top": 10,
+        "width": 20,
+        "height": 20,
+    }
+    # a window hanging off the bottom right corner
+    assert clip_region((90, 40, 30, 30), screen) == {
+        "left": 90,
+        "top": 40,
+        "width": 10,
+        "height": 10,
+    }
+    with pytest.raises(ValueError):
+        clip_region((100, 0, 10, 10), screen)
+
+
+def test_capture_engine_stamps_frames_in_order():
+    frames = []
+    with patch("agentd.capture.mss.mss", side_effect=lambda **kw: FakeMSS()):
+        engine = CaptureEngine(interval=0.01, on_frame=frames.append)
+        engine.start()
+        time.sleep(0.1)
+        engine.stop()
+
+    assert len(frames) >= 5
+    timestamps = [f.timestamp for f in frames]
+    assert timestamps == sorted(timestamps)
+    assert engine.frames_captured == len(frames)
+
+
+def test_capture_engine_counts_overruns():
+    with patch("agentd.capture.mss.mss", side_effect=lambda **kw: FakeMSS(delay=0.03)):
+        engine = CaptureEngine(interval=0.01, on_frame=lambda frame: None)
+        engine.start()
+        time.sleep(0.15)
+        engine.stop()
+
+    assert engine.overruns > 0
+
+
+def test_rate_controller_switches_between_burst_active_and_idle():
+    profile = CaptureProfile(burst=0.01, active=0.1, idle=1.0, burst_window=0.05, idle_after=0.05)
+    rate = CaptureRateController(profile)
+    assert rate.interval() == 0.1
+
+    rate.notify_input()
+    assert rate.interval() == 0.01
+
+    time.sleep(0.06)
+    rate.notify_frame(changed=False)
+    assert rate.interval() == 1.0
+
+    rate.notify_frame(changed=True)
+    assert rate.interval() == 0.1
+
+
+def test_capture_engine_wakes_up_for_a_faster_rate():
+    frames = []
+    rate = CaptureRateController(CaptureProfile(burst=0.01, active=10, idle=10, burst_window=10))
+    with patch("agentd.capture.mss.mss", side_effect=lambda **kw: FakeMSS()):
+        engine = CaptureEngine(interval=rate.interval, on_frame=frames.append)
+        engine.start()
+        time.sleep(0.05)
+        assert len(frames) == 1
+
+        rate.notify_input()
+        engine.wake()
+        time.sleep(0.1)
+        engine.stop()
+
+    assert len(frames) > 3
+
+
+def test_live_capture_runs_only_while_subscribed():
+    first, second = [], []
+    with patch("agentd.capture.mss.mss", side_effect=lambda **kw: FakeMSS()):
+        live = LiveCapture()
+        a = live.subscribe(lambda frame, changed: first.append(changed), 0.01)
+        b = live.subscribe(lambda frame, changed: second.append(changed), 0.5)
+        time.sleep(0.1)
+        live.unsubscribe(a)
+        live.unsubscribe(b)
+        assert live._engine is None
+
+    # both subscribers got frames at the faster rate, and only the first one changed
+    assert len(first) >= 5 and len(second) >= 5
+    assert first[0] and not any(first[1:])
+
+
+def test_grab_screen_keeps_a_connection_per_display_and_cursor_setting():
+    opened = []
+
+    def open_mss(**kwargs):
+        opened.append(kwargs)
+        return FakeMSS()
+
+    def grab():
+        grab_screen(":1", with_cursor=True)
+        grab_screen(":1", with_cursor=False)
+        grab_screen(":2", with_cursor=False)
+        grab_screen(":1", with_cursor=True)
+
+    with patch("agentd.capture.mss.mss", side_effect=open_mss):
+        # a thread of its own, so no connection is cached from other tests
+        thread = threading.Thread(target=grab)
+        thread.start()
+        thread.join()
+
+    assert opened == [
+        {"display": ":1", "with_cursor": True},
+        {"display": ":1", "with_cursor": False},
+        {"display": ":2", "with_cursor": False},
+    ]
@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+import pytest
+
+from agentd.commands import CommandRunner
+
+
+@pytest.mark.asyncio
+async def test_run_collects_output_and_return_code():
+    result = await CommandRunner().run("echo out; echo err >&2; exit 3")
+    assert result["stdout"] == "out\n"
+    assert result["stderr"] == "err\n"
+    assert result["return_code"] == 3
+    assert not result["timed_out"]
+
+
+@pytest.mark.asyncio
+async def test_stream_yields_output_as_it_is_produced():
+    events = []
+    async for event in CommandRunner().stream("echo 1; sleep 0.2; echo 2"):
+        events.append((time.perf_counter(), event))
+    assert [e["data"] for _, e in events[:2]] == ["1\n", "2\n"]
+    assert events[-1][1]["type"] == "exit"
+    # the first line arrived before the command finished
+    assert events[1][0] - events[0][0] >= 0.15
+
+
+@pytest.mark.asyncio
+async def test_timeout_kills_the_command():
+    started = time.perf_counter()
+    result = await CommandRunner().run("sleep 5", timeout=0.2)
+    assert result["timed_out"]
+    assert time.perf_counter() - started < 2
+
+
+@pytest.mark.asyncio
+async def test_output_is_capped():
+    result = await CommandRunner(max_output=100).run("head -c 100000 /dev/zero | tr '\\0' x")
+    assert result["stdout"] == "x" * 100
+    assert result["truncated"]
+    assert result["return_code"] == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_limited():
+    runner = CommandRunner(max_concurrent=2)
+    started = time.perf_counter()
+    await asyncio.gather(*[runner.run("sleep 0.2") for _ in range(4)])
+    assert time.perf_counter() - started >= 0.4
@@ -0,0 +1,68 @@
+from agentd.capture import Frame
+from agentd.delta import ReferenceFrameCache, StabilityTracker, changed_tiles
+
+from .conftest import make_frame
+
+
+def test_identical_frames_have_no_changed_tiles():
+    assert changed_tiles(make_frame(width=100, height=50), make_frame(width=100, height=50), tile_size=16) == []
+
+
+def test_changed_tiles_are_clipped_and_merged():
+    previous = make_frame(width=100, height=50)
+    current = make_frame(width=100, height=50, changes=[(5, 5), (20, 5), (99, 49)])
+
+    assert changed_tiles(previous, current, tile_size=16) == [
+        (0, 0, 32, 16),  # two adjacent tiles merged into one run
+        (96, 48, 4, 2),  # edge tile clipped to the frame
+    ]
+
+
+def test_padding_byte_is_ignored():
+    previous = make_frame(width=16, height=16)
+    raw = bytearray(previous.raw)
+    raw[3] = 255
+    current = Frame(timestamp=0.0, width=16, height=16, raw=bytes(raw))
+    assert changed_tiles(previous, current, tile_size=8) == []
+
+
+def test_reference_cache_is_bounded_per_client_and_overall():
+    cache = ReferenceFrameCache(max_clients=2, frames_per_client=2)
+    frame = make_frame(width=1, height=1)
+
+    first = cache.put("a", frame)
+    second = cache.put("a", frame)
+    third = cache.put("a", frame)
+    assert cache.get("a", first) is None
+    assert cache.get("a", second) is frame
+    assert cache.get("a", third) is frame
+
+    cache.put("b", frame)
+    cache.put("c", frame)
+    assert cache.get("a", third) is None
+
+
+def test_stability_tracker_ignores_changes_below_threshold():
+    tracker = StabilityTracker(threshold=0.01)
+    tracker.update(make_frame(width=10, height=10, timestamp=1.0))
+    # one pixel out of a hundred is not above the threshold
+    tracker.update(make_frame(width=10, height=10, changes=[(0, 0)], timestamp=2.0))
+    assert tracker.last_change == 1.0
+    assert tracker.stable_for(3.0) == 2.0
+
+    tracker.update(make_frame(width=10, height=10, changes=[(x, 0) for x in range(10)], timestamp=4.0))
+    assert tracker.last_change == 4.0
+    assert tracker.stable_for(4.5) == 0.5
+    assert tracker.frames == 3
+
+
+def test_stability_tracker_mark_changed_restarts_the_clock():
+    tracker = StabilityTracker()
+    tracker.update(make_frame(width=10, height=10, timestamp=1.0))
+    tracker.mark_changed(3.0)
+    tracker.update(make_frame(width=10, height=10, timestamp=3.5))
+    assert tracker.last_change == 3.0
+    assert tracker.stable_for(3.5) == 0.5
+    # an older change does not move the clock back
+    tracker.mark_changed(2.0)
+    assert tracker.last_change == 3.0
@@ -0,0 +1,43 @@
+import io
+
+import pytest
+from PIL import Image
+
+from agentd.encoding import encode_frame, fit_scale, submit_encode, validate_image_options
+
+from .conftest import make_frame
+
+
+@pytest.mark.parametrize("format,pil_format", [("png", "PNG"), ("jpeg", "JPEG"), ("webp", "WEBP")])
+def test_encode_frame_formats(format, pil_format):
+    data = encode_frame(make_frame(1.0, 30, width=8, height=4), format=format, quality=80)
+    image = Image.open(io.BytesIO(data))
+    assert image.format == pil_format
+    assert image.size == (8, 4)
+
+
+def test_fit_scale():
+    assert fit_scale((1280, 800), 640) == 0.5
+    assert fit_scale((800, 1280), 640) == 0.5
+    assert fit_scale((320, 200), 640) == 1.0
+
+
+def test_encode_frame_scales():
+    data = encode_frame(make_frame(1.0, 30, width=8, height=4), scale=0.5)
+    assert Image.open(io.BytesIO(data)).size == (4, 2)
+
+
+@pytest.mark.parametrize(
+    "format,quality,scale",
+    [("gif", 90, 1.0), ("png", 0, 1.0), ("png", 101, 1.0), ("png", 90, 0), ("png", 90, 1.5)],
+)
+def test_validate_image_options_rejects_bad_values(format, quality, scale):
+    with pytest.raises(ValueError):
+        validate_image_options(format, quality, scale)
+
+
+def test_submit_encode_runs_in_the_process_pool():
+    full, scaled = submit_encode(1, make_frame(1.0, 30, width=8, height=4), [("png", 90, 1.0), ("jpeg", 80, 0.5)]).result(timeout=60)
+    assert Image.open(io.BytesIO(full)).size == (8, 4)
+    assert Image.open(io.BytesIO(scaled)).format == "JPEG"
+    assert Image.open(io.BytesIO(scaled)).size == (4, 2)
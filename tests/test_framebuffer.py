@@ -0,0 +1,43 @@
+from agentd.framebuffer import FrameRingBuffer
+
+from .conftest import make_frame
+
+
+def test_ring_overwrites_oldest_and_reports_eviction():
+    evicted = []
+    ring = FrameRingBuffer(slots=2, slot_size=8, on_evict=lambda seq, ts: evicted.append((seq, ts)))
+
+    first = ring.write(make_frame(1.0, 1))
+    second = ring.write(make_frame(2.0, 2))
+    third = ring.write(make_frame(3.0, 3))
+
+    assert ring.read(first) is None
+    assert ring.read(second).raw == bytes([2] * 8)
+    assert ring.read(third).timestamp == 3.0
+    assert evicted == [(first, 1.0)]
+
+
+def test_pinned_frames_survive_until_released():
+    ring = FrameRingBuffer(slots=2, slot_size=8)
+    first = ring.write(make_frame(1.0, 1))
+    assert ring.pin(first)
+
+    for i in range(5):
+        ring.write(make_frame(2.0 + i, 2 + i))
+    assert ring.read(first).raw == bytes([1] * 8)
+
+    ring.release(first)
+    ring.write(make_frame(10.0, 10))
+    ring.write(make_frame(11.0, 11))
+    assert ring.read(first) is None
+
+
+def test_frames_are_dropped_when_every_slot_is_pinned():
+    ring = FrameRingBuffer(slots=1, slot_size=8)
+    seq = ring.write(make_frame(1.0, 1))
+    ring.pin(seq)
+
+    assert ring.write(make_frame(2.0, 2)) is None
+    assert ring.dropped == 1
+    ring.close()
+    assert ring.read(seq) is None
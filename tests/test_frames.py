@@ -0,0 +1,42 @@
+import random
+
+from agentd.frames import FrameIndex
+
+
+def brute_force(timestamps, target, n, mode):
+    if mode == "closest":
+        selected = sorted(timestamps, key=lambda ts: abs(ts - target))[:n]
+    elif mode == "before":
+        selected = sorted(ts for ts in timestamps if ts < target)[-n:] if n else []
+    else:
+        selected = sorted(ts for ts in timestamps if ts > target)[:n]
+    return sorted(selected)
+
+
+def test_index_matches_directory_scan_semantics():
+    rng = random.Random(0)
+    timestamps = sorted({round(rng.uniform(0, 100), 3) for _ in range(500)})
+    index = FrameIndex()
+    for ts in timestamps:
+        index.add(ts, ts)
+
+    for _ in range(200):
+        target = rng.uniform(-5, 105)
+        n = rng.randint(0, 4)
+        assert index.before(target, n) == brute_force(timestamps, target, n, "before")
+        assert index.after(target, n) == brute_force(timestamps, target, n, "after")
+        assert len(index.closest(target, n)) == min(n, len(timestamps))
+        assert sorted(index.closest(target, n)) == index.closest(target, n)
+
+
+def test_index_handles_out_of_order_and_exact_matches():
+    index = FrameIndex()
+    for ts in [3.0, 1.0, 2.0]:
+        index.add(ts, f"frame_{ts}")
+
+    assert index.before(2.0, 2) == ["frame_1.0"]
+    assert index.after(2.0, 2) == ["frame_3.0"]
+    assert index.closest(2.0, 1) == ["frame_2.0"]
+    assert index.latest(2) == ["frame_2.0", "frame_3.0"]
+    assert index.latest(2, start_index=1) == ["frame_1.0", "frame_2.0"]
+    assert FrameIndex().closest(1.0, 2) == []
@@ -0,0 +1,119 @@
+from concurrent.futures import Future
+
+import pytest
+
+from agentd import recording
+from agentd.models import ImageVariantsModel
+from agentd.recording import RecordingSession
+
+from .conftest import make_frame
+
+
+def pinned_slots(session):
+    return [pins for pins in session.frame_buffer._pins if pins]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(recording, "RECORDINGS_DIR", str(tmp_path))
+    monkeypatch.setattr(recording, "FRAME_BUFFER_SLOTS", 4)
+    session = RecordingSession("test-session", "Test")
+    yield session
+    recording.storage.remove_session(session._id)
+
+
+def test_saved_frames_are_released(session):
+    for i in range(3):
+        session._store_frame(make_frame(1.0 + i, i))
+
+    session._pin_frames_before(3.5)
+    assert len(pinned_slots(session)) == 2
+
+    paths = session._get_screenshots_by_time(2, 3.5 - recording.before_screenshot_offset, "before")
+    assert len(paths) == 2
+    assert pinned_slots(session) == []
+    assert session.frame_pins == {}
+
+    # an action using frames that are already on disk releases its pins as well
+    session._pin_frames_before(3.5)
+    session._get_screenshots_by_time(2, 3.5 - recording.before_screenshot_offset, "before")
+    assert pinned_slots(session) == []
+
+
+def test_unsaved_pins_expire(session, monkeypatch):
+    session._store_frame(make_frame(1.0, 1))
+    session._pin_frames_before(1.5)
+    assert pinned_slots(session)
+
+    monkeypatch.setattr(recording, "FRAME_PIN_MAX_SECONDS", 0.0)
+    session._store_frame(make_frame(2.0, 2))
+    assert pinned_slots(session) == []
+    assert session.frame_pins == {}
+
+
+def test_identical_frames_shared_between_actions_are_released(session):
+    # on a static screen the "after" frame of one action is the "before" frame of the next
+    timestamp = 1.0
+    session._store_frame(make_frame(timestamp, 0))
+    for action in range(1, 11):
+        timestamp += 1.0
+        event_time = timestamp
+        session._pin_frames_before(event_time)
+        for _ in range(3):
+            timestamp += 0.1
+            session._store_frame(make_frame(timestamp, action))
+
+        session._get_screenshots_by_time(2, event_time - recording.before_screenshot_offset, "before")
+        session._get_screenshots_by_time(2, event_time, "after")
+
+    assert session.duplicate_frames == 20
+    assert session.frame_buffer.dropped == 0
+    assert pinned_slots(session) == []
+
+
+def test_after_frames_stay_until_the_action_is_sent(session):
+    session._store_frame(make_frame(1.0, 0))
+    session._pin_frames_before(1.5)
+    session._pin_frames_after(1.5)
+    # the ring wraps several times before the sender runs
+    for i in range(1, 11):
+        session._store_frame(make_frame(1.5 + i / 10, i))
+
+    after = session.frame_index.after(1.5, 2)
+    assert [session.frame_buffer.read(seq).raw[0] for seq in after] == [1, 2]
+
+    session._get_screenshots_by_time(2, 1.5 - recording.before_screenshot_offset, "before")
+    assert len(session._get_screenshots_by_time(2, 1.5, "after")) == 2
+    assert session.after_frames == {}
+    assert pinned_slots(session) == []
+
+
+def test_cancelled_after_frames_are_unpinned(session):
+    session._store_frame(make_frame(1.0, 0))
+    session._pin_frames_after(1.0)
+    session._store_frame(make_frame(2.0, 1))
+    assert pinned_slots(session)
+
+    session._close_frames_after(1.0, unpin=True)
+    assert session.after_frames == {}
+    assert pinned_slots(session) == []
+
+
+def test_scaled_sessions_only_encode_the_scaled_copy(session, monkeypatch):
+    encoded = []
+
+    def submit_encode(workers, frame, variants):
+        encoded.append([variant[0] for variant in variants])
+        future = Future()
+        future.set_result(recording.encode_variants(frame, variants))
+        return future
+
+    monkeypatch.setattr(recording, "submit_encode", submit_encode)
+    session.image_variants = ImageVariantsModel(mode="scaled", max_edge=4, format="jpeg")
+    session._store_frame(make_frame(1.0, 1, width=8, height=4))
+    seq = session.frame_index.before(1.5, 1)[0]
+
+    path = session._save_frame_as_png(seq)
+    assert path.endswith(".jpeg")
+    assert encoded == [["jpeg"]]
+    assert session._encode_state_images([path])[0].startswith("data:image/jpeg")
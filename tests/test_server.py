@@ -1,6 +1,9 @@
+import time
+
 from httpx import AsyncClient
 from unittest.mock import patch
 import pytest
+from agentd import server
 from agentd.server import app
 from agentd.recording import RecordingSession
 
@@ -62,20 +65,13 @@ async def test_system_usage():
 
 @pytest.mark.asyncio
 async def test_open_url():
-    with patch("agentd.server.is_chromium_running", return_value=False), patch(
-        "agentd.server.gracefully_terminate_chromium"
-    ) as mock_terminate, patch(
-        "agentd.server.is_chromium_window_open", return_value=True
-    ), patch(
-        "agentd.server.subprocess.Popen"
-    ) as mock_popen:
+    with patch("agentd.server.browser.open_url", return_value="firefox-tab") as mock_open:
         async with AsyncClient(app=app, base_url="http://test") as ac:
-            response = await ac.post("/open_url", json={"url": "http://example.com"})
+            response = await ac.post("/v1/open_url", json={"url": "http://example.com"})
 
         assert response.status_code == 200
         assert response.json() == {"status": "success"}
-        mock_terminate.assert_not_called()
-        mock_popen.assert_called_once()
+        mock_open.assert_called_once_with("http://example.com", ":1.0")
 
 
 @pytest.mark.asyncio
@@ -133,13 +129,13 @@ async def test_scroll():
 
 @pytest.mark.asyncio
 async def test_drag_mouse():
-    with patch("agentd.server.pyautogui.dragTo") as mock_dragTo:
+    with patch("agentd.actions.get_input") as mock_input:
         async with AsyncClient(app=app, base_url="http://test") as ac:
             response = await ac.post("/drag_mouse", json={"x": 300, "y": 400})
 
         assert response.status_code == 200
         assert response.json() == {"status": "success"}
-        mock_dragTo.assert_called_once_with(300, 400)
+        mock_input.return_value.drag_to.assert_called_once_with(300, 400)
 
 
 @pytest.mark.asyncio
@@ -153,6 +149,13 @@ async def test_take_screenshot():
     assert "file_path" in response.json()
 
 
+@pytest.mark.asyncio
+async def test_take_screenshot_rejects_unknown_format():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/v1/screenshot", params={"format": "gif"})
+    assert response.status_code == 400
+
+
 @pytest.fixture
 def mocker():
     from unittest.mock import MagicMock
@@ -215,3 +218,143 @@ async def test_recording_workflow(mocker):
         response_get_actions = await ac.get(f"/recordings/{session_id}/actions")
         assert response_get_actions.status_code == 200
         assert "actions" in response_get_actions.json()
+
+
+@pytest.mark.asyncio
+async def test_take_screenshot_binary():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post("/v1/screenshot/binary", params={"format": "jpeg"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "x-capture-timestamps" in response.headers
+
+
+@pytest.mark.asyncio
+async def test_actions_rejects_unknown_action():
+    async with AsyncClient(app=app, base_url="http://test") as ac:
+        response = await ac.post(
+            "/v1/actions", json={"actions": [{"name": "teleport", "parameters": {}}]}
+        )
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_actions_stop_at_first_failure():
+    with patch("agentd.actions.get_input") as mock_input:
+        mock_input.return_value.press.side_effect = Exception("no such key")
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/v1/actions",
+                json={
+                    "actions": [
+                        {"name": "drag_mouse", "parameters": {"x": 300, "y": 400}},
+                        {"name": "press_key", "parameters": {"key": "nope"}},
+                        {"name": "scroll", "parameters": {"clicks": 3}},
+                    ],
+                    "delay": 0.01,
+                },
+            )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["status"] == "error"
+    assert [r["status"] for r in body["results"]] == ["success", "error"]
+    mock_input.return_value.drag_to.assert_called_once_with(300, 400)
+    mock_input.return_value.scroll.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_type_text_fast_mode():
+    with patch("agentd.actions.get_input") as mock_input:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/v1/type_text", json={"text": "héllo world", "mode": "fast"}
+            )
+            rejected = await ac.post(
+                "/v1/type_text", json={"text": "bell\x07", "mode": "fast"}
+            )
+
+    assert response.status_code == 200
+    mock_input.return_value.write.assert_called_once_with("héllo world")
+    assert rejected.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_health_responds_while_input_runs():
+    import asyncio
+    import time
+
+    with patch("agentd.actions.get_input") as mock_input:
+        mock_input.return_value.write.side_effect = lambda *args, **kwargs: time.sleep(0.5)
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            typing = asyncio.ensure_future(
+                ac.post("/v1/type_text", json={"text": "slow", "mode": "fast"})
+            )
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            response = await ac.get("/health")
+            assert time.perf_counter() - started < 0.25
+            assert not typing.done()
+            assert (await typing).status_code == 200
+    assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_click_observe():
+    with patch("agentd.actions.get_input") as mock_input:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post(
+                "/v1/click", json={"button": "left", "observe": {"format": "jpeg"}}
+            )
+            rejected = await ac.post(
+                "/v1/click", json={"observe": {"format": "gif"}}
+            )
+
+    assert response.status_code == 200
+    observation = response.json()["observation"]
+    assert observation["format"] == "jpeg"
+    assert observation["after_timestamp"] >= observation["before_timestamp"]
+    mock_input.return_value.click.assert_called_once_with(button="left")
+    # invalid options are rejected before the click happens
+    assert rejected.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_observe_before_frame_follows_queued_input():
+    calls = []
+    grab_screen = server.grab_screen
+
+    def grab(*args):
+        calls.append("grab")
+        return grab_screen(*args)
+
+    # input queued ahead of the action is sent before the "before" frame is taken
+    server.input_executor.submit(lambda: (time.sleep(0.2), calls.append("queued")))
+    with patch("agentd.actions.get_input"), patch("agentd.server.grab_screen", grab):
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            response = await ac.post("/v1/click", json={"observe": {}})
+
+    assert response.status_code == 200
+    assert calls[:2] == ["queued", "grab"]
+
+
+@pytest.mark.asyncio
+async def test_actions_are_validated_before_any_runs():
+    with patch("agentd.actions.get_input") as mock_input:
+        async with AsyncClient(app=app, base_url="http://test") as ac:
+            for invalid in (
+                {"name": "type_text", "parameters": {"text": "hi", "mode": "telepathy"}},
+                {"name": "type_text", "parameters": {"text": "a\x07", "mode": "fast"}},
+                {"name": "press_key", "parameters": {"key": "enter", "observe": {}}},
+            ):
+                response = await ac.post(
+                    "/v1/actions",
+                    json={
+                        "actions": [
+                            {"name": "scroll", "parameters": {"clicks": 3}},
+                            invalid,
+                        ]
+                    },
+                )
+                assert response.status_code == 400
+    mock_input.return_value.scroll.assert_not_called()
@@ -0,0 +1,76 @@
+import pytest
+
+from agentd.shells import SessionLimitError, ShellSession, ShellSessionManager
+
+
+def read_until(session, offset, text, timeout=5.0):
+    output = ""
+    while text not in output:
+        data, _, offset, _ = session.read(offset, wait=timeout)
+        assert data, f"no output, got {output!r}"
+        output += data
+    return output, offset
+
+
+def test_state_carries_over_between_commands():
+    session = ShellSession(command="/bin/sh")
+    try:
+        session.write("cd /tmp && export GREETING=hello\n")
+        session.write("pwd; echo $GREETING-$((1 + 1))\n")
+        output, offset = read_until(session, 0, "hello-2")
+        assert "/tmp" in output
+
+        # reading from the returned offset only gives what is new
+        session.write("echo next-$((2 + 1))\n")
+        output, _ = read_until(session, offset, "next-3")
+        assert "hello-2" not in output
+    finally:
+        session.close()
+    assert session.exited
+
+
+def test_dropped_output_is_reported():
+    session = ShellSession(command="/bin/sh", buffer_size=64)
+    try:
+        session.write("printf '%0200d' 0; echo; echo $((40 + 2))\n")
+        # the terminal echoes the command, wait for its output
+        read_until(session, 0, "42\r\n")
+        data, start, _, truncated = session.read(0)
+        assert truncated
+        assert start > 0
+        assert len(data.encode()) <= 64
+    finally:
+        session.close()
+
+
+def test_session_limit_and_idle_timeout():
+    manager = ShellSessionManager(max_sessions=1, idle_timeout=0.0)
+    try:
+        session = manager.create(command="/bin/sh")
+        manager.reap()
+        # idle sessions are closed and make room
+        with pytest.raises(LookupError):
+            manager.get(session.id)
+        assert session.exited
+
+        manager.idle_timeout = 3600
+        manager.create(command="/bin/sh")
+        with pytest.raises(SessionLimitError):
+            manager.create(command="/bin/sh")
+    finally:
+        manager.close_all()
+
+
+def test_command_arguments_and_exited_sessions():
+    manager = ShellSessionManager(max_sessions=1)
+    try:
+        session = manager.create(command="/bin/sh -c 'echo $((6 * 7))'")
+        read_until(session, 0, "42")
+        session.process.wait(5)
+
+        # the exited session does not count toward the limit
+        manager.create(command="/bin/sh")
+        with pytest.raises(LookupError):
+            manager.get(session.id)
+    finally:
+        manager.close_all()
@@ -0,0 +1,74 @@
+import os
+import time
+
+from agentd.storage import StorageManager, prune_directory
+
+
+def write_file(path, size):
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    return str(path)
+
+
+def test_session_quota_evicts_oldest_unreferenced_files(tmp_path):
+    evicted = []
+    referenced = set()
+    storage = StorageManager(session_quota=250, global_quota=10_000, min_age=0)
+    storage.add_session("s", on_evict=evicted.append, is_referenced=referenced.__contains__)
+
+    first = write_file(tmp_path / "a.png", 100)
+    second = write_file(tmp_path / "b.png", 100)
+    referenced.add(first)
+    storage.add_file("s", first)
+    storage.add_file("s", second)
+    storage.add_file("s", write_file(tmp_path / "c.png", 100))
+    storage.flush(2)
+
+    # a.png is the oldest but still referenced, so b.png goes
+    assert evicted == [second]
+    assert storage.session_size("s") == 200
+    assert not os.path.exists(second)
+    assert os.path.exists(first)
+
+
+def test_touch_moves_files_to_the_back(tmp_path):
+    evicted = []
+    storage = StorageManager(session_quota=10_000, global_quota=250, min_age=0)
+    storage.add_session("s", on_evict=evicted.append, is_referenced=lambda path: False)
+
+    first = write_file(tmp_path / "a.png", 100)
+    second = write_file(tmp_path / "b.png", 100)
+    storage.add_file("s", first)
+    storage.add_file("s", second)
+    storage.touch([first])
+    storage.add_file("s", write_file(tmp_path / "c.png", 100))
+
+    assert evicted == [second]
+
+
+def test_remove_session_deletes_directory_in_background(tmp_path):
+    session_dir = tmp_path / "session"
+    session_dir.mkdir()
+    storage = StorageManager(session_quota=1000, global_quota=1000)
+    storage.add_session("s", on_evict=lambda path: None, is_referenced=lambda path: False)
+    storage.add_file("s", write_file(session_dir / "a.png", 100))
+
+    storage.remove_session("s", str(session_dir))
+    assert not session_dir.exists()
+    storage.flush(2)
+    assert list(tmp_path.iterdir()) == []
+    assert storage.size == 0
+
+
+def test_prune_directory_by_age_and_size(tmp_path):
+    now = time.time()
+    paths = []
+    for i, age in enumerate([300, 200, 100, 0]):
+        path = write_file(tmp_path / f"{i}.mp4", 100)
+        os.utime(path, (now - age, now - age))
+        paths.append(path)
+
+    assert prune_directory(str(tmp_path), max_age=250, now=now) == [paths[0]]
+    assert prune_directory(
+        str(tmp_path), max_age=250, max_bytes=150, exclude=[paths[1]], now=now
+    ) == [paths[0], paths[2]]
@@ -0,0 +1,65 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from agentd.stream import ScreenStream
+
+from .conftest import make_frame
+
+
+class FakeLiveCapture:
+    def __init__(self):
+        self.callbacks = {}
+
+    def subscribe(self, on_frame, interval):
+        self.callbacks[len(self.callbacks)] = on_frame
+        return len(self.callbacks) - 1
+
+    def unsubscribe(self, subscription):
+        self.callbacks.pop(subscription)
+
+    def push(self, frame, changed=True):
+        for on_frame in list(self.callbacks.values()):
+            on_frame(frame, changed)
+
+
+@pytest.mark.asyncio
+async def test_stream_sends_only_the_latest_changed_frame():
+    live = FakeLiveCapture()
+    stream = ScreenStream(live)
+
+    async with aclosing(stream.frames(0.01, format="png")) as frames:
+        first = asyncio.ensure_future(frames.__anext__())
+        await asyncio.sleep(0)
+        live.push(make_frame(1.0))
+        frame, image = await first
+        assert frame.timestamp == 1.0
+        assert image.startswith(b"\x89PNG")
+
+        # an unchanged frame is not sent, of two changed ones only the newest is
+        live.push(make_frame(2.0), changed=False)
+        live.push(make_frame(3.0, value=1))
+        live.push(make_frame(4.0, value=2))
+        await asyncio.sleep(0)
+        frame, _ = await frames.__anext__()
+        assert frame.timestamp == 4.0
+
+    assert live.callbacks == {}
+
+
+@pytest.mark.asyncio
+async def test_subscribers_share_encodes():
+    live = FakeLiveCapture()
+    stream = ScreenStream(live)
+
+    async with aclosing(stream.frames(0.01, format="png")) as a, aclosing(
+        stream.frames(0.01, format="png")
+    ) as b:
+        pending = [asyncio.ensure_future(a.__anext__()), asyncio.ensure_future(b.__anext__())]
+        await asyncio.sleep(0)
+        live.push(make_frame(1.0))
+        (_, first), (_, second) = await asyncio.gather(*pending)
+
+    assert first is second
+    assert len(stream._encodes) == 1
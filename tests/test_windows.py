@@ -0,0 +1,129 @@
+import threading
+from types import SimpleNamespace
+
+from Xlib import X
+
+from agentd.windows import WindowTracker
+
+ATOMS = {
+    "_NET_CLIENT_LIST": 1,
+    "_NET_ACTIVE_WINDOW": 2,
+    "_NET_WM_NAME": 3,
+    "_NET_WM_PID": 4,
+    "UTF8_STRING": 5,
+    "WM_NAME": 6,
+    "WM_CLASS": 7,
+}
+ROOT = 1000
+
+
+class FakeWindow:
+    def __init__(self, server, window_id):
+        self.server = server
+        self.id = window_id
+
+    def get_full_property(self, atom, type):
+        value = self.server.properties.get((self.id, atom))
+        return SimpleNamespace(value=value) if value is not None else None
+
+    def change_attributes(self, event_mask):
+        pass
+
+    def get_wm_class(self):
+        return self.server.classes.get(self.id)
+
+    def get_wm_name(self):
+        return ""
+
+    def get_attributes(self):
+        return SimpleNamespace(map_state=X.IsViewable)
+
+    def get_geometry(self):
+        return SimpleNamespace(width=640, height=480)
+
+    def query_tree(self):
+        # every client is reparented into a frame with id + 500
+        parent = ROOT if self.id > 500 else self.id + 500
+        return SimpleNamespace(parent=FakeWindow(self.server, parent))
+
+    def translate_coords(self, window, x, y):
+        return SimpleNamespace(x=self.server.positions.get(window.id, 0), y=0)
+
+
+class FakeDisplay:
+    def __init__(self):
+        self.properties = {}
+        self.classes = {}
+        self.positions = {}
+        self.root = FakeWindow(self, ROOT)
+
+    def screen(self):
+        return SimpleNamespace(root=self.root)
+
+    def create_resource_object(self, kind, window_id):
+        return FakeWindow(self, window_id)
+
+
+def make_tracker():
+    tracker = WindowTracker()
+    tracker._atoms = ATOMS
+    return tracker
+
+
+def property_event(window_id, atom):
+    return SimpleNamespace(
+        type=X.PropertyNotify, window=SimpleNamespace(id=window_id), atom=atom
+    )
+
+
+def test_tracker_follows_the_client_list():
+    d = FakeDisplay()
+    tracker = make_tracker()
+    d.properties[(ROOT, ATOMS["_NET_CLIENT_LIST"])] = [10, 20]
+    d.properties[(10, ATOMS["_NET_WM_NAME"])] = b"Mozilla Firefox"
+    d.properties[(10, ATOMS["_NET_WM_PID"])] = [4242]
+    d.classes[10] = ("Navigator", "firefox")
+    d.classes[20] = ("xterm", "XTerm")
+    tracker._sync_clients(d)
+
+    [firefox] = tracker.find("firefox")
+    assert firefox.id == 10
+    assert firefox.title == "Mozilla Firefox"
+    assert firefox.pid == 4242
+    assert firefox.frame == 510
+
+    d.properties[(ROOT, ATOMS["_NET_CLIENT_LIST"])] = [20]
+    tracker._handle(d, property_event(ROOT, ATOMS["_NET_CLIENT_LIST"]))
+    assert tracker.find("firefox") == []
+    assert [info.id for info in tracker.windows()] == [20]
+
+
+def test_frame_moves_update_the_client_geometry():
+    d = FakeDisplay()
+    tracker = make_tracker()
+    d.properties[(ROOT, ATOMS["_NET_CLIENT_LIST"])] = [10]
+    tracker._sync_clients(d)
+    assert tracker.get(10).region == (0, 0, 640, 480)
+
+    d.positions[10] = 300
+    tracker._handle(
+        d, SimpleNamespace(type=X.ConfigureNotify, window=SimpleNamespace(id=510))
+    )
+    assert tracker.get(10).region == (300, 0, 640, 480)
+
+
+def test_wait_for_wakes_up_on_changes():
+    d = FakeDisplay()
+    tracker = make_tracker()
+    d.classes[10] = ("Navigator", "firefox")
+
+    def open_window():
+        d.properties[(ROOT, ATOMS["_NET_CLIENT_LIST"])] = [10]
+        tracker._handle(d, property_event(ROOT, ATOMS["_NET_CLIENT_LIST"]))
+
+    threading.Timer(0.05, open_window).start()
+    found = tracker.wait_for(
+        lambda windows: [w.id for w in windows if w.matches("firefox")], timeout=2
+    )
+    assert found == [10]
+    assert tracker.wait_for(lambda windows: None, timeout=0.01) is None
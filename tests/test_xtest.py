@@ -0,0 +1,122 @@
+from unittest.mock import patch
+
+import pytest
+from Xlib import XK, X
+
+from agentd.xtest import XTestInput, get_input, key_keysym, set_input_display
+
+
+class FakeInfo:
+    min_keycode = 8
+    max_keycode = 12
+
+
+class FakeDisplay:
+    """A display with a tiny layout: a/A on 9, shift on 10, return on 11, 12 unused."""
+
+    def __init__(self, *args):
+        self.display = type("D", (), {"info": FakeInfo})()
+        self.mapping = {
+            8: (0, 0),
+            9: (XK.XK_a, XK.XK_A),
+            10: (XK.XK_Shift_L, 0),
+            11: (XK.XK_Return, 0),
+            12: (0, 0),
+        }
+        self.syncs = 0
+        self.bindings = []
+
+    def get_keyboard_mapping(self, first, count):
+        return [self.mapping[first + i] for i in range(count)]
+
+    def change_keyboard_mapping(self, keycode, keysyms):
+        self.mapping[keycode] = keysyms[0]
+        self.bindings.append((keycode, keysyms[0][0]))
+
+    def sync(self):
+        self.syncs += 1
+
+
+@pytest.fixture
+def events():
+    sent = []
+    with patch("agentd.xtest.xdisplay.Display", FakeDisplay), patch(
+        "agentd.xtest.xtest.fake_input",
+        side_effect=lambda d, event, detail=0, **kwargs: sent.append((event, detail)),
+    ):
+        yield sent
+
+
+def test_key_names_resolve_to_keysyms():
+    assert key_keysym("enter") == XK.XK_Return
+    assert key_keysym("\n") == XK.XK_Return
+    assert key_keysym("pagedown") == XK.XK_Next
+    assert key_keysym("F5") == XK.XK_F5
+    assert key_keysym("num0") == XK.XK_KP_0
+    assert key_keysym("add") == XK.XK_KP_Add
+    assert key_keysym("volumeup") == XK.string_to_keysym("XF86_AudioRaiseVolume") != 0
+    with pytest.raises(ValueError):
+        key_keysym("nosuchkey")
+
+
+def test_write_uses_layout_and_shift(events):
+    XTestInput(pause=0).write("aA\n")
+    assert events == [
+        (X.KeyPress, 9),
+        (X.KeyRelease, 9),
+        (X.KeyPress, 10),
+        (X.KeyPress, 9),
+        (X.KeyRelease, 9),
+        (X.KeyRelease, 10),
+        (X.KeyPress, 11),
+        (X.KeyRelease, 11),
+    ]
+
+
+def test_unmapped_characters_use_the_spare_keycode(events):
+    backend = XTestInput(pause=0)
+    backend.write("é")
+    assert events == [(X.KeyPress, 12), (X.KeyRelease, 12)]
+    assert backend._display.bindings == [(12, XK.XK_eacute), (12, X.NoSymbol)]
+    # the spare keycode is unbound again
+    assert backend._display.mapping[12] == (0, 0)
+
+
+def test_unmapped_characters_rotate_through_spare_keycodes(events, monkeypatch):
+    monkeypatch.setattr("agentd.xtest.REMAP_DELAY_SECONDS", 0)
+    backend = XTestInput(pause=0)
+    # keycodes 12 and 8 are spare, the third character rebinds the least recently used
+    backend.write("aééüß")
+    assert [keycode for event, keycode in events if event == X.KeyPress] == [9, 12, 12, 8, 12]
+    assert backend._display.bindings == [
+        (12, XK.XK_eacute),
+        (8, XK.XK_udiaeresis),
+        (12, XK.XK_ssharp),
+        (8, X.NoSymbol),
+        (12, X.NoSymbol),
+    ]
+
+
+def test_hotkey_releases_in_reverse_order(events):
+    XTestInput(pause=0).hotkey("shift", "a")
+    assert events == [
+        (X.KeyPress, 10),
+        (X.KeyPress, 9),
+        (X.KeyRelease, 9),
+        (X.KeyRelease, 10),
+    ]
+
+
+def test_write_rejects_control_characters_before_typing(events):
+    with pytest.raises(ValueError):
+        XTestInput(pause=0).write("a\x07")
+    assert events == []
+
+
+def test_shared_input_uses_the_configured_display():
+    set_input_display(":1.0")
+    try:
+        assert get_input().display_name == ":1.0"
+    finally:
+        set_input_display(None)
+    assert get_input().display_name is None